@@ -0,0 +1,65 @@
+"""Microbenchmark of keeping only the fields of the output format in a record.
+
+Compares the former in-place deletion (`utils.clean_output`) with the compiled projection and
+the slotted records that replace it. Run from the repository root:
+
+    python -m benchmarks.bench_projection
+"""
+
+import timeit
+
+from wrapper import utils
+from wrapper.output_format import OUTPUT_FORMAT
+from wrapper.record import Record
+
+# A formatted Scopus entry before the undefined fields are dropped.
+ENTRY = {
+    "@_fa": "true", "link": [{"@ref": "self", "@href": "https://api.elsevier.com/x"}] * 4,
+    "prism:url": "https://api.elsevier.com/content/abstract/scopus_id/1",
+    "dc:identifier": "SCOPUS_ID:1", "eid": "2-s2.0-1", "dc:title": "A title",
+    "dc:creator": "Author A.", "prism:publicationName": "A journal", "prism:issn": "12345678",
+    "prism:volume": "1", "prism:issueIdentifier": "2", "prism:pageRange": "1-10",
+    "prism:coverDate": "2020-01-01", "prism:coverDisplayDate": "1 January 2020",
+    "prism:doi": "10.1/1", "citedby-count": "3", "affiliation": [{"affilname": "A"}],
+    "prism:aggregationType": "Journal", "subtype": "ar", "subtypeDescription": "Article",
+    "source-id": "1", "openaccess": "0", "openaccessFlag": False,
+    "contentType": "Article", "title": "A title", "authors": ["Author A."],
+    "publicationName": "A journal", "openAccess": "0", "doi": "10.1/1",
+    "publisher": "Elsevier", "publicationDate": "2020-01-01", "publicationType": "Journal",
+    "issn": "12345678", "volume": "1", "pages": {"first": "1", "last": "10"},
+    "uri": "https://www.scopus.com/x", "countries": ["DE"],
+}
+
+RECORD_FORMAT = OUTPUT_FORMAT["records"][0]
+project_record = utils.compile_projection(RECORD_FORMAT)
+
+def clean_output(out: dict, format_dict: dict):
+    """The former utils.clean_output."""
+    for key in list(out.keys()):
+        if key not in format_dict.keys():
+            del out[key]
+
+def delete_in_place():
+    # the entry is copied, because the deletion modifies it
+    entry = dict(ENTRY)
+    clean_output(entry, RECORD_FORMAT)
+    return entry
+
+def projection():
+    entry = dict(ENTRY)
+    return project_record(entry)
+
+def slotted_record():
+    entry = dict(ENTRY)
+    return Record.from_dict(entry)
+
+def main(number: int = 200000):
+    assert delete_in_place() == projection() == slotted_record()
+
+    copy_time = min(timeit.repeat(lambda: dict(ENTRY), number=number, repeat=5))
+    for func in [delete_in_place, projection, slotted_record]:
+        best = min(timeit.repeat(func, number=number, repeat=5)) - copy_time
+        print(f"{func.__name__:16} {best / number * 1e9:8.0f} ns per record")
+
+if __name__ == "__main__":
+    main()
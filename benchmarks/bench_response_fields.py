@@ -0,0 +1,126 @@
+"""Benchmark of requesting only the formatted fields of Scopus entries (`field=`).
+
+Compares a page of Scopus entries in the default STANDARD view with the same page restricted to
+ElsevierWrapper.response_fields: the size of the body and the time to parse its entries with
+streaming.iter_items, as format_response does. Formatting is left out, it costs the same for both
+pages. The pages are fixtures shaped like the responses of the Scopus Search API, no API is
+called. Run from the repository root:
+
+    python -m benchmarks.bench_response_fields
+"""
+
+import io
+import json
+import timeit
+
+import requests
+from urllib3 import HTTPResponse
+
+from wrapper import streaming
+from wrapper.elsevier_wrapper import ElsevierWrapper
+
+# An entry of the STANDARD view, see https://dev.elsevier.com/sc_search_views.html
+FULL_ENTRY = {
+    "@_fa": "true",
+    "link": [
+        {"@_fa": "true", "@ref": "self",
+         "@href": "https://api.elsevier.com/content/abstract/scopus_id/85000000000"},
+        {"@_fa": "true", "@ref": "author-affiliation",
+         "@href": "https://api.elsevier.com/content/abstract/scopus_id/85000000000"
+                  "?field=author,affiliation"},
+        {"@_fa": "true", "@ref": "scopus",
+         "@href": "https://www.scopus.com/inward/record.uri"
+                  "?partnerID=HzOxMe3b&scp=85000000000&origin=inward"},
+        {"@_fa": "true", "@ref": "scopus-citedby",
+         "@href": "https://www.scopus.com/inward/citedby.uri"
+                  "?partnerID=HzOxMe3b&scp=85000000000&origin=inward"},
+    ],
+    "prism:url": "https://api.elsevier.com/content/abstract/scopus_id/85000000000",
+    "dc:identifier": "SCOPUS_ID:85000000000",
+    "eid": "2-s2.0-85000000000",
+    "dc:title": "A study of distributed ledgers for supply chain traceability",
+    "dc:creator": "Author A.",
+    "prism:publicationName": "Journal of Distributed Systems",
+    "prism:issn": "12345678",
+    "prism:eIssn": "87654321",
+    "prism:volume": "12",
+    "prism:issueIdentifier": "3",
+    "prism:pageRange": "101-120",
+    "prism:coverDate": "2020-01-01",
+    "prism:coverDisplayDate": "1 January 2020",
+    "prism:doi": "10.1000/85000000000",
+    "pii": "S0000000000000000",
+    "citedby-count": "42",
+    "affiliation": [
+        {"@_fa": "true", "affilname": "Technical University of Somewhere",
+         "affiliation-city": "Somewhere", "affiliation-country": "Germany"},
+        {"@_fa": "true", "affilname": "University of Elsewhere",
+         "affiliation-city": "Elsewhere", "affiliation-country": "United States"},
+    ],
+    "prism:aggregationType": "Journal",
+    "subtype": "ar",
+    "subtypeDescription": "Article",
+    "source-id": "12345",
+    "openaccess": "1",
+    "openaccessFlag": True,
+    "freetoread": {"value": [{"$": "all"}, {"$": "publisherfullgold"}]},
+    "freetoreadLabel": {"value": [{"$": "All Open Access"}, {"$": "Gold"}]},
+}
+
+def trimmed_entry(entry: dict, fields: [str]) -> dict:
+    """Return an entry like Scopus returns it for a request with `field=`."""
+    trimmed = {"@_fa": entry["@_fa"]}
+    trimmed.update({key: value for key, value in entry.items() if key in fields})
+    # The nested fields are requested by their own names.
+    trimmed["affiliation"] = [
+        {"@_fa": "true", **{key: value for key, value in affiliation.items() if key in fields}}
+        for affiliation in entry["affiliation"]
+    ]
+    return trimmed
+
+def page(entry: dict, num_entries: int = 25) -> bytes:
+    """Return the body of a page of entries."""
+    return json.dumps({
+        "search-results": {
+            "opensearch:totalResults": "1000",
+            "opensearch:startIndex": "0",
+            "opensearch:itemsPerPage": str(num_entries),
+            "opensearch:Query": {"@role": "request", "@searchTerms": "TITLE(blockchain)"},
+            "link": [{"@_fa": "true", "@ref": "self", "@href": "https://api.elsevier.com/x"}],
+            "entry": [dict(entry, **{"prism:doi": f"10.1000/{i}"}) for i in range(num_entries)],
+        }
+    }).encode()
+
+def response(body: bytes, stream: bool) -> requests.Response:
+    """Return a response like call_api returns it."""
+    response = requests.Response()
+    response.status_code = 200
+    if stream:
+        response.raw = HTTPResponse(body=io.BytesIO(body), preload_content=False, status=200)
+    else:
+        response._content = body
+    return response
+
+def main(number: int = 500):
+    wrapper = ElsevierWrapper("bench_key")
+    bodies = {
+        "full": page(FULL_ENTRY),
+        "field=": page(trimmed_entry(FULL_ENTRY, wrapper.response_fields)),
+    }
+
+    def parse_page(body: bytes, stream: bool) -> list:
+        return list(streaming.iter_items(response(body, stream), "search-results.entry", {}))
+
+    # Both pages are formatted to the same records.
+    assert wrapper.format_record(dict(FULL_ENTRY)) \
+        == wrapper.format_record(trimmed_entry(FULL_ENTRY, wrapper.response_fields))
+
+    for stream in [False] + ([True] if streaming.ENABLED else []):
+        # bodies without a Content-Length are streamed, see streaming.MIN_SIZE
+        print("streamed" if stream else "parsed at once")
+        for name, body in bodies.items():
+            best = min(timeit.repeat(lambda: parse_page(body, stream), number=number, repeat=5))
+            print(f"  {name:8} {len(body):8} bytes {best / number * 1e6:8.0f} µs per page")
+
+if __name__ == "__main__":
+    main()
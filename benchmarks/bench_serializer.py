@@ -0,0 +1,76 @@
+"""Benchmark of serialising response bodies of the handlers.
+
+The payloads are built like connector.get_persisted_results and connector.get_reviews build
+theirs, from model instances converted with Result.to_dict() (which decompresses the abstract
+and copyright) and to_son().to_dict(), without a database. Run from the repository root:
+
+    python -m benchmarks.bench_serializer
+"""
+
+import datetime
+import json
+import timeit
+
+from bson import ObjectId, json_util
+
+from functions import serializer
+from functions.db.models import Query, Result, Review, Score, Search, SearchGroup, User
+
+ABSTRACT = "Blockchain technology promises decentralised trust. " * 30
+
+def persisted_results(num_results: int = 200) -> dict:
+    """Return a page like connector.get_persisted_results."""
+    user = User(username="alice")
+    results = [
+        Result(
+            doi=f"10.1000/{i}", persisted=True, contentType="Article",
+            title=f"A study of distributed ledgers, part {i}",
+            authors=["Author A.", "Author B.", "Author C."], publicationName="A journal",
+            openAccess=bool(i % 2), publisher="Springer", publicationDate="2020-01-01",
+            publicationType="Journal", issn="1234-5678", volume="12", number="3",
+            genre=["OriginalPaper"], pages=["1", "10"], journalId="12345",
+            copyright="©2020 The Authors", abstract=ABSTRACT, uri=f"https://doi.org/10.1000/{i}",
+            countries=["DE", "US"], scores=[Score(user=user, score=1, comment="relevant")],
+        )
+        for i in range(num_results)
+    ]
+    return {
+        "results": [result.to_dict() for result in results],
+        "total_results": 1000,
+    }
+
+def reviews(num_reviews: int = 50) -> list:
+    """Return a list like connector.get_reviews, with ObjectIds and datetimes."""
+    search = Search(
+        search_groups=[SearchGroup(search_terms=["blockchain", "ledger"], match="OR")],
+        match="AND", fields=["title"],
+    )
+    return [
+        Review(
+            _id=ObjectId(), name=f"Review {i}", owner=User(username="alice"),
+            collaborators=["bob"], result_collection=f"results-{i}",
+            date_created=datetime.datetime(2020, 7, 25, 12, 30), description="A review",
+            queries=[
+                Query(_id=ObjectId(), time="2020-07-25", results=[f"10.1000/{j}" for j in range(50)],
+                      search=search)
+                for _ in range(3)
+            ],
+        ).to_son().to_dict()
+        for i in range(num_reviews)
+    ]
+
+def main(number: int = 50):
+    payloads = {"get_persisted_results": persisted_results(), "get_reviews": reviews()}
+    serializers = {
+        "json + json_util": lambda body: json.dumps(body, default=json_util.default),
+        **serializer.SERIALIZERS,
+    }
+
+    for payload_name, payload in payloads.items():
+        print(payload_name)
+        for name, dumps in serializers.items():
+            best = min(timeit.repeat(lambda: dumps(payload), number=number, repeat=5))
+            print(f"    {name:18} {best / number * 1e3:7.2f} ms")
+
+if __name__ == "__main__":
+    main()
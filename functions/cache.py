@@ -0,0 +1,82 @@
+"""In-process cache of query results.
+
+The cache lives as long as the process, i.e. the warm lambda container or the local server.
+"""
+
+import copy
+import os
+import threading
+import time
+
+# seconds a cached page is served
+TTL = float(os.getenv('RESULT_CACHE_TTL', 300))
+
+# maximum number of cached pages
+MAX_ENTRIES = int(os.getenv('RESULT_CACHE_SIZE', 64))
+
+
+class ResultCache:
+    """Cache with an expiry time that drops the oldest entry when it is full.
+
+    Values are copied when they are put and got, so the callers can modify them.
+    """
+
+    def __init__(self, ttl: float = TTL, max_entries: int = MAX_ENTRIES):
+        """Initialize an empty cache.
+
+        Args:
+            ttl: seconds an entry is kept
+            max_entries: maximum number of entries
+        """
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.entries = dict()
+        self.lock = threading.Lock()
+
+    def __contains__(self, key) -> bool:
+        with self.lock:
+            entry = self.entries.get(key)
+        return entry is not None and entry[0] > time.monotonic()
+
+    def get(self, key):
+        """Get a copy of a cached value.
+
+        Args:
+            key: key of the entry
+
+        Returns:
+            the value or None if it is not cached or expired
+        """
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires <= time.monotonic():
+                del self.entries[key]
+                return None
+        return copy.deepcopy(value)
+
+    def put(self, key, value):
+        """Cache a copy of a value.
+
+        Args:
+            key: key of the entry
+            value: value to cache
+        """
+        value = copy.deepcopy(value)
+        with self.lock:
+            self.entries.pop(key, None)
+            if len(self.entries) >= self.max_entries:
+                # dicts keep insertion order, so this is the oldest one
+                del self.entries[next(iter(self.entries))]
+            self.entries[key] = (time.monotonic() + self.ttl, value)
+
+    def clear(self):
+        """Remove all entries."""
+        with self.lock:
+            self.entries.clear()
+
+
+# pages of dry queries, see slr.conduct_query
+results = ResultCache()
@@ -0,0 +1,101 @@
+"""Compression of the response bodies of the handlers.
+
+The encoding is negotiated from the Accept-Encoding header of the request: brotli (if the
+package is installed) or gzip. Compressed bodies are base64 encoded, which API Gateway decodes
+for the binary media types configured in serverless.yml.
+"""
+
+import base64
+import gzip
+import os
+from typing import Optional
+
+from functions import negotiation
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# bodies with less bytes are not compressed
+MIN_SIZE = int(os.getenv('COMPRESSION_MIN_SIZE', 1024))
+
+# 0 (fastest) - 11 (smallest)
+BROTLI_QUALITY = int(os.getenv('COMPRESSION_BROTLI_QUALITY', 5))
+
+# 1 (fastest) - 9 (smallest)
+GZIP_LEVEL = int(os.getenv('COMPRESSION_GZIP_LEVEL', 6))
+
+# binaryMediaTypes of the API Gateway in serverless.yml
+BINARY_MEDIA_TYPES = ('application/json', 'application/msgpack', 'application/x-msgpack')
+
+
+def compress_brotli(data: bytes) -> bytes:
+    return brotli.compress(data, quality=BROTLI_QUALITY)
+
+
+def compress_gzip(data: bytes) -> bytes:
+    # mtime=0 makes the output independent of the time
+    return gzip.compress(data, compresslevel=GZIP_LEVEL, mtime=0)
+
+
+# the supported encodings in order of preference
+ENCODINGS = {}
+if brotli is not None:
+    ENCODINGS['br'] = compress_brotli
+ENCODINGS['gzip'] = compress_gzip
+
+
+def negotiate(accept_encoding: Optional[str]) -> Optional[str]:
+    """Choose the encoding of a response.
+
+    Args:
+        accept_encoding: value of the Accept-Encoding header, e.g. "gzip, deflate, br;q=0.9"
+
+    Returns:
+        the accepted encoding with the highest quality value, preferring the order of
+        ENCODINGS, or None if no supported encoding is accepted
+    """
+    return negotiation.choose(accept_encoding, ENCODINGS)
+
+
+def decodes_base64(accept: Optional[str]) -> bool:
+    """Check whether API Gateway decodes a base64 encoded response body for a request.
+
+    API Gateway only looks at the first media type of the Accept header. Otherwise the client
+    gets the base64 encoded body.
+
+    Args:
+        accept: value of the Accept header of the request or None
+
+    Returns:
+        whether the first accepted media type is one of BINARY_MEDIA_TYPES
+    """
+    if not accept:
+        return False
+    return accept.split(',')[0].split(';')[0].strip().lower() in BINARY_MEDIA_TYPES
+
+
+def encode_body(body, accept_encoding: Optional[str]) -> (str, dict, bool):
+    """Compress a response body if the client accepts it and the body is large enough.
+
+    Args:
+        body: the serialised body, str or bytes (e.g. MessagePack)
+        accept_encoding: value of the Accept-Encoding header of the request or None
+
+    Returns:
+        the body for the lambda response, additional headers and whether the body is base64
+        encoded. Binary bodies are always base64 encoded.
+    """
+    # caches have to tell the responses for different Accept-Encoding headers apart
+    headers = {'Vary': 'Accept-Encoding'}
+
+    data = body.encode() if isinstance(body, str) else body
+    encoding = negotiate(accept_encoding)
+    if encoding is None or len(data) < MIN_SIZE:
+        if isinstance(body, str):
+            return body, headers, False
+        return base64.b64encode(data).decode(), headers, True
+
+    headers['Content-Encoding'] = encoding
+    return base64.b64encode(ENCODINGS[encoding](data)).decode(), headers, True
@@ -0,0 +1,67 @@
+"""A pymodm field for long texts like abstracts, which are stored compressed.
+
+MongoDB keeps the documents of the working set uncompressed in its cache, so a field that is
+compressed by the application takes less memory there as well as on disk. Texts are compressed
+with zlib and stored as binary data of the subtype COMPRESSED_SUBTYPE. Short texts, which hardly
+compress, and the texts of documents written before the field was compressed are plain strings.
+"""
+
+import os
+import zlib
+
+from bson.binary import Binary
+from pymodm import fields
+
+# user defined binary subtype of compressed texts
+COMPRESSED_SUBTYPE = 0x80
+
+# texts with less bytes are stored as they are
+MIN_SIZE = int(os.getenv('COMPRESSED_FIELD_MIN_SIZE', 256))
+
+# 1 (fastest) - 9 (smallest)
+LEVEL = int(os.getenv('COMPRESSED_FIELD_LEVEL', 6))
+
+
+def compress(text: str):
+    """Compress a text if it is long enough.
+
+    Args:
+        text: the text
+
+    Returns:
+        the compressed text as binary data or the text itself
+    """
+    data = text.encode()
+    if len(data) < MIN_SIZE:
+        return text
+    return Binary(zlib.compress(data, LEVEL), COMPRESSED_SUBTYPE)
+
+
+def decompress(value) -> str:
+    """Decompress a value as stored by `compress`.
+
+    Args:
+        value: compressed binary data or a text
+
+    Returns:
+        the text
+    """
+    if isinstance(value, bytes):
+        return zlib.decompress(value).decode()
+    return value
+
+
+class CompressedTextField(fields.CharField):
+    """A field that stores unicode strings compressed.
+
+    The model attribute is always the text, only the document in MongoDB holds the compressed
+    text. Queries cannot match the content of the field.
+    """
+
+    def to_python(self, value):
+        if isinstance(value, bytes):
+            return decompress(value)
+        return super().to_python(value)
+
+    def to_mongo(self, value):
+        return compress(self.to_python(value))
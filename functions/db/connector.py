@@ -7,11 +7,15 @@ import sys
 from typing import Union
 from bson import ObjectId
 from pymodm import connect
+from pymongo import ReplaceOne, ReturnDocument
+from pymongo.errors import BulkWriteError
 from pymodm.context_managers import switch_collection
 from pymodm.errors import ValidationError
-from datetime import datetime
+from datetime import datetime, timedelta
 
 from functions.db.models import *
+from wrapper import utils as wrapper_utils
+from wrapper.record import FIELDS as RECORD_FIELDS, Record
 
 # Fetch mongo env vars
 db_env = os.getenv('MONGO_DB_ENV')
@@ -71,21 +75,66 @@ def save_results(results: list, review: Review, query: Query):
         results: list of results as defined in wrapper/output_format.py unter 'records'
         query: Query object of associated query
     """
+    requests = []
+    # the last record of each DOI, the facets count the results inserted by this call
+    records_by_doi = dict()
     with switch_collection(Result, query.parent_review.result_collection):
         for result_dict in results:
-            result_dict['_id'] = result_dict.get('doi')
-            result = Result.from_document(result_dict)
+            # records of the wrappers serialise themselves, the ones sent by the front end are dicts
+            if isinstance(result_dict, Record):
+                document = result_dict.to_document()
+            else:
+                document = dict(result_dict, _id=result_dict.get('doi'))
+            result = Result.from_document(document)
             result.persisted = True
             try:
-                result.save()
+                result.full_clean()
             except ValidationError:
                 print(f"Could not persist result {result_dict}")
                 continue
+            # same as result.save(), but all results are written in one round trip
+            requests.append(ReplaceOne({"_id": result.pk}, result.to_son(), upsert=True))
             query.results.append(result.doi)
+            records_by_doi[result.doi] = result_dict
+
+        inserted_dois = upsert_results(Result._mongometa.collection, requests)
+
+    new_results = [records_by_doi[doi] for doi in inserted_dois]
     review.save()
+    update_facets(review, new_results)
     return query
 
 
+# error code of MongoDB for a write that would duplicate a unique key, e.g. an _id
+DUPLICATE_KEY_ERROR = 11000
+
+
+def upsert_results(collection, requests: list) -> set:
+    """Writes results in one round trip and tells which of them were inserted.
+
+    Only results inserted here may change the facets. Reading which results exist before
+    writing is not enough, concurrent saves of the same results would both count them.
+
+    Args:
+        collection: results collection
+        requests: ReplaceOne requests with upsert=True
+
+    Returns:
+        the ids of the inserted results
+    """
+    if not requests:
+        return set()
+    try:
+        return set(collection.bulk_write(requests, ordered=False).upserted_ids.values())
+    except BulkWriteError as e:
+        # A concurrent save inserted the same result first. Replacing it again inserts nothing.
+        errors = e.details.get('writeErrors', [])
+        if any(error.get('code') != DUPLICATE_KEY_ERROR for error in errors):
+            raise
+        collection.bulk_write([requests[error['index']] for error in errors], ordered=False)
+        return {upserted['_id'] for upserted in e.details.get('upserted', [])}
+
+
 def new_query(review: Review, search: dict):
     """Adds new query to review.
 
@@ -144,13 +193,49 @@ def get_dois_for_review(review: Review):
     return result_ids
 
 
-def get_persisted_results(obj: Union[Review, Query], page: int = 0, page_length: int = 0):
+# the fields of persisted results that can be requested, see wrapper/record.py parse_fields
+RESULT_FIELDS = RECORD_FIELDS + ("scores",)
+
+
+def result_projection(fields: tuple) -> list:
+    """Translates fields of results to the names of their keys in the results collection.
+
+    Args:
+        fields: names of fields of the Result model
+
+    Returns:
+        names of the keys, "doi" is stored as "_id"
+    """
+    return ["_id" if field == "doi" else field for field in fields]
+
+
+def projected_result(result: Result, fields: tuple = None) -> dict:
+    """Converts a result loaded with `result_projection` to a dict.
+
+    Args:
+        result: result object
+        fields: (optional) the fields the result was loaded with
+
+    Returns:
+        the result as returned by to_dict. If fields are given, the "_cls" key pymodm stores
+        with the result is left out, so that only the requested fields and "_id" remain.
+    """
+    document = result.to_dict()
+    if fields:
+        document.pop("_cls", None)
+    return document
+
+
+def get_persisted_results(obj: Union[Review, Query], page: int = 0, page_length: int = 0,
+                          fields: tuple = None):
     """Gets one page of results for a given review or query from the database.
 
     Args:
         obj: Review oder Query object
         page: (optional) page number to query, if not set, return all results
         page_length: length of page
+        fields: (optional) the fields of the results to load, see wrapper/record.py
+            parse_fields. All fields if not set.
 
     Returns:
         list of results
@@ -172,12 +257,15 @@ def get_persisted_results(obj: Union[Review, Query], page: int = 0, page_length:
 
         num_results = results.count()
 
+        if fields:
+            results = results.only(*result_projection(fields))
+
         if page >= 1:
             results = results.skip(calc_start_at(
                 page, page_length)).limit(page_length)
 
         return {
-            "results": [result.to_son().to_dict() for result in list(results)],
+            "results": [projected_result(result, fields) for result in list(results)],
             "total_results": num_results,
         }
 
@@ -193,13 +281,146 @@ def delete_results_for_review(review: Review):
         review.queries = []
         review.save()
 
+    ReviewFacets.objects.raw({"_id": review._id}).delete()
+
+
+def add_harvest_job(review: Review, query: Query, pages: list, page_length: int) -> HarvestJob:
+    """Adds a job that persists pages of a query in the background.
+
+    Args:
+        review: review object
+        query: query object the results are persisted for
+        pages: list of page numbers
+        page_length: length of page
+
+    Returns:
+        new job
+    """
+    now = datetime.now()
+    job = HarvestJob(
+        review=review,
+        query_id=query._id,
+        pages=pages,
+        page_length=page_length,
+        status="queued",
+        completed_pages=[],
+        num_persisted=0,
+        date_created=now,
+        date_updated=now
+    )
+    return job.save()
+
+
+def get_harvest_job_by_id(job_id: str) -> HarvestJob:
+    """Gets harvest job by id.
+
+    Args:
+        job_id: job's ObjectId as str
+
+    Returns:
+        job object
+    """
+    for job in HarvestJob.objects.raw({"_id": ObjectId(job_id)}):
+        return job
+
+
+def claim_harvest_job(stale_after: int) -> HarvestJob:
+    """Claims the oldest queued job, or a running job whose worker stopped updating it.
+
+    Claiming is atomic, so several workers can poll the same collection.
+
+    Args:
+        stale_after: seconds after which a running job without updates is resumed
+
+    Returns:
+        job object or None if there is nothing to do
+    """
+    now = datetime.now()
+    document = HarvestJob._mongometa.collection.find_one_and_update(
+        {"$or": [
+            {"status": "queued"},
+            {"status": "running", "date_updated": {"$lt": now - timedelta(seconds=stale_after)}},
+        ]},
+        {"$set": {"status": "running", "date_updated": now}},
+        sort=[("date_created", 1)],
+        return_document=ReturnDocument.AFTER
+    )
+    if document is not None:
+        return HarvestJob.from_document(document)
+
+
+def update_harvest_job_progress(job: HarvestJob, page: int, num_persisted: int):
+    """Marks a page of a job as completed.
+
+    Pages that are already completed (e.g. by a worker that was considered stale) are not
+    counted again.
+
+    Args:
+        job: job object
+        page: page number
+        num_persisted: number of results persisted for this page
+    """
+    HarvestJob._mongometa.collection.update_one(
+        {"_id": job._id, "completed_pages": {"$ne": page}},
+        {
+            "$addToSet": {"completed_pages": page},
+            "$inc": {"num_persisted": num_persisted},
+            "$set": {"date_updated": datetime.now()},
+        }
+    )
+    job.refresh_from_db()
+
+
+def finish_harvest_job(job: HarvestJob, status: str, error: str = ""):
+    """Sets the final status of a running job. Cancelled jobs stay cancelled.
 
-def get_results_by_dois(review: Review, dois: list) -> list:
+    Args:
+        job: job object
+        status: "done" or "failed"
+        error: (optional) error description
+    """
+    HarvestJob._mongometa.collection.update_one(
+        {"_id": job._id, "status": "running"},
+        {"$set": {"status": status, "error": error, "date_updated": datetime.now()}}
+    )
+    job.refresh_from_db()
+
+
+def cancel_harvest_job(job: HarvestJob) -> HarvestJob:
+    """Cancels a job that is not finished yet. A running job stops after its current page.
+
+    Args:
+        job: job object
+
+    Returns:
+        updated job object
+    """
+    HarvestJob._mongometa.collection.update_one(
+        {"_id": job._id, "status": {"$in": ["queued", "running"]}},
+        {"$set": {"status": "cancelled", "date_updated": datetime.now()}}
+    )
+    job.refresh_from_db()
+    return job
+
+
+def is_harvest_job_cancelled(job: HarvestJob) -> bool:
+    """Checks if a job was cancelled in the meantime.
+
+    Args:
+        job: job object
+    """
+    document = HarvestJob._mongometa.collection.find_one({"_id": job._id}, {"status": 1})
+    return document is None or document.get("status") == "cancelled"
+
+
+def get_results_by_dois(review: Review, dois: list, fields: tuple = None) -> list:
     """Gets results for dois for a specific review
 
     Args:
         review: review object
         dois: list of dois as str
+        fields: (optional) the fields of the results to load, see wrapper/record.py
+            parse_fields. All fields if not set.
 
     Returns:
         result objects
@@ -208,8 +429,11 @@ def get_results_by_dois(review: Review, dois: list) -> list:
         results = Result.objects.raw({"_id": {"$in": dois}})
         num_results = results.count()
 
+        if fields:
+            results = results.only(*result_projection(fields))
+
         return {
-            "results": [result.to_son().to_dict() for result in list(results)],
+            "results": [projected_result(result, fields) for result in list(results)],
             "total_results": num_results,
         }
 
@@ -221,12 +445,16 @@ def delete_results_by_dois(review: Review, dois: str):
         review: Review object
         doi: list of dois
     """
+    deleted_results = []
     with switch_collection(Result, review.result_collection):
         results = Result.objects.raw({"_id": {"$in": dois}})
 
         for result in results:
+            deleted_results.append(result.to_dict())
             result.delete()
 
+    update_facets(review, deleted_results, sign=-1)
+
 
 def get_result_by_doi(review: Review, doi: str):
     """Gets one result by its id
@@ -241,6 +469,112 @@ def get_result_by_doi(review: Review, doi: str):
         return Result.objects.raw({"_id":  doi}).first()
 
 
+# The countries facet only counts Scopus results: Springer records list their creators without
+# affiliations, Springer only reports countries in the facets of a whole response.
+FACET_CATEGORIES = ["countries", "keywords", "years", "publishers", "contentTypes"]
+
+
+def escape_facet_key(key: str) -> str:
+    """Escapes a facet value so it can be used as a field name in mongodb.
+
+    Args:
+        key: facet value, e.g. a publisher name
+
+    Returns:
+        key with "." and "$" replaced by their full width counterparts
+    """
+    return str(key).replace(".", "\uff0e").replace("$", "\uff04")
+
+
+def unescape_facet_key(key: str) -> str:
+    """Reverts escape_facet_key.
+
+    Args:
+        key: escaped facet value
+
+    Returns:
+        original facet value
+    """
+    return key.replace("\uff0e", ".").replace("\uff04", "$")
+
+
+def result_facets(result: dict) -> dict:
+    """Gets the facet values a single result contributes to the facets of its review.
+
+    Args:
+        result: result as defined in wrapper/output_format.py unter 'records'
+
+    Returns:
+        {"<facet category>": {"<value>": <counter>}} for every category in FACET_CATEGORIES
+    """
+    facets = {category: {} for category in FACET_CATEGORIES}
+
+    # only set for Scopus records, see FACET_CATEGORIES
+    for country in result.get('countries') or []:
+        facets["countries"][country] = 1
+
+    facets["keywords"] = wrapper_utils.count_title_words(result.get('title') or "")
+
+    year = str(result.get('publicationDate') or "")[:4]
+    if year.isdigit():
+        facets["years"][year] = 1
+
+    if result.get('publisher'):
+        facets["publishers"][result.get('publisher')] = 1
+
+    if result.get('contentType'):
+        facets["contentTypes"][result.get('contentType')] = 1
+
+    return facets
+
+
+def update_facets(review: Review, results: list, sign: int = 1):
+    """Incrementally updates the facets of a review.
+
+    Args:
+        review: review object
+        results: list of results that were added to or removed from the review
+        sign: 1 if the results were added, -1 if they were removed
+    """
+    increments = {}
+    for result in results:
+        for category, values in result_facets(result).items():
+            for value, count in values.items():
+                key = f"{category}.{escape_facet_key(value)}"
+                increments[key] = increments.get(key, 0) + sign * count
+
+    if increments:
+        ReviewFacets._mongometa.collection.update_one(
+            {"_id": review._id}, {"$inc": increments}, upsert=True)
+
+
+def get_facets(review: Review) -> dict:
+    """Gets the facets of all results persisted for a review.
+
+    Args:
+        review: review object
+
+    Returns:
+        {
+            "countries": {"<ISO 3166-1 alpha-2 code>": <counter>},
+            "keywords": [{"text": "<keyword>", "value": <counter>}],
+            "years": {"<year>": <counter>},
+            "publishers": {"<publisher>": <counter>},
+            "contentTypes": {"<content type>": <counter>}
+        }
+    """
+    document = ReviewFacets._mongometa.collection.find_one({"_id": review._id}) or {}
+
+    facets = {}
+    for category in FACET_CATEGORIES:
+        # counters of removed values drop to zero but are kept in the document
+        facets[category] = {unescape_facet_key(value): count for value, count in
+                            document.get(category, {}).items() if count > 0}
+
+    facets["keywords"] = wrapper_utils.into_keywords_format(facets["keywords"])
+    return facets
+
+
 def calc_start_at(page, page_length):
     """Calculates the starting point for pagination. Pages start at 1.
 
@@ -1,5 +1,7 @@
 from pymodm import fields, MongoModel, EmbeddedMongoModel
 
+from functions.db.compressed_field import CompressedTextField, decompress
+
 
 class Result(MongoModel):
     # "doi": "The DOI of the record",
@@ -41,11 +43,13 @@ class Result(MongoModel):
     # "journalId": "ID of the publication journal",
     journalId = fields.CharField(blank=True)
     # "copyright": "Copyright notice",
-    copyright = fields.CharField(blank=True)
+    copyright = CompressedTextField(blank=True)
     # "abstract": "Abstract (Summary)",
-    abstract = fields.CharField(blank=True)
+    abstract = CompressedTextField(blank=True)
     # "uri": "Link to the record"
     uri = fields.CharField(blank=True)
+    # "countries": ["ISO 3166-1 alpha-2 code of an affiliation"]
+    countries = fields.ListField(blank=True)
     #
     printIsbn = fields.CharField(blank=True)
     electronicIsbn = fields.CharField(blank=True)
@@ -54,6 +58,14 @@ class Result(MongoModel):
     class Meta:
         ignore_unknown_fields = True
 
+    def to_dict(self) -> dict:
+        """Returns the result as it is stored, but with decompressed texts."""
+        document = self.to_son().to_dict()
+        for field in self._mongometa.get_fields():
+            if isinstance(field, CompressedTextField) and field.mongo_name in document:
+                document[field.mongo_name] = decompress(document[field.mongo_name])
+        return document
+
 
 class Score(EmbeddedMongoModel):
     # user = fields.CharField()
@@ -78,15 +90,29 @@ class Query(EmbeddedMongoModel):
     time = fields.CharField()
     results = fields.ListField()
     search = fields.EmbeddedDocumentField('Search')
+    # progress of persistent_query for each wrapper, used to resume an interrupted harvest:
+    # {"<wrapper name>": {"position": <cursor or start>, "num_results": int, "total": int}}
+    # position is None when the data base is exhausted, total is missing until it is known.
+    harvest_state = fields.DictField(blank=True)
 
 
 class Search(EmbeddedMongoModel):
     search_groups = fields.EmbeddedDocumentListField('SearchGroup')
     match = fields.CharField(choices=("AND", "OR"))
+    # defined before "fields", which shadows the pymodm module in the class body
+    filters = fields.EmbeddedDocumentField('SearchFilters', blank=True)
     fields = fields.ListField(fields.CharField(
         choices=["all", "abstract", "keywords", "title"]))
 
 
+class SearchFilters(EmbeddedMongoModel):
+    year_from = fields.IntegerField(blank=True)
+    year_to = fields.IntegerField(blank=True)
+    open_access = fields.BooleanField(blank=True)
+    document_types = fields.ListField(fields.CharField(
+        choices=["article", "book", "chapter", "conference_paper", "review"]), blank=True)
+
+
 class SearchGroup(EmbeddedMongoModel):
     search_terms = fields.ListField(fields.CharField())
     match = fields.CharField(choices=("AND", "OR", "NOT"))
@@ -106,6 +132,40 @@ class DatabaseInfo(EmbeddedMongoModel):
     api_key = fields.CharField()
 
 
+class ReviewFacets(MongoModel):
+    # one document per review, _id is the review's _id
+    _id = fields.ObjectIdField(primary_key=True)
+    # value: counter, values are escaped by connector.escape_facet_key
+    countries = fields.DictField(blank=True)
+    keywords = fields.DictField(blank=True)
+    years = fields.DictField(blank=True)
+    publishers = fields.DictField(blank=True)
+    contentTypes = fields.DictField(blank=True)
+
+
+class HarvestJob(MongoModel):
+    review = fields.ReferenceField('Review')
+    query_id = fields.ObjectIdField()
+    pages = fields.ListField(fields.IntegerField())
+    page_length = fields.IntegerField()
+    # "queued", "running", "done", "failed" or "cancelled"
+    status = fields.CharField(choices=("queued", "running", "done", "failed", "cancelled"))
+    completed_pages = fields.ListField(fields.IntegerField(), blank=True)
+    num_persisted = fields.IntegerField()
+    error = fields.CharField(blank=True)
+    date_created = fields.DateTimeField()
+    # updated with every page, running jobs that are not updated for a while are resumed
+    date_updated = fields.DateTimeField()
+
+
+class RateLimitBucket(MongoModel):
+    # "<wrapper name>:<hashed api key>:<requests>/<seconds>", see wrapper/rate_limit.py
+    _id = fields.CharField(primary_key=True)
+    tokens = fields.FloatField()
+    # unix timestamp of the last update
+    updated = fields.FloatField()
+
+
 class UserSession(MongoModel):
     username = fields.CharField(primary_key=True)
     token = fields.CharField()
@@ -0,0 +1,164 @@
+"""Concurrent fetching and persisting of query results."""
+
+import os
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+
+# maximum number of concurrent requests to one literature data base
+MAX_CONCURRENCY = int(os.getenv('HARVEST_MAX_CONCURRENCY', 4))
+
+# maximum number of fetched pages waiting to be persisted
+QUEUE_SIZE = int(os.getenv('HARVEST_QUEUE_SIZE', 8))
+
+# maximum number of pages and page length of a harvest, see validate_pages
+MAX_PAGES = int(os.getenv('HARVEST_MAX_PAGES', 1000))
+MAX_PAGE_LENGTH = int(os.getenv('HARVEST_MAX_PAGE_LENGTH', 1000))
+
+# one semaphore for each data base, shared by all harvests of this process
+provider_slots = dict()
+
+# seconds between two checks whether a deadline was cancelled
+DEADLINE_POLL_INTERVAL = 0.1
+
+# put into the queue by a task when it has no more pages
+TASK_DONE = object()
+
+
+def validate_pages(pages, page_length) -> (list, int):
+    """Validate the pages of a harvest requested by a client.
+
+    Args:
+        pages: list of page numbers (starting at 1)
+        page_length: length of page
+
+    Returns:
+        the pages without duplicates and the page length
+
+    Raises:
+        ValueError: if the pages or the page length are not positive ints or too many or large
+    """
+    if not isinstance(page_length, int) or isinstance(page_length, bool) \
+            or not 1 <= page_length <= MAX_PAGE_LENGTH:
+        raise ValueError(f"page_length must be an int between 1 and {MAX_PAGE_LENGTH}.")
+
+    if not isinstance(pages, list) or not pages:
+        raise ValueError("pages must be a non-empty list of page numbers.")
+    for page in pages:
+        if not isinstance(page, int) or isinstance(page, bool) or page < 1:
+            raise ValueError("pages must be a non-empty list of page numbers.")
+
+    pages = list(dict.fromkeys(pages))
+    if len(pages) > MAX_PAGES:
+        raise ValueError(f"At most {MAX_PAGES} pages can be harvested at once.")
+    return pages, page_length
+
+
+def provider_slot(name: str) -> threading.BoundedSemaphore:
+    """Get the semaphore that limits the concurrent requests to a data base.
+
+    Args:
+        name: name of the wrapper class
+
+    Returns:
+        semaphore with MAX_CONCURRENCY slots
+    """
+    # setdefault is atomic, so concurrent harvests get the same semaphore
+    return provider_slots.setdefault(name, threading.BoundedSemaphore(MAX_CONCURRENCY))
+
+
+def run_pipeline(tasks: list, persist, max_workers: int = MAX_CONCURRENCY, should_stop=None) -> bool:
+    """Fetch pages concurrently and persist them while the next pages are fetched.
+
+    The tasks run in a thread pool and put their pages into a bounded queue, so fetching pauses
+    when persisting falls behind. Persisting happens in the calling thread only, since
+    pymodm's switch_collection is not thread safe.
+
+    Args:
+        tasks: list of functions without arguments that return an iterable of pages.
+            A page is a (key, results) tuple.
+        persist: function called with key and results of every page
+        max_workers: number of tasks that run at the same time
+        should_stop: (optional) function without arguments. If it returns True after a page was
+            persisted, tasks that did not start yet are cancelled and the pages of running
+            tasks are dropped.
+
+    Returns:
+        True if all tasks finished, False if the pipeline was stopped.
+    """
+    pages = queue.Queue(maxsize=QUEUE_SIZE)
+    stopped = threading.Event()
+
+    def run_task(task):
+        try:
+            for page in task():
+                if stopped.is_set():
+                    break
+                pages.put(page)
+        except Exception as e:
+            print(f"Fetching pages failed: {e}")
+        finally:
+            pages.put(TASK_DONE)
+
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+        futures = [executor.submit(run_task, task) for task in tasks]
+        num_running = len(futures)
+
+        def stop():
+            if stopped.is_set():
+                return 0
+            stopped.set()
+            # cancelled tasks never put TASK_DONE
+            return sum(future.cancel() for future in futures)
+
+        try:
+            while num_running > 0:
+                page = pages.get()
+                if page is TASK_DONE:
+                    num_running -= 1
+                elif not stopped.is_set():
+                    persist(*page)
+
+                    if should_stop and should_stop():
+                        num_running -= stop()
+        except BaseException:
+            num_running -= stop()
+            # drain the queue, so the running tasks are not blocked and the executor can shut down
+            while num_running > 0:
+                if pages.get() is TASK_DONE:
+                    num_running -= 1
+            raise
+
+    return not stopped.is_set()
+
+
+def run_concurrently(calls: dict, deadline=None) -> dict:
+    """Run functions concurrently and collect the results that are ready before a deadline.
+
+    Functions that are still running at the deadline are left to finish in the background,
+    their results are dropped.
+
+    Args:
+        calls: {<key>: <function without arguments>}
+        deadline: (optional) wrapper.deadline.Deadline. Without it, all results are awaited.
+
+    Returns:
+        {<key>: <return value>} of the functions that finished in time.
+        Exceptions raised by these functions are raised again.
+    """
+    if not calls:
+        return dict()
+
+    executor = ThreadPoolExecutor(max_workers=len(calls))
+    futures = {executor.submit(call): key for key, call in calls.items()}
+    if deadline is None:
+        done, _ = wait(futures)
+    else:
+        # wake up regularly, since the deadline might be cancelled
+        done, pending = wait(futures, timeout=min(DEADLINE_POLL_INTERVAL, deadline.remaining()))
+        while pending and not deadline.expired:
+            more, pending = wait(pending, timeout=min(DEADLINE_POLL_INTERVAL, deadline.remaining()))
+            done |= more
+    executor.shutdown(wait=False)
+
+    return {futures[future]: future.result() for future in done}
@@ -0,0 +1,71 @@
+"""Background harvest jobs.
+
+Jobs are stored in mongodb (see HarvestJob in functions/db/models.py) and processed by
+run_worker. Run `python -m functions.jobs` to start a worker locally as a stand-in for a queue.
+"""
+
+import os
+import time
+
+from functions import slr
+from functions.db import models
+from functions.db import connector
+
+# seconds between two polls for new jobs
+POLL_INTERVAL = float(os.getenv('JOB_POLL_INTERVAL', 2))
+
+# seconds after which a running job without progress is considered interrupted and resumed
+STALE_AFTER = int(os.getenv('JOB_STALE_AFTER', 300))
+
+
+def process_job(job: models.HarvestJob):
+    """Persist the pages of a job that are not completed yet.
+
+    Args:
+        job: a job claimed by connector.claim_harvest_job
+    """
+    def on_page(page, num_persisted):
+        connector.update_harvest_job_progress(job, page, num_persisted)
+
+    def should_stop():
+        return connector.is_harvest_job_cancelled(job)
+
+    try:
+        # the review or the query might have been deleted since the job was added
+        review = job.review
+        query = connector.get_query_by_id(review, job.query_id)
+        search = query.search.to_son().to_dict()
+
+        pages = [page for page in job.pages if page not in job.completed_pages]
+
+        slr.persist_pages(search, pages, job.page_length, review, query,
+                          on_page=on_page, should_stop=should_stop)
+    except Exception as e:
+        print(f"Job {job._id} failed: {e}")
+        connector.finish_harvest_job(job, "failed", str(e))
+        return
+
+    connector.finish_harvest_job(job, "done")
+
+
+def run_worker(max_jobs: int = None, poll_interval: float = POLL_INTERVAL):
+    """Process jobs until interrupted.
+
+    Args:
+        max_jobs: (optional) stop after this many jobs
+        poll_interval: seconds to wait when there are no jobs
+    """
+    num_jobs = 0
+    while max_jobs is None or num_jobs < max_jobs:
+        job = connector.claim_harvest_job(STALE_AFTER)
+        if job is None:
+            time.sleep(poll_interval)
+            continue
+
+        print(f"Processing job {job._id}: {len(job.completed_pages)}/{len(job.pages)} pages done")
+        process_job(job)
+        num_jobs += 1
+
+
+if __name__ == "__main__":
+    run_worker()
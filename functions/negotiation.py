@@ -0,0 +1,84 @@
+"""Content negotiation for the responses of the handlers.
+
+The Accept and Accept-Encoding headers list the formats a client accepts with optional quality
+values, e.g. "application/msgpack, application/json;q=0.5" or "gzip, br;q=0.9".
+"""
+
+from typing import Optional
+
+
+def get_header(event: dict, name: str) -> Optional[str]:
+    """Get a header of a request regardless of its case.
+
+    Args:
+        event: lambda event
+        name: name of the header
+
+    Returns:
+        value of the header or None
+    """
+    name = name.lower()
+    for key, value in (event.get('headers') or {}).items():
+        if key.lower() == name:
+            return value
+    return None
+
+
+def quality_values(header: str) -> dict:
+    """Parse the quality values of an Accept or Accept-Encoding header.
+
+    Args:
+        header: value of the header
+
+    Returns:
+        dict of the lower case names and their quality values (1 if not given)
+    """
+    qualities = dict()
+    for part in header.split(','):
+        name, *params = part.split(';')
+        quality = 1.0
+        for param in params:
+            key, _, value = param.strip().partition('=')
+            if key.strip() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        name = name.strip().lower()
+        if name:
+            qualities[name] = quality
+    return qualities
+
+
+def wildcards(name: str) -> [str]:
+    """Return the names matching a format, e.g. "application/*" and "*/*" for media types."""
+    if '/' in name:
+        return [name.split('/')[0] + '/*', '*/*']
+    return ['*']
+
+
+def choose(header: Optional[str], offers) -> Optional[str]:
+    """Choose the format of a response.
+
+    Args:
+        header: value of the Accept or Accept-Encoding header or None
+        offers: the supported formats in order of preference
+
+    Returns:
+        the accepted format with the highest quality value, preferring the order of offers,
+        or None if no format is accepted
+    """
+    if not header:
+        return None
+
+    qualities = quality_values(header)
+    best = None
+    best_quality = 0.0
+    for offer in offers:
+        quality = qualities.get(offer)
+        for wildcard in wildcards(offer):
+            if quality is None:
+                quality = qualities.get(wildcard)
+        if quality is not None and quality > best_quality:
+            best, best_quality = offer, quality
+    return best
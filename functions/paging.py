@@ -0,0 +1,128 @@
+"""Distribution of logical result pages over the literature data bases."""
+
+import math
+import threading
+
+
+class PageAllocator:
+    """Allocates the records of a logical page to the data bases that still have results.
+
+    A logical page of length n is filled evenly from all data bases that are not exhausted.
+    When a data base has less results left than its share, the remainder is taken from the
+    other data bases. The allocation of a page only depends on the page number, the page length
+    and the totals reported by the data bases, so the offsets of deep pages can be calculated
+    without requesting the previous pages.
+
+    Allocators are shared by the threads fetching the pages of a search, all methods are
+    thread-safe.
+    """
+
+    def __init__(self, providers: list):
+        """Initialize an allocator.
+
+        Args:
+            providers: names of the data bases, the order determines who gets the remainder
+                of an uneven split.
+        """
+        self.providers = list(providers)
+        # None means unknown, i.e. the data base is assumed to have infinitely many results
+        self.totals = {provider: None for provider in self.providers}
+        # guards the totals, reentrant because update calls set_total and allocate calls split
+        self.lock = threading.RLock()
+
+    def remaining(self, provider: str, offset: int):
+        """Return how many results a data base has left after a given offset."""
+        with self.lock:
+            total = self.totals.get(provider)
+        if total is None:
+            return math.inf
+        return max(total - offset, 0)
+
+    def set_total(self, provider: str, total: int):
+        """Set the total number of results a data base reported.
+
+        Args:
+            provider: name of the data base
+            total: number of results. Negative values mean unknown.
+        """
+        with self.lock:
+            self.totals[provider] = total if total >= 0 else None
+
+    def update(self, provider: str, start: int, num: int, result: dict):
+        """Learn the total of a data base from one of its results.
+
+        Args:
+            provider: name of the data base
+            start: index of the first requested record (1-based)
+            num: number of requested records
+            result: the formatted response as defined in wrapper/output_format.py
+        """
+        if result.get('error'):
+            return
+
+        try:
+            total = int(result.get('result', {}).get('total', -1))
+        except (TypeError, ValueError):
+            total = -1
+
+        # Data bases might stop returning results before their total is reached
+        # (e.g. Scopus does not allow offsets > 5000). Treat them as exhausted.
+        num_records = len(result.get('records') or [])
+        if num_records < num:
+            total = start - 1 + num_records
+
+        self.set_total(provider, total)
+
+    def split(self, offsets: dict, page_length: int) -> dict:
+        """Split one page between the data bases.
+
+        Args:
+            offsets: number of results already allocated for each data base
+            page_length: length of page
+
+        Returns:
+            {"<provider>": <number of records>}
+        """
+        with self.lock:
+            shares = {provider: 0 for provider in self.providers}
+            active = [p for p in self.providers if self.remaining(p, offsets[p]) > 0]
+            needed = page_length
+
+            while needed > 0 and active:
+                share, remainder = divmod(needed, len(active))
+                capped = []
+                for i, provider in enumerate(active):
+                    wanted = share + (1 if i < remainder else 0)
+                    left = self.remaining(provider, offsets[provider] + shares[provider])
+                    given = min(wanted, left)
+                    shares[provider] += given
+                    needed -= given
+                    if given == left:
+                        capped.append(provider)
+                active = [p for p in active if p not in capped]
+
+            return shares
+
+    def allocate(self, page: int, page_length: int) -> dict:
+        """Allocate the records of a logical page.
+
+        Args:
+            page: page number, pages start at 1
+            page_length: length of page
+
+        Returns:
+            {"<provider>": (<index of the first record (1-based)>, <number of records>)}
+            Exhausted data bases are not contained.
+        """
+        # all pages are split with the same totals
+        with self.lock:
+            offsets = {provider: 0 for provider in self.providers}
+
+            for _ in range(1, page):
+                for provider, num in self.split(offsets, page_length).items():
+                    offsets[provider] += num
+
+            return {
+                provider: (offsets[provider] + 1, num)
+                for provider, num in self.split(offsets, page_length).items() if num > 0
+            }
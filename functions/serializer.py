@@ -0,0 +1,163 @@
+"""Serialisation of the response bodies of the handlers.
+
+The serialiser is chosen with the environment variable JSON_SERIALIZER: "orjson" (default if it
+is installed) or "json" (the standard library). Both write ObjectIds and datetimes like
+bson.json_util, e.g. {"$oid": "..."} and {"$date": <milliseconds since the epoch>}.
+
+Clients accepting application/msgpack get MessagePack instead (if msgpack is installed).
+Datetimes are MessagePack timestamps (extension type -1) and ObjectIds their 12 bytes as
+extension type 7, the type number of ObjectIds in BSON.
+"""
+
+import calendar
+import datetime
+import json
+import os
+from typing import Optional
+
+from bson import ObjectId, json_util
+
+from functions import negotiation
+from wrapper.record import Record
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+OBJECT_ID_EXT_TYPE = 7
+
+
+def datetime_to_millis(value: datetime.datetime) -> int:
+    """Convert a datetime to milliseconds since the epoch like bson.json_util.
+
+    Args:
+        value: datetime, naive datetimes are in UTC
+
+    Returns:
+        milliseconds since the epoch
+    """
+    offset = value.utcoffset()
+    if offset is not None:
+        value = value - offset
+    return calendar.timegm(value.timetuple()) * 1000 + value.microsecond // 1000
+
+
+def default(obj):
+    """Serialise the objects json does not know.
+
+    The common types are checked first, all others are serialised by bson.json_util.
+
+    Args:
+        obj: a record of the wrappers or a bson type
+
+    Returns:
+        json serialisable representation of obj
+
+    Raises:
+        TypeError: if obj cannot be serialised
+    """
+    if isinstance(obj, Record):
+        return obj.to_dict()
+    if isinstance(obj, ObjectId):
+        return {"$oid": str(obj)}
+    if isinstance(obj, datetime.datetime):
+        return {"$date": datetime_to_millis(obj)}
+    return json_util.default(obj)
+
+
+def dumps_json(body) -> str:
+    """Serialise with the standard library."""
+    return json.dumps(body, default=default)
+
+
+def dumps_orjson(body) -> str:
+    """Serialise with orjson.
+
+    orjson would write datetimes in ISO format, they are passed to `default` instead.
+    """
+    return orjson.dumps(
+        body, default=default, option=orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+    ).decode()
+
+
+SERIALIZERS = {
+    "json": dumps_json,
+}
+if orjson is not None:
+    SERIALIZERS["orjson"] = dumps_orjson
+
+SERIALIZER = os.getenv('JSON_SERIALIZER', "orjson" if orjson is not None else "json")
+
+if SERIALIZER not in SERIALIZERS:
+    print(f"JSON serializer {SERIALIZER} is not available. Using json.")
+    SERIALIZER = "json"
+
+
+def dumps(body) -> str:
+    """Serialise a response body with the configured serialiser.
+
+    Args:
+        body: json serialisable body, may contain records and bson types
+
+    Returns:
+        JSON string
+    """
+    return SERIALIZERS[SERIALIZER](body)
+
+
+def default_msgpack(obj):
+    """Serialise the objects msgpack does not know.
+
+    Args:
+        obj: a record of the wrappers or a bson type
+
+    Returns:
+        msgpack serialisable representation of obj
+
+    Raises:
+        TypeError: if obj cannot be serialised
+    """
+    if isinstance(obj, Record):
+        return obj.to_dict()
+    if isinstance(obj, ObjectId):
+        return msgpack.ExtType(OBJECT_ID_EXT_TYPE, obj.binary)
+    if isinstance(obj, datetime.datetime):
+        if obj.utcoffset() is None:
+            obj = obj.replace(tzinfo=datetime.timezone.utc)
+        return msgpack.Timestamp.from_datetime(obj)
+    return json_util.default(obj)
+
+
+def dumps_msgpack(body) -> bytes:
+    """Serialise with MessagePack."""
+    return msgpack.packb(body, default=default_msgpack, use_bin_type=True)
+
+
+JSON = "application/json"
+
+# the supported media types in order of preference
+MEDIA_TYPES = {
+    JSON: dumps,
+}
+if msgpack is not None:
+    MEDIA_TYPES["application/msgpack"] = dumps_msgpack
+    MEDIA_TYPES["application/x-msgpack"] = dumps_msgpack
+
+
+def negotiate(accept: Optional[str]) -> str:
+    """Choose the media type of a response.
+
+    Args:
+        accept: value of the Accept header, e.g. "application/msgpack, application/json;q=0.5"
+
+    Returns:
+        the accepted media type with the highest quality value, JSON if no supported media
+        type is accepted
+    """
+    return negotiation.choose(accept, MEDIA_TYPES) or JSON
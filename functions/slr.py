@@ -1,15 +1,47 @@
 import os
+import copy
 import json
+import math
+import threading
 
 # from functions.db.models import *
 
 from wrapper import ALL_WRAPPERS
+from wrapper import planner
+from wrapper import rate_limit
 from wrapper import utils as wrapper_utils
+from wrapper.deadline import TIMEOUT_ERROR, Deadline
+from wrapper.query import parse_query
+from wrapper.record import Record
 from functions.db import models
 from functions.db import connector
+from functions import cache
+from functions import harvest
+from functions.paging import PageAllocator
 
 db_wrappers = list()
 
+if os.getenv('RATE_LIMIT_BACKEND') == "mongo":
+    # share the quotas of the api keys between all containers
+    rate_limit.use_mongo(models.RateLimitBucket._mongometa.collection)
+
+# page allocators for the most recent searches, see get_allocator
+allocators = dict()
+allocators_lock = threading.Lock()
+MAX_ALLOCATORS = 128
+
+# prefetching of the next page of dry queries: "" (off) or "thread" (in a background thread
+# while the user reads the page). Only for long running processes: lambda freezes the process
+# as soon as the response is sent, so the prefetch would only delay the response there.
+PREFETCH_MODE = os.getenv('PREFETCH_MODE', '')
+
+# maximum seconds a prefetch may take
+PREFETCH_TIMEOUT = float(os.getenv('PREFETCH_TIMEOUT', 30))
+
+# the running prefetch of each session, see prefetch
+prefetches = dict()
+prefetches_lock = threading.Lock()
+
 
 def get_api_keys():
     """Get api keys.
@@ -57,7 +89,81 @@ def instantiate_wrappers():
     return instantiated_wrappers
 
 
-def call_api(db_wrapper, search: dict, page: int, page_length: int):
+def get_wrappers() -> list:
+    """Get the instantiated wrappers. They are instantiated on the first call.
+
+    Returns:
+        list of instantiated wrapper objects, each for each data base wrapper
+    """
+    global db_wrappers
+
+    if not db_wrappers:
+        db_wrappers = instantiate_wrappers()
+
+    return db_wrappers
+
+
+def copy_wrapper(db_wrapper, deadline=None, wait_for_quota: bool = True):
+    """Copy a wrapper, so that one thread can set its start index and page length.
+
+    Args:
+        db_wrapper: object that implements the wrapper interface defined in wrapper/wrapper_interface.py
+        deadline: (optional) wrapper.deadline.Deadline that the requests of the copy keep
+        wait_for_quota: if False, requests fail instead of waiting for the rate limiter
+
+    Returns:
+        the copy
+    """
+    db_wrapper = copy.copy(db_wrapper)
+    policy = db_wrapper.retry_policy
+    if deadline is not None:
+        policy = policy.with_deadline(deadline)
+    if not wait_for_quota:
+        policy = copy.copy(policy)
+        policy.limiter_wait = 0
+    db_wrapper.retry_policy = policy
+    return db_wrapper
+
+
+def timed_out_output(db_wrapper, search: dict, start: int, num: int) -> dict:
+    """Create the output for a data base that did not respond before the deadline.
+
+    Args:
+        db_wrapper: object that implements the wrapper interface defined in wrapper/wrapper_interface.py
+        search: dict of search terms as defined in wrapper/input_format.py
+        start: index of the first requested record (1-based)
+        num: number of requested records
+
+    Returns:
+        results as specified in wrapper/ouputFormat.py without records
+    """
+    return wrapper_utils.invalid_output(search, None, db_wrapper.api_key, TIMEOUT_ERROR, start, num)
+
+
+def call_provider(db_wrapper, search: dict) -> dict:
+    """Call a literature data base wrapper while holding one of the data base's harvest slots.
+
+    Args:
+        db_wrapper: wrapper object with start index, page length or cursor set.
+            Has to be a copy if it is used by several threads.
+        search: dict of search terms as defined in wrapper/input_format.py
+
+    Returns:
+        results as specified in wrapper/ouputFormat.py
+    """
+    deadline = db_wrapper.retry_policy.deadline
+    slot = harvest.provider_slot(type(db_wrapper).__name__)
+
+    if not slot.acquire(timeout=deadline.remaining() if deadline else None):
+        return timed_out_output(db_wrapper, search, -1, db_wrapper.show_num)
+    try:
+        return db_wrapper.call_api(search)
+    finally:
+        slot.release()
+
+
+def call_api(db_wrapper, search: dict, page: int, page_length: int, deadline=None,
+             wait_for_quota: bool = True):
     """Call literature data base wrapper to query for a specific page.
 
     Args:
@@ -65,52 +171,256 @@ def call_api(db_wrapper, search: dict, page: int, page_length: int):
         search: dict of search terms as defined in wrapper/input_format.py
         page: page number
         page_length: length of page
+        deadline: (optional) wrapper.deadline.Deadline for the request
+        wait_for_quota: if False, the request fails instead of waiting for the rate limiter
 
     Returns:
         results as specified in wrapper/ouputFormat.py
     """
+    db_wrapper = copy_wrapper(db_wrapper, deadline, wait_for_quota)
     # page 1 starts at 1, page 2 at page_length + 1
     db_wrapper.start_at((page - 1) * page_length + 1)
     db_wrapper.show_num = page_length
     return db_wrapper.call_api(search)
 
 
-def conduct_query(search: dict, page: int, page_length="max") -> list:
-    """Get page of specific length. Aggregates results from all available literature data bases.
+def search_key(search: dict) -> str:
+    """Get a key that is the same for equivalent searches.
 
-    The number of results from each data base will be n/page_length with n being the number of data bases.
+    Args:
+        search: dict of search terms as defined in wrapper/input_format.py
+
+    Returns:
+        hash of the canonical query, see wrapper/query.py
+    """
+    try:
+        return parse_query(search).key
+    except ValueError:
+        # invalid searches fail in the wrappers anyway
+        return json.dumps(search, sort_keys=True)
+
+
+def get_allocator(search: dict) -> PageAllocator:
+    """Get the page allocator for a search.
+
+    The allocators remember the totals the data bases reported for a search, so they are kept
+    for the most recent searches.
 
     Args:
         search: dict of search terms as defined in wrapper/input_format.py
-        page: page number
-        page_length: length of page. If set to "max", the respective maxmimum number of results
-            results is returned by each wrapper.
 
     Returns:
-        list of results in format https://github.com/DaWeSys/backend/blob/simple_persistance/wrapper/output_format.py.
-            one for each wrapper.
+        page allocator for the available wrappers
     """
-    global db_wrappers
+    key = search_key(search)
+
+    # the pages of a search are fetched and persisted by concurrent threads
+    with allocators_lock:
+        if key not in allocators:
+            if len(allocators) >= MAX_ALLOCATORS:
+                # dicts keep insertion order, so this is the oldest one
+                del allocators[next(iter(allocators))]
+            allocators[key] = PageAllocator([type(w).__name__ for w in db_wrappers])
+
+        return allocators[key]
+
+
+def merge_results(results: list, start: int, num: int) -> dict:
+    """Merge consecutive results of one data base into one.
+
+    Args:
+        results: list of results as specified in wrapper/output_format.py
+        start: index of the first requested record (1-based)
+        num: number of requested records
+
+    Returns:
+        the first result containing the records and facets of all results
+    """
+    merged = results[0]
+    for result in results[1:]:
+        merged['records'] = merged.get('records', []) + result.get('records', [])
+        if result.get('error'):
+            merged['error'] = result.get('error')
+    if len(results) > 1:
+        merged['facets'] = wrapper_utils.combine_facets([res.get('facets') for res in results])
+
+    merged['result'] = {
+        **merged.get('result', {}),
+        "start": str(start),
+        "pageLength": str(num),
+        "recordsDisplayed": str(len(merged.get('records', []))),
+    }
+    return merged
+
+
+def fetch_records(db_wrapper, search: dict, start: int, num: int, deadline=None,
+                  wait_for_quota: bool = True) -> dict:
+    """Fetch a range of records from one literature data base.
+
+    Ranges that exceed the maximum number of records of the wrapper are split into several calls.
+
+    Args:
+        db_wrapper: object that implements the wrapper interface defined in wrapper/wrapper_interface.py
+        search: dict of search terms as defined in wrapper/input_format.py
+        start: index of the first record (1-based)
+        num: number of records
+        deadline: (optional) wrapper.deadline.Deadline for the requests
+        wait_for_quota: if False, the requests fail instead of waiting for the rate limiter
+
+    Returns:
+        results as specified in wrapper/ouputFormat.py
+    """
+    # the wrappers are shared between threads
+    db_wrapper = copy_wrapper(db_wrapper, deadline, wait_for_quota)
+
     results = []
+    for offset in range(0, num, db_wrapper.max_records):
+        db_wrapper.start_at(start + offset)
+        db_wrapper.show_num = min(db_wrapper.max_records, num - offset)
+        result = call_provider(db_wrapper, search)
+        results.append(result)
 
-    if not db_wrappers:
-        db_wrappers = instantiate_wrappers()
+        # don't ask for more if the data base is exhausted
+        if result.get('error') or len(result.get('records') or []) < db_wrapper.show_num:
+            break
 
-    if len(db_wrappers) == 0:
-        print("No wrappers existing.")
-        return []
+    return merge_results(results, start, num)
 
-    for db_wrapper in db_wrappers:
-        if page_length == "max":
-            virtual_page_length = db_wrapper.max_records
-        else:
-            virtual_page_length = int(page_length / len(db_wrappers))
 
-        results.append(
-            call_api(
-                db_wrapper, search, page, virtual_page_length
+def exhausted_output(db_wrapper, search: dict, total) -> dict:
+    """Create the output for a data base that has no results left for a page.
+
+    Args:
+        db_wrapper: object that implements the wrapper interface defined in wrapper/wrapper_interface.py
+        search: dict of search terms as defined in wrapper/input_format.py
+        total: total number of results of the data base
+
+    Returns:
+        results as specified in wrapper/ouputFormat.py without records
+    """
+    out = wrapper_utils.invalid_output(search, None, db_wrapper.api_key, "", -1, 0)
+    if total is not None:
+        out['result']['total'] = str(total)
+    return out
+
+
+def fetch_page(search: dict, page: int, page_length: int, deadline=None,
+               wait_for_quota: bool = True) -> list:
+    """Fetch a logical page from the data bases that still have results.
+
+    The first request for a search does not know the totals of the data bases yet.
+    When a data base turns out to have less results than allocated, the page is allocated again
+    and the missing records are requested from the other data bases.
+    The data bases are requested concurrently.
+
+    Args:
+        search: dict of search terms as defined in wrapper/input_format.py
+        page: page number
+        page_length: length of page
+        deadline: (optional) wrapper.deadline.Deadline. Data bases that did not respond by then
+            are marked as timed out in their results.
+        wait_for_quota: if False, the requests fail instead of waiting for the rate limiter
+
+    Returns:
+        list of results, one for each wrapper.
+    """
+    allocator = get_allocator(search)
+    fetched = dict()
+
+    # every round learns the total of at least one data base
+    for _ in range(len(db_wrappers) + 1):
+        allocation = allocator.allocate(page, page_length)
+        calls = dict()
+
+        for db_wrapper in db_wrappers:
+            name = type(db_wrapper).__name__
+            if name not in allocation:
+                fetched[name] = (None, exhausted_output(db_wrapper, search, allocator.totals.get(name)))
+                continue
+
+            start, num = allocation[name]
+            fetched_start, result = fetched.get(name, (None, None))
+            if fetched_start == start and (
+                    result.get('error') or len(result.get('records') or []) >= num):
+                # the records were fetched (or failed) in a previous round already
+                result['records'] = result['records'][:num]
+                result['result']['recordsDisplayed'] = str(len(result['records']))
+                continue
+
+            calls[name] = lambda db_wrapper=db_wrapper, start=start, num=num: fetch_records(
+                db_wrapper, search, start, num, deadline, wait_for_quota
             )
-        )
+
+        if not calls:
+            break
+
+        finished = harvest.run_concurrently(calls, deadline)
+        for db_wrapper in db_wrappers:
+            name = type(db_wrapper).__name__
+            if name not in calls:
+                continue
+
+            start, num = allocation[name]
+            if name in finished:
+                result = finished[name]
+                allocator.update(name, start, num, result)
+            else:
+                result = timed_out_output(db_wrapper, search, start, num)
+            fetched[name] = (start, result)
+
+        if deadline is not None and deadline.expired:
+            break
+
+    return [fetched[type(db_wrapper).__name__][1] for db_wrapper in db_wrappers]
+
+
+def query_key(search: dict, page: int, page_length) -> str:
+    """Get the key of a page of a query in the result cache.
+
+    Args:
+        search: dict of search terms as defined in wrapper/input_format.py
+        page: page number
+        page_length: length of page or "max"
+
+    Returns:
+        key for functions/cache.py
+    """
+    return json.dumps([search_key(search), page, page_length])
+
+
+def query_page(search: dict, page: int, page_length="max", deadline=None,
+               wait_for_quota: bool = True) -> list:
+    """Request a page from all available literature data bases concurrently.
+
+    Args:
+        search: dict of search terms as defined in wrapper/input_format.py
+        page: page number
+        page_length: length of page or "max", see conduct_query
+        deadline: (optional) wrapper.deadline.Deadline until which the results are needed
+        wait_for_quota: if False, the requests fail instead of waiting for the rate limiter
+
+    Returns:
+        list of results in format wrapper/output_format.py, one for each wrapper.
+    """
+    results = []
+
+    if page_length == "max":
+        finished = harvest.run_concurrently({
+            type(db_wrapper).__name__: lambda db_wrapper=db_wrapper: call_api(
+                db_wrapper, search, page, db_wrapper.max_records, deadline, wait_for_quota
+            )
+            for db_wrapper in db_wrappers
+        }, deadline)
+        for db_wrapper in db_wrappers:
+            result = finished.get(type(db_wrapper).__name__)
+            if result is None:
+                result = timed_out_output(
+                    db_wrapper, search, (page - 1) * db_wrapper.max_records + 1,
+                    db_wrapper.max_records
+                )
+            results.append(result)
+    else:
+        results = fetch_page(search, page, int(page_length), deadline, wait_for_quota)
 
     results[0]["facets"] = wrapper_utils.combine_facets([res.get("facets") for res in results])
     for res in results[1:]:
@@ -122,6 +432,204 @@ def conduct_query(search: dict, page: int, page_length="max") -> list:
     return results
 
 
+def conduct_query(search: dict, page: int, page_length="max", deadline=None) -> list:
+    """Get page of specific length. Aggregates results from all available literature data bases.
+
+    The page is filled from all data bases that still have results, see functions/paging.py.
+    The data bases are requested concurrently. If a deadline is given, the results of the data
+    bases that responded in time are returned and the others are marked as timed out.
+    Complete pages are kept in the result cache (functions/cache.py) for a while.
+
+    Args:
+        search: dict of search terms as defined in wrapper/input_format.py
+        page: page number
+        page_length: length of page. If set to "max", the respective maxmimum number of results
+            results is returned by each wrapper.
+        deadline: (optional) wrapper.deadline.Deadline until which the results are needed
+
+    Returns:
+        list of results in format https://github.com/DaWeSys/backend/blob/simple_persistance/wrapper/output_format.py.
+            one for each wrapper.
+    """
+    if len(get_wrappers()) == 0:
+        print("No wrappers existing.")
+        return []
+
+    key = query_key(search, page, page_length)
+    results = cache.results.get(key)
+    if results is None:
+        results = query_page(search, page, page_length, deadline)
+        # pages with failed or timed out data bases are requested again next time
+        if not any(res.get('error') for res in results):
+            cache.results.put(key, results)
+
+    return results
+
+
+def harvest_estimate(db_wrapper, total: int) -> dict:
+    """Estimate the requests and time needed to harvest the results of a data base.
+
+    Args:
+        db_wrapper: object that implements the wrapper interface defined in wrapper/wrapper_interface.py
+        total: total number of results of the data base
+
+    Returns:
+        number of requests with pages of maximum length, seconds the rate limits require for them
+        (excluding the time of the requests themselves) and the share of each quota they use
+    """
+    limits = db_wrapper.rate_limits
+    num_requests = math.ceil(max(total, 0) / db_wrapper.max_records)
+    return {
+        "requests": num_requests,
+        "seconds": rate_limit.harvest_time(num_requests, limits),
+        "quotas": [
+            {"requests": count, "seconds": seconds, "share": num_requests / count}
+            for count, seconds in limits
+        ],
+    }
+
+
+def count_query(search: dict, deadline=None) -> dict:
+    """Get the number of results of all available literature data bases without their records.
+
+    Only the smallest page is requested from each data base, see WrapperInterface.count.
+    The data bases are requested concurrently. Counts without errors are cached like pages.
+
+    Args:
+        search: dict of search terms as defined in wrapper/input_format.py
+        deadline: (optional) wrapper.deadline.Deadline until which the counts are needed
+
+    Returns:
+        {
+            "total": sum of the totals of the data bases,
+            "seconds": estimated seconds to harvest all results (the data bases are harvested concurrently),
+            "dbs": [{
+                "db": name of the wrapper,
+                "total": total number of results, -1 if unknown,
+                "error": error of the request,
+                "facets": facets as defined in wrapper/output_format.py, if counted over all results,
+                **harvest_estimate
+            }, ...]
+        }
+    """
+    if len(get_wrappers()) == 0:
+        print("No wrappers existing.")
+        return {"total": 0, "seconds": 0, "dbs": []}
+
+    key = json.dumps([search_key(search), "count"])
+    counts = cache.results.get(key)
+    if counts is not None:
+        return counts
+
+    finished = harvest.run_concurrently({
+        type(db_wrapper).__name__: lambda db_wrapper=db_wrapper: copy_wrapper(
+            db_wrapper, deadline
+        ).count(search)
+        for db_wrapper in db_wrappers
+    }, deadline)
+
+    dbs = []
+    for db_wrapper in db_wrappers:
+        name = type(db_wrapper).__name__
+        result = finished.get(name) or timed_out_output(db_wrapper, search, 1, 0)
+        try:
+            total = int(wrapper_utils.get(result, 'result', 'total', default=-1))
+        except (TypeError, ValueError):
+            total = -1
+
+        dbs.append({
+            "db": name,
+            "total": total,
+            "error": result.get('error', ""),
+            "facets": result.get('facets'),
+            **harvest_estimate(db_wrapper, total),
+        })
+
+    counts = {
+        "total": sum(db['total'] for db in dbs if db['total'] > 0),
+        "seconds": max(db['seconds'] for db in dbs),
+        "dbs": dbs,
+    }
+    if not any(db['error'] for db in dbs):
+        cache.results.put(key, counts)
+    return counts
+
+
+def cancel_prefetch(session, search: dict = None):
+    """Cancel the running prefetch of a session if it is for another search.
+
+    Args:
+        session: identifies the user, e.g. the review id
+        search: (optional) dict of search terms as defined in wrapper/input_format.py.
+            The prefetch is cancelled regardless of its search if not given.
+    """
+    with prefetches_lock:
+        running = prefetches.get(session)
+        if running and (search is None or running['search'] != search_key(search)):
+            running['deadline'].cancel()
+            del prefetches[session]
+
+
+def prefetch(search: dict, page: int, page_length, session=None):
+    """Fetch the page after a page into the result cache in the background, see PREFETCH_MODE.
+
+    A running prefetch of the same session for another page is cancelled. The prefetch never
+    waits for the rate limiters of the data bases, so it does not take the quota of requests
+    made by users.
+
+    Args:
+        search: dict of search terms as defined in wrapper/input_format.py
+        page: number of the page the user got
+        page_length: length of page or "max", see conduct_query
+        session: identifies the user, e.g. the review id. Nothing is prefetched without it,
+            since anonymous users would cancel each other's prefetches.
+
+    Returns:
+        the thread of the prefetch or None if there is nothing to prefetch
+    """
+    if PREFETCH_MODE != "thread" or session is None or len(get_wrappers()) == 0:
+        return None
+
+    key = query_key(search, page + 1, page_length)
+    if key in cache.results:
+        return None
+    if page_length != "max" and not get_allocator(search).allocate(page + 1, int(page_length)):
+        # all data bases are exhausted
+        return None
+
+    with prefetches_lock:
+        running = prefetches.get(session)
+        if running and running['key'] == key:
+            return running['thread']
+        if running:
+            running['deadline'].cancel()
+
+        entry = {
+            'search': search_key(search),
+            'key': key,
+            'deadline': Deadline(PREFETCH_TIMEOUT),
+        }
+
+        def run():
+            try:
+                results = query_page(search, page + 1, page_length, entry['deadline'],
+                                     wait_for_quota=False)
+                if not any(res.get('error') for res in results):
+                    cache.results.put(key, results)
+            except Exception as e:
+                print(f"Prefetching page {page + 1} failed: {e}")
+            finally:
+                with prefetches_lock:
+                    if prefetches.get(session) is entry:
+                        del prefetches[session]
+
+        entry['thread'] = threading.Thread(target=run, daemon=True)
+        prefetches[session] = entry
+        entry['thread'].start()
+
+    return entry['thread']
+
+
 def results_persisted_in_db(results: list, review: models.Review) -> list:
     """Mark all records that are already persisted in our data base.
 
@@ -159,31 +667,268 @@ def results_persisted_in_db(results: list, review: models.Review) -> list:
     return combined
 
 
+def select_fields(results: list, fields: tuple) -> list:
+    """Reduce the records of results to a sparse fieldset.
+
+    The results are not changed, they may be cached.
+
+    Args:
+        results: a list of results as returned by conduct_query.
+        fields: the fields to keep, see wrapper/record.py parse_fields
+
+    Returns:
+        copies of the results whose records only contain the fields
+    """
+    return [
+        dict(wrapper_results, records=[
+            Record.from_dict(record, fields) for record in wrapper_results.get('records') or []
+        ])
+        for wrapper_results in results
+    ]
+
+
+def start_position(db_wrapper, search: dict):
+    """Get the position of the first result of a data base.
+
+    Queries that are too long for a request are split into sub-queries (see
+    wrapper/planner.py), which is only possible when paging with start indices.
+
+    Args:
+        db_wrapper: object that implements the wrapper interface defined in wrapper/wrapper_interface.py
+        search: dict of search terms as defined in wrapper/input_format.py
+
+    Returns:
+        "*" (the first cursor) for wrappers that page with cursors, else the start index 1
+    """
+    if not db_wrapper.supports_cursor:
+        return 1
+
+    url, _, body = db_wrapper.call_api(search, dry=True)
+    max_length = db_wrapper.max_query_length
+    if max_length is not None and planner.request_length(url, body) > max_length:
+        return 1
+    return "*"
+
+
+def uses_cursor(position) -> bool:
+    """Return whether a position (see start_position) is a cursor rather than a start index."""
+    return isinstance(position, str)
+
+
+def fetch_position(db_wrapper, search: dict, position, num: int) -> dict:
+    """Fetch one page of a literature data base.
+
+    Args:
+        db_wrapper: object that implements the wrapper interface defined in wrapper/wrapper_interface.py
+        search: dict of search terms as defined in wrapper/input_format.py
+        position: cursor or start index (1-based) of the page, see start_position
+        num: length of page
+
+    Returns:
+        results as specified in wrapper/ouputFormat.py
+    """
+    # the wrappers are shared between threads
+    db_wrapper = copy.copy(db_wrapper)
+
+    db_wrapper.show_num = min(db_wrapper.max_records, num)
+    if uses_cursor(position):
+        db_wrapper.cursor = position
+    else:
+        db_wrapper.start_at(position)
+
+    return call_provider(db_wrapper, search)
+
+
+def next_position(db_wrapper, position, num: int, result: dict):
+    """Get the position of the page after a fetched page.
+
+    Args:
+        db_wrapper: object that implements the wrapper interface defined in wrapper/wrapper_interface.py
+        position: position of the fetched page
+        num: requested length of the fetched page
+        result: results of the fetched page as specified in wrapper/ouputFormat.py
+
+    Returns:
+        cursor or start index of the next page, None if the data base has no more results
+    """
+    if uses_cursor(position):
+        return result.get('result', {}).get('cursor')
+
+    if len(result.get('records') or []) < num:
+        return None
+    return position + num
+
+
+def iter_pages(db_wrapper, search: dict, position, max_num_results: int):
+    """Iterate over consecutive pages of one literature data base.
+
+    Cursor positions follow the cursor of each response, start indices are incremented by the
+    page length, see start_position.
+
+    Args:
+        db_wrapper: object that implements the wrapper interface defined in wrapper/wrapper_interface.py
+        search: dict of search terms as defined in wrapper/input_format.py
+        position: position of the first page, see start_position
+        max_num_results: roughly the maximum number of results
+
+    Yields:
+        ((<wrapper name>, <position>, <page length>), <results as specified in wrapper/ouputFormat.py>)
+    """
+    name = type(db_wrapper).__name__
+    num_results = 0
+
+    while position is not None and num_results < max_num_results:
+        num = min(db_wrapper.max_records, max_num_results - num_results)
+        result = fetch_position(db_wrapper, search, position, num)
+
+        yield (name, position, num), result
+
+        if result.get('error'):
+            return
+        num_results += len(result.get('records') or [])
+        position = next_position(db_wrapper, position, num, result)
+
+
 def persistent_query(query: models.Query, review: models.Review, max_num_results: int):
     """Conduct a query and persist it. Query until max_num_results is reached (at the end of the query).
 
+    The first page of every data base is requested to learn their totals. The results are
+    then split between the data bases like a page (see functions/paging.py) and harvested
+    concurrently, see functions/harvest.py. Data bases that page with cursors are harvested
+    sequentially.
+
+    The progress is stored in query.harvest_state whenever a page was persisted, so calling this
+    again with the same query resumes an interrupted harvest.
+
     Args:
         query: query-object
+        review: review-object
         max_num_results: roughly the maxmimum number of results (may overshoot a little)
 
     Returns:
-        TODO: maybe this could return the first page of results only?? This behavior needs to be defined
+        number of results persisted for this query
     """
-    num_results = 0
-    page = 1
+    wrappers = {type(w).__name__: w for w in get_wrappers()}
     search = query.search.to_son().to_dict()
 
-    while num_results < max_num_results:
-        results = conduct_query(search, page)
-
-        if not results:
-            print("Part of the query returned no results. Aborting.")
+    # {"<wrapper name>": {"position": <cursor or start>, "num_results": int, "total": int}}
+    # position is None when the data base is exhausted.
+    if query.harvest_state is None:
+        query.harvest_state = dict()
+    states = query.harvest_state
+    for name, db_wrapper in wrappers.items():
+        # states without a position have the former format ({"start", "cursor", ...}), their
+        # harvest starts over
+        if not isinstance(states.get(name), dict) or "position" not in states[name]:
+            states[name] = {"position": start_position(db_wrapper, search), "num_results": 0}
+
+    # pages that finished out of order: {"<wrapper name>": {<position>: (<next position>, <num>)}}
+    finished_pages = {name: {} for name in wrappers}
+
+    def persist(key, result):
+        name, position, num = key
+        if result.get('error'):
+            print(f"{name} returned an error: {result.get('error')}")
             return
 
-        for result in results:
-            num_results += int(result.get('result').get('recordsDisplayed'))
+        state = states[name]
+        try:
+            state["total"] = int(result.get('result', {}).get('total'))
+        except (TypeError, ValueError):
+            pass
+
+        records = result.get('records') or []
+        finished_pages[name][position] = (
+            next_position(wrappers[name], position, num, result), len(records))
+
+        # only the pages up to the first missing one count as progress
+        while state["position"] in finished_pages[name]:
+            state["position"], num_records = finished_pages[name].pop(state["position"])
+            state["num_results"] += num_records
+
+        # save_results saves the review and with it the new state of the query
+        connector.save_results(records, review, query)
+
+    # learn the totals
+    harvest.run_pipeline([
+        lambda db_wrapper=db_wrapper, position=states[name]["position"]: iter_pages(
+            db_wrapper, search, position,
+            min(db_wrapper.max_records, max_num_results // len(wrappers)))
+        for name, db_wrapper in wrappers.items()
+        if "total" not in states[name] and states[name]["position"] is not None
+    ], persist, max_workers=len(wrappers))
+
+    allocator = PageAllocator(list(wrappers))
+    for name in wrappers:
+        if states[name]["position"] is None:
+            allocator.set_total(name, states[name]["num_results"])
+        else:
+            allocator.set_total(name, states[name].get("total", -1))
+    shares = allocator.split({name: 0 for name in wrappers}, max_num_results)
+
+    tasks = []
+    for name, db_wrapper in wrappers.items():
+        position = states[name]["position"]
+        remaining = shares[name] - states[name]["num_results"]
+        if position is None or remaining <= 0:
+            continue
+
+        if uses_cursor(position):
+            tasks.append(lambda db_wrapper=db_wrapper, position=position, remaining=remaining:
+                         iter_pages(db_wrapper, search, position, remaining))
+            continue
+
+        for start in range(position, position + remaining, db_wrapper.max_records):
+            num = min(db_wrapper.max_records, position + remaining - start)
+            tasks.append(lambda db_wrapper=db_wrapper, start=start, num=num:
+                         iter_pages(db_wrapper, search, start, num))
+
+    harvest.run_pipeline(tasks, persist, max_workers=harvest.MAX_CONCURRENCY * len(wrappers))
+
+    return sum(states[name]["num_results"] for name in wrappers)
+
+
+def persist_pages(search: dict, pages: list, page_length: int, review: models.Review,
+                  query: models.Query, on_page=None, should_stop=None) -> int:
+    """Conduct a query for some logical pages and persist them.
+
+    The pages are fetched concurrently and persisted while the next pages are fetched,
+    see functions/harvest.py.
+
+    Args:
+        search: dict of search terms as defined in wrapper/input_format.py
+        pages: list of page numbers
+        page_length: length of page
+        review: review-object
+        query: query-object
+        on_page: (optional) function called with page number and number of persisted results
+            when a page was persisted
+        should_stop: (optional) function, stops the harvest when it returns True
+
+    Returns:
+        number of persisted results
+    """
+    num_persisted = 0
+
+    def persist(page, results):
+        nonlocal num_persisted
+        records = [record for result in results for record in result.get('records') or []]
+        connector.save_results(records, review, query)
+        num_persisted += len(records)
+        if on_page:
+            on_page(page, len(records))
+
+    def fetch(page):
+        return lambda: [(page, conduct_query(search, page, page_length))]
+
+    get_wrappers()
+    pages = list(pages)
+
+    # the first page teaches the allocator the totals, so the other pages don't overlap
+    if harvest.run_pipeline([fetch(page) for page in pages[:1]], persist, should_stop=should_stop):
+        harvest.run_pipeline([fetch(page) for page in pages[1:]], persist, should_stop=should_stop)
 
-            connector.save_results(result.get('records'), review, query)
+    return num_persisted
 
 
 if __name__ == '__main__':
@@ -205,7 +950,7 @@ if __name__ == '__main__':
 
     review = add_review("test REVIEW")
     query = new_query(review, search)
-    persistent_query(query, 250)
+    persistent_query(query, review, 250)
 
     review = connector.get_review_by_id("5ecd4bc497446f15f0a85f0d")
 
@@ -1,8 +1,14 @@
+import base64
 import json
+import math
 
-from bson import json_util
-
+from functions import compression
+from functions import harvest
+from functions import negotiation
+from functions import serializer
 from functions import slr
+from wrapper import deadline
+from wrapper import record
 from functions.db import connector
 
 # https://docs.aws.amazon.com/lambda/latest/dg/python-handler.html
@@ -10,7 +16,7 @@ from functions.db import connector
 
 # def sample_handler(event, *args):
 #     try:
-#         body = json.loads(event["body"])
+#         body = load_body(event)
 
 #         # these have to be defined in serverless.yml
 #         query_string = event.get('queryStringParameters').get('my_query_string')
@@ -24,27 +30,119 @@ from functions.db import connector
 #         return make_response(status_code=500, body={"error": error})
 
 
-def make_response(status_code: int, body: dict):
+def make_response(status_code: int, body: dict, event: dict = None):
     """Makes response dict
 
     Args:
         status_code: http status code
         body: json serializable http response body
+        event: (optional) lambda event of the request. The body is serialised as MessagePack if
+            its Accept header asks for it and large bodies are compressed if its
+            Accept-Encoding header allows it.
 
     Returns:
         lambda response dict
     """
+    headers = {
+        'Access-Control-Allow-Headers': 'Content-Type, authorizationToken',
+        'Access-Control-Allow-Origin': '*',
+        'Access-Control-Allow-Methods': 'OPTIONS,POST,GET'
+    }
+
+    if event is None:
+        return {
+            "statusCode": status_code,
+            "headers": headers,
+            "body": serializer.dumps(body),
+            "isBase64Encoded": False,
+        }
+
+    accept = negotiation.get_header(event, 'Accept')
+    if compression.decodes_base64(accept):
+        media_type = serializer.negotiate(accept)
+        accept_encoding = negotiation.get_header(event, 'Accept-Encoding')
+    else:
+        # binary bodies would reach the client base64 encoded
+        media_type, accept_encoding = serializer.JSON, None
+    body, encoding_headers, is_base64_encoded = compression.encode_body(
+        serializer.MEDIA_TYPES[media_type](body), accept_encoding)
+    headers.update(encoding_headers)
+    headers['Content-Type'] = media_type
+    # caches have to tell the responses for different Accept headers apart
+    headers['Vary'] = 'Accept, Accept-Encoding'
+
     return {
         "statusCode": status_code,
-        "headers": {
-            'Access-Control-Allow-Headers': 'Content-Type, authorizationToken',
-            'Access-Control-Allow-Origin': '*',
-            'Access-Control-Allow-Methods': 'OPTIONS,POST,GET'
-        },
-        "body": json.dumps(body, default=json_util.default)
+        "headers": headers,
+        "body": body,
+        "isBase64Encoded": is_base64_encoded,
     }
 
 
+def load_body(event) -> dict:
+    """Loads the json body of a request
+
+    API Gateway base64 encodes the bodies of requests whose Content-Type is one of the binary
+    media types needed for compressed responses, e.g. application/json (see serverless.yml).
+
+    Args:
+        event: lambda event
+
+    Returns:
+        the parsed body
+    """
+    body = event["body"]
+    if event.get("isBase64Encoded"):
+        body = base64.b64decode(body)
+    return json.loads(body)
+
+
+def request_deadline(event, context) -> deadline.Deadline:
+    """Get the deadline for answering a request
+
+    The deadline is set by the remaining time of the lambda function or by the
+    optional query string parameter "timeout" (seconds), whichever is earlier.
+
+    Args:
+        event: lambda event
+        context: lambda context or None
+
+    Returns:
+        deadline or None if there is no time limit
+
+    Raises:
+        ValueError: if the timeout is not a finite, positive number
+    """
+    timeout = (event.get('queryStringParameters') or {}).get('timeout')
+    if timeout is not None:
+        try:
+            seconds = float(timeout)
+        except ValueError:
+            seconds = math.nan
+        if not math.isfinite(seconds) or seconds <= 0:
+            raise ValueError(f"Invalid timeout {timeout}: must be a positive number of seconds.")
+        timeout = deadline.Deadline(seconds)
+
+    return deadline.earliest(deadline.Deadline.from_context(context), timeout)
+
+
+def requested_fields(event, allowed: tuple = record.FIELDS) -> tuple:
+    """Get the sparse fieldset of a request
+
+    Args:
+        event: lambda event with the optional query string parameter "fields", e.g.
+            "fields=title,authors,publicationDate"
+        allowed: the fields that may be requested
+
+    Returns:
+        the requested fields or None if all fields are wanted
+
+    Raises:
+        ValueError: if a field is not allowed
+    """
+    return record.parse_fields((event.get('queryStringParameters') or {}).get('fields'), allowed)
+
+
 def add_collaborator_to_review(event, *args):
     """Handles requests to add collaborators to a review
 
@@ -65,7 +163,7 @@ def add_collaborator_to_review(event, *args):
     resp_body = {
         "updated_result": updated_result.to_son().to_dict()
     }
-    return make_response(status_code=201, body=resp_body)
+    return make_response(status_code=201, body=resp_body, event=event)
 
 
 def get_reviews_for_user(event, *args):
@@ -85,14 +183,14 @@ def get_reviews_for_user(event, *args):
     resp_body = {
         "reviews": reviews
     }
-    return make_response(status_code=201, body=resp_body)
+    return make_response(status_code=201, body=resp_body, event=event)
 
 
 def dry_query(event, *args):
     """Handles running a dry query
 
     Args:
-        url: dry_query?page&page_length&review_id
+        url: dry_query?page&page_length&review_id&timeout&fields
         body:
             search: search dict <wrapper/input_format.py>
 
@@ -102,7 +200,7 @@ def dry_query(event, *args):
         }
     """
     # try:
-    body = json.loads(event["body"])
+    body = load_body(event)
     search = body.get('search')
     try:
         page = int(event.get('queryStringParameters').get('page', 1))
@@ -115,8 +213,25 @@ def dry_query(event, *args):
     except AttributeError:
         page_length = 50
 
+    try:
+        fields = requested_fields(event)
+    except ValueError as e:
+        return make_response(status_code=400, body={"error": str(e)}, event=event)
+
+    try:
+        deadline = request_deadline(event, args[0] if args else None)
+    except ValueError as e:
+        return make_response(status_code=400, body={"error": str(e)}, event=event)
+
+    # the next page is prefetched for the user (if enabled), unless they change the search.
+    # Anonymous requests have no session and are not prefetched.
+    session = (event.get('queryStringParameters') or {}).get('review_id') \
+        or (event.get('headers') or {}).get('authorizationToken')
+    if session:
+        slr.cancel_prefetch(session, search)
 
-    results = slr.conduct_query(search, page, page_length)
+    # data bases that do not respond in time are marked as timed out in their results
+    results = slr.conduct_query(search, page, page_length, deadline)
 
     # (optionally) mark previously persisted results
     try:
@@ -127,11 +242,43 @@ def dry_query(event, *args):
     except AttributeError:
         pass
 
-    return make_response(status_code=201, body=results)
+    # the records are formatted completely, so that the cached pages serve all fieldsets
+    if fields:
+        results = slr.select_fields(results, fields)
+
+    if session:
+        slr.prefetch(search, page, page_length, session)
+
+    return make_response(status_code=201, body=results, event=event)
     # except Exception as e:
     #     return make_response(status_code=500, body={"error": e})
 
 
+def count_query(event, *args):
+    """Handles counting the results of a query without fetching them
+
+    Args:
+        url: query/count?timeout
+        body:
+            search: search dict <wrapper/input_format.py>
+
+    Returns:
+        {
+            <see functions/slr.py count_query>
+        }
+    """
+    body = load_body(event)
+    search = body.get('search')
+
+    try:
+        deadline = request_deadline(event, args[0] if args else None)
+    except ValueError as e:
+        return make_response(status_code=400, body={"error": str(e)}, event=event)
+    counts = slr.count_query(search, deadline)
+
+    return make_response(status_code=200, body=counts, event=event)
+
+
 def new_query(event, *args):
     """Add new query session <kind of deprecated>
 
@@ -147,7 +294,7 @@ def new_query(event, *args):
         }
     """
     # try:
-    body = json.loads(event["body"])
+    body = load_body(event)
 
     review_id = event.get('pathParameters').get('review_id')
     review = connector.get_review_by_id(review_id)
@@ -161,7 +308,7 @@ def new_query(event, *args):
         "new_query_id": new_query._id
     }
 
-    return make_response(status_code=201, body=resp_body)
+    return make_response(status_code=201, body=resp_body, event=event)
     # except Exception as e:
     #     return make_response(status_code=500, body={"error": str(e)})
 
@@ -170,7 +317,7 @@ def get_persisted_results(event, *args):
     """Handles getting persisted results
 
     Args:
-        url: results/{review_id}?page=1&page_length=50&query_id
+        url: results/{review_id}?page=1&page_length=50&query_id&fields
 
     Returns:
         {
@@ -198,19 +345,47 @@ def get_persisted_results(event, *args):
     except AttributeError:
         query_id = None
 
+    try:
+        fields = requested_fields(event, connector.RESULT_FIELDS)
+    except ValueError as e:
+        return make_response(status_code=400, body={"error": str(e)}, event=event)
+
     if query_id != None:
         obj = connector.get_query_by_id(review, query_id)
     else:
         obj = review
 
     # this works for either query or reviews. use whatever is given to us
-    results = connector.get_persisted_results(obj, page, page_length)
+    results = connector.get_persisted_results(obj, page, page_length, fields)
 
-    return make_response(status_code=200, body=results)
+    return make_response(status_code=200, body=results, event=event)
     # except Exception as e:
     #     return make_response(status_code=500, body={"error": str(e)})
 
 
+def get_facets(event, *args):
+    """Handles getting the facets of persisted results
+
+    Args:
+        url: results/{review_id}/facets
+
+    Returns:
+        {
+            "countries": {"<ISO 3166-1 alpha-2 code>": <counter of Scopus results>},
+            "keywords": [{"text": "<keyword>", "value": <counter>}],
+            "years": {"<year>": <counter>},
+            "publishers": {"<publisher>": <counter>},
+            "contentTypes": {"<content type>": <counter>}
+        }
+    """
+    review_id = event.get('pathParameters').get('review_id')
+    review = connector.get_review_by_id(review_id)
+
+    facets = connector.get_facets(review)
+
+    return make_response(status_code=200, body=facets, event=event)
+
+
 def persist_pages_of_query(event, *args):
     """Handles persisting a range of pages of a dry query.
 
@@ -229,36 +404,127 @@ def persist_pages_of_query(event, *args):
         }
     """
     # try:
-    body = json.loads(event["body"])
+    body = load_body(event)
 
     review_id = event.get('pathParameters').get('review_id')
     review = connector.get_review_by_id(review_id)
 
+    try:
+        pages, page_length = harvest.validate_pages(body.get('pages'), body.get('page_length'))
+    except ValueError as e:
+        return make_response(status_code=400, body={"error": str(e)}, event=event)
+
     search = body.get('search')
     query = connector.new_query(review, search)
 
-    pages = body.get('pages')
-
-    page_length = body.get('page_length')
-
-    num_persisted = 0
-    for page in pages:
-        results = slr.conduct_query(search, page, page_length)
-        for wrapper_results in results:
-            connector.save_results(
-                wrapper_results.get('records'), review, query)
-            num_persisted += len(wrapper_results.get('records'))
+    num_persisted = slr.persist_pages(search, pages, page_length, review, query)
 
     resp_body = {
         "success": True,
         "num_persisted": num_persisted,
         "query_id": query._id
     }
-    return make_response(status_code=200, body=resp_body)
+    return make_response(status_code=200, body=resp_body, event=event)
     # except Exception as e:
     #     return make_response(status_code=500, body={"error": str(e)})
 
 
+def harvest_job_response(job) -> dict:
+    """Makes the response body for a harvest job
+
+    Args:
+        job: HarvestJob object
+
+    Returns:
+        job as dict with the additional field "progress" (completed pages / pages)
+    """
+    job_dict = job.to_son().to_dict()
+    job_dict["progress"] = len(job.completed_pages) / len(job.pages) if job.pages else 1.0
+    return job_dict
+
+
+def enqueue_harvest_job(event, *args):
+    """Handles persisting a range of pages of a dry query in the background.
+
+    Args:
+        url: persist/{review_id}/jobs
+        body:
+            pages: [1, 3, 4, 6] list of pages
+            page_length: int
+            search <search dict (wrapper/input_format.py)>
+
+    Returns:
+        {
+            "job": <job with progress>,
+            "query_id": query.pk
+        }
+    """
+    body = load_body(event)
+
+    try:
+        pages, page_length = harvest.validate_pages(body.get('pages'), body.get('page_length'))
+    except ValueError as e:
+        return make_response(status_code=400, body={"error": str(e)}, event=event)
+
+    review_id = event.get('pathParameters').get('review_id')
+    review = connector.get_review_by_id(review_id)
+
+    search = body.get('search')
+    query = connector.new_query(review, search)
+
+    job = connector.add_harvest_job(review, query, pages, page_length)
+
+    resp_body = {
+        "job": harvest_job_response(job),
+        "query_id": query._id
+    }
+    return make_response(status_code=202, body=resp_body, event=event)
+
+
+def get_harvest_job(event, *args):
+    """Handles getting the status and progress of a harvest job.
+
+    Args:
+        url: jobs/{job_id}
+
+    Returns:
+        {
+            "job": <job with progress>
+        }
+    """
+    job_id = event.get('pathParameters').get('job_id')
+    job = connector.get_harvest_job_by_id(job_id)
+
+    if job is None:
+        return make_response(status_code=404, body={"error": f"Job {job_id} not found"},
+                             event=event)
+
+    return make_response(status_code=200, body={"job": harvest_job_response(job)}, event=event)
+
+
+def cancel_harvest_job(event, *args):
+    """Handles cancelling a harvest job. Pages persisted so far are kept.
+
+    Args:
+        url: jobs/{job_id}
+
+    Returns:
+        {
+            "job": <job with progress>
+        }
+    """
+    job_id = event.get('pathParameters').get('job_id')
+    job = connector.get_harvest_job_by_id(job_id)
+
+    if job is None:
+        return make_response(status_code=404, body={"error": f"Job {job_id} not found"},
+                             event=event)
+
+    job = connector.cancel_harvest_job(job)
+
+    return make_response(status_code=200, body={"job": harvest_job_response(job)}, event=event)
+
+
 def persist_list_of_results(event, *args):
     """Handles persisting results
 
@@ -274,7 +540,7 @@ def persist_list_of_results(event, *args):
         }
     """
     # try:
-    body = json.loads(event["body"])
+    body = load_body(event)
 
     results = body.get('results')
 
@@ -290,7 +556,7 @@ def persist_list_of_results(event, *args):
         "success": True,
         "query_id": query._id
     }
-    return make_response(status_code=201, body=resp_body)
+    return make_response(status_code=201, body=resp_body, event=event)
     # except Exception as e:
     #     return make_response(status_code=500, body={"error": str(e)})
 
@@ -309,7 +575,7 @@ def delete_results_by_dois(event, body):
         }
     """
     # try:
-    body = json.loads(event["body"])
+    body = load_body(event)
 
     dois = body.get('dois')
 
@@ -321,7 +587,7 @@ def delete_results_by_dois(event, body):
     resp_body = {
         "success": True
     }
-    return make_response(status_code=200, body=resp_body)
+    return make_response(status_code=200, body=resp_body, event=event)
     # except Exception as e:
     #     return make_response(status_code=500, body={"error": str(e)})
 
@@ -332,7 +598,7 @@ def add_review(event, *args):
     """
     from functions.db.connector import add_review
 
-    body = json.loads(event["body"])
+    body = load_body(event)
 
     owner_name = body.get('owner_name')
     owner = connector.get_user_by_username(owner_name)
@@ -342,7 +608,7 @@ def add_review(event, *args):
 
     review = add_review(name, description, owner=owner)
 
-    return make_response(201, review.to_son().to_dict())
+    return make_response(201, review.to_son().to_dict(), event=event)
 
 
 def get_review_by_id(event, *args):
@@ -356,7 +622,7 @@ def get_review_by_id(event, *args):
 
     review = get_review_by_id(review_id)
 
-    return make_response(200, review.to_son().to_dict())
+    return make_response(200, review.to_son().to_dict(), event=event)
 
 
 def delete_review(event, *args):
@@ -369,7 +635,7 @@ def delete_review(event, *args):
 
     delete_review(review_id)
 
-    return make_response(204, dict())
+    return make_response(204, dict(), event=event)
 
 
 def update_review(event, *args):
@@ -379,19 +645,19 @@ def update_review(event, *args):
     from functions.db.connector import update_review
 
     review_id = event.get('pathParameters').get('review_id')
-    body = json.loads(event["body"])
+    body = load_body(event)
     name = body.get('review').get('name')
     description = body.get('review').get('description')
     updated_review = update_review(review_id, name, description)
 
-    return make_response(200, updated_review.to_son().to_dict())
+    return make_response(200, updated_review.to_son().to_dict(), event=event)
 
 
 def add_user_handler(event, *args):
     from functions.db.connector import add_user
     from bson import json_util
 
-    body = json.loads(event["body"])
+    body = load_body(event)
     username = body.get('username')
     name = body.get('name')
     surname = body.get('surname')
@@ -399,7 +665,7 @@ def add_user_handler(event, *args):
     password = body.get('password')
     added_user = add_user(username, name, surname, email, password)
 
-    return make_response(201, added_user.to_son().to_dict())
+    return make_response(201, added_user.to_son().to_dict(), event=event)
 
 
 def get_user_by_username_handler(event, *args):
@@ -408,7 +674,7 @@ def get_user_by_username_handler(event, *args):
     username = event.get('pathParameters').get('username')
     user = get_user_by_username(username)
 
-    return make_response(200, user.to_son().to_dict())
+    return make_response(200, user.to_son().to_dict(), event=event)
 
 
 def get_all_users_handler(event, *args):
@@ -416,13 +682,13 @@ def get_all_users_handler(event, *args):
 
     users = get_users()
 
-    return make_response(200, users)
+    return make_response(200, users, event=event)
 
 
 def update_user_handler(event, *args):
     from functions.db.connector import update_user, get_user_by_username
 
-    body = json.loads(event["body"])
+    body = load_body(event)
     username = body.get('username')
     name = body.get('name')
     surname = body.get('surname')
@@ -432,7 +698,7 @@ def update_user_handler(event, *args):
     user = get_user_by_username(username)
     updated_user = update_user(user, name, surname, email, password)
 
-    return make_response(200, updated_user.to_son().to_dict())
+    return make_response(200, updated_user.to_son().to_dict(), event=event)
 
 
 def add_api_key_to_user_handler(event, *args):
@@ -442,14 +708,14 @@ def add_api_key_to_user_handler(event, *args):
     token = headers.get('authorizationToken')
     user = get_user_by_username(get_username_from_jwt(token))
 
-    body = json.loads(event["body"])
+    body = load_body(event)
 
     api_key = body.get('db_name')
     db_name = body.get('api_key')
 
     add_api_key_to_user(user, body)
 
-    return make_response(201, dict())
+    return make_response(201, dict(), event=event)
 
 
 def delete_user_handler(event, *args):
@@ -460,14 +726,14 @@ def delete_user_handler(event, *args):
     user_to_delete = get_user_by_username(username)
     delete_user(user_to_delete)
 
-    return make_response(200, dict())
+    return make_response(200, dict(), event=event)
 
 
 def login_handler(event, *args):
     from functions.db.connector import get_user_by_username, check_if_password_is_correct, add_jwt_to_session
     from functions.authentication import get_jwt_for_user
 
-    body = json.loads(event["body"])
+    body = load_body(event)
     username = body.get('username')
     password = body.get('password')
     user = get_user_by_username(username)
@@ -476,9 +742,9 @@ def login_handler(event, *args):
     if password_correct:
         token = get_jwt_for_user(user)
         add_jwt_to_session(user, token)
-        return make_response(200, token)
+        return make_response(200, token, event=event)
     else:
-        return make_response(401, "Authentication failed")
+        return make_response(401, "Authentication failed", event=event)
 
 
 def logout_handler(event, *args):
@@ -492,9 +758,9 @@ def logout_handler(event, *args):
         username = get_username_from_jwt(token)
         user = get_user_by_username(username)
         remove_jwt_from_session(user)
-        return make_response(200, "Successfully logged out")
+        return make_response(200, "Successfully logged out", event=event)
     else:
-        return make_response(401, "Authentication failed")
+        return make_response(401, "Authentication failed", event=event)
 
 
 def check_jwt_handler(event, *args):
@@ -504,9 +770,9 @@ def check_jwt_handler(event, *args):
     headers = event["headers"]
     token = headers.get('authorizationToken')
     if check_for_token(token) and check_if_jwt_is_in_session(token):
-        return make_response(200, token)
+        return make_response(200, token, event=event)
     else:
-        return make_response(401, "Authentication failed")
+        return make_response(401, "Authentication failed", event=event)
 
 
 def update_score(event, *args):
@@ -526,7 +792,7 @@ def update_score(event, *args):
             }
         }
     """
-    body = json.loads(event["body"])
+    body = load_body(event)
 
     review_id = event.get('pathParameters').get('review_id')
     review = connector.get_review_by_id(review_id)
@@ -547,7 +813,7 @@ def update_score(event, *args):
     updated_result = connector.update_score(review, result, evaluation)
 
     resp_body = {
-        "result": updated_result.to_son().to_dict()
+        "result": updated_result.to_dict()
     }
 
-    return make_response(status_code=201, body=resp_body)
\ No newline at end of file
+    return make_response(status_code=201, body=resp_body, event=event)
\ No newline at end of file
@@ -0,0 +1,43 @@
+import unittest
+
+from bson import BSON
+from bson.binary import Binary
+
+from functions.db import compressed_field
+from functions.db.models import Result
+
+abstract = "Blockchain technology is applied to the energy sector. " * 20
+
+
+class TestCompressedField(unittest.TestCase):
+    def test_long_texts_are_compressed(self):
+        result = Result(doi="10.1/1", persisted=True, title="Title", abstract=abstract)
+        son = result.to_son()
+
+        self.assertIsInstance(son["abstract"], Binary)
+        self.assertEqual(son["abstract"].subtype, compressed_field.COMPRESSED_SUBTYPE)
+        self.assertLess(len(son["abstract"]), len(abstract) / 5)
+        self.assertEqual(son["title"], "Title")
+        self.assertEqual(result.abstract, abstract)
+        self.assertEqual(result.to_dict()["abstract"], abstract)
+
+    def test_round_trip(self):
+        document = BSON.encode(Result(doi="10.1/1", persisted=True, abstract=abstract).to_son())
+        result = Result.from_document(BSON(document).decode())
+
+        self.assertEqual(result.abstract, abstract)
+        self.assertEqual(result.to_dict()["abstract"], abstract)
+
+    def test_short_and_uncompressed_texts(self):
+        result = Result(doi="10.1/1", persisted=True, copyright="© 2020")
+
+        self.assertEqual(result.to_son()["copyright"], "© 2020")
+
+        # documents written before the field was compressed
+        result = Result.from_document({"_id": "10.1/1", "persisted": True, "abstract": abstract})
+        self.assertEqual(result.abstract, abstract)
+        self.assertIsInstance(result.to_son()["abstract"], Binary)
+
+
+if __name__ == '__main__':
+    unittest.main()
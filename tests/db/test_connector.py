@@ -111,6 +111,51 @@ class TestConnector(unittest.TestCase):
         num_results = len(get_dois_for_review(self.review))
         self.assertEquals(num_results, 0)
 
+    def test_get_facets(self):
+        records = self.results.get('records')
+        facets = get_facets(self.review)
+
+        self.assertEqual(sum(facets.get('publishers').values()), len(records))
+
+        # saving the same results again must not change the counters
+        save_results(records, self.review, new_query(self.review, sample_search))
+        self.assertEqual(get_facets(self.review), facets)
+
+        delete_results_by_dois(self.review, [records[0].get('doi')])
+        facets = get_facets(self.review)
+        self.assertEqual(sum(facets.get('publishers').values()), len(records) - 1)
+
+        delete_results_for_review(self.review)
+        self.assertEqual(get_facets(self.review).get('publishers'), {})
+
+    def test_harvest_job(self):
+        job = add_harvest_job(self.review, self.sample_query, [1, 2, 3], 20)
+        self.assertEqual(job.status, "queued")
+
+        claimed = claim_harvest_job(stale_after=300)
+        self.assertEqual(claimed._id, job._id)
+        self.assertEqual(claimed.status, "running")
+        self.assertIsNone(claim_harvest_job(stale_after=300))
+
+        update_harvest_job_progress(claimed, 1, 20)
+        # a page completed twice is counted once
+        update_harvest_job_progress(claimed, 1, 20)
+        self.assertEqual(claimed.completed_pages, [1])
+        self.assertEqual(claimed.num_persisted, 20)
+
+        # a worker that stopped updating the job is replaced
+        resumed = claim_harvest_job(stale_after=0)
+        self.assertEqual(resumed._id, job._id)
+        self.assertEqual(resumed.completed_pages, [1])
+
+        cancel_harvest_job(job)
+        self.assertTrue(is_harvest_job_cancelled(resumed))
+
+        finish_harvest_job(resumed, "done")
+        self.assertEqual(resumed.status, "cancelled")
+
+        job.delete()
+
     def tearDown(self):
         delete_results_for_review(self.review)
         self.review.delete()
@@ -0,0 +1,38 @@
+import time
+import unittest
+
+from functions.cache import ResultCache
+
+
+class TestResultCache(unittest.TestCase):
+    def test_get_returns_copies(self):
+        cache = ResultCache()
+        results = [{"records": [1, 2]}]
+        cache.put("key", results)
+        results[0]["records"].append(3)
+
+        cached = cache.get("key")
+        self.assertEqual(cached, [{"records": [1, 2]}])
+        cached[0]["records"].clear()
+        self.assertEqual(cache.get("key"), [{"records": [1, 2]}])
+
+    def test_entries_expire(self):
+        cache = ResultCache(ttl=0.05)
+        cache.put("key", 1)
+        self.assertIn("key", cache)
+
+        time.sleep(0.1)
+        self.assertNotIn("key", cache)
+        self.assertIsNone(cache.get("key"))
+
+    def test_oldest_entry_is_dropped(self):
+        cache = ResultCache(max_entries=2)
+        for key in range(3):
+            cache.put(key, key)
+
+        self.assertIsNone(cache.get(0))
+        self.assertEqual(cache.get(2), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,62 @@
+import base64
+import gzip
+import json
+import unittest
+
+from functions import compression
+
+large_body = json.dumps({"records": [{"abstract": "Blockchain " * 50}] * 20})
+
+
+class TestCompression(unittest.TestCase):
+    def test_negotiate(self):
+        self.assertIsNone(compression.negotiate(None))
+        self.assertIsNone(compression.negotiate("identity"))
+        self.assertIsNone(compression.negotiate("gzip;q=0"))
+        self.assertEqual(compression.negotiate("deflate, gzip"), "gzip")
+        self.assertEqual(compression.negotiate("br;q=0.5, gzip;q=0.8"), "gzip")
+        if compression.brotli is not None:
+            self.assertEqual(compression.negotiate("gzip, deflate, br"), "br")
+            self.assertEqual(compression.negotiate("*"), "br")
+
+    def test_large_bodies_are_compressed(self):
+        body, headers, is_base64_encoded = compression.encode_body(large_body, "gzip")
+
+        self.assertTrue(is_base64_encoded)
+        self.assertEqual(headers["Content-Encoding"], "gzip")
+        compressed = base64.b64decode(body)
+        self.assertLess(len(compressed), len(large_body) / 10)
+        self.assertEqual(gzip.decompress(compressed).decode(), large_body)
+
+    @unittest.skipIf(compression.brotli is None, "brotli is not installed")
+    def test_brotli(self):
+        body, headers, _ = compression.encode_body(large_body, "br")
+
+        self.assertEqual(headers["Content-Encoding"], "br")
+        self.assertEqual(compression.brotli.decompress(base64.b64decode(body)).decode(), large_body)
+
+    def test_small_bodies_are_not_compressed(self):
+        body, headers, is_base64_encoded = compression.encode_body('{"total": 1}', "gzip")
+
+        self.assertEqual(body, '{"total": 1}')
+        self.assertFalse(is_base64_encoded)
+        self.assertNotIn("Content-Encoding", headers)
+
+    def test_binary_bodies_are_base64_encoded(self):
+        body, headers, is_base64_encoded = compression.encode_body(b"\x81\xa5total\x01", None)
+
+        self.assertTrue(is_base64_encoded)
+        self.assertEqual(base64.b64decode(body), b"\x81\xa5total\x01")
+        self.assertNotIn("Content-Encoding", headers)
+
+    def test_decodes_base64(self):
+        self.assertTrue(compression.decodes_base64("application/json"))
+        self.assertTrue(compression.decodes_base64("application/msgpack, application/json;q=0.5"))
+        # only the first media type counts
+        self.assertFalse(compression.decodes_base64("*/*"))
+        self.assertFalse(compression.decodes_base64("text/html, application/json"))
+        self.assertFalse(compression.decodes_base64(None))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -115,5 +115,21 @@ class TestHandlers(unittest.TestCase):
         self.review.delete()
 
 
+class TestRequestDeadline(unittest.TestCase):
+    def test_timeout(self):
+        deadline = handler.request_deadline({"queryStringParameters": {"timeout": "5"}}, None)
+        self.assertAlmostEqual(deadline.remaining(), 5, delta=1)
+        self.assertIsNone(handler.request_deadline({"queryStringParameters": None}, None))
+
+    def test_invalid_timeouts_are_rejected(self):
+        for timeout in ["0", "-1", "nan", "inf", "soon"]:
+            with self.subTest(timeout=timeout):
+                event = {"body": json.dumps({"search": sample_search}),
+                         "queryStringParameters": {"timeout": timeout}}
+                with self.assertRaises(ValueError):
+                    handler.request_deadline(event, None)
+                self.assertEqual(handler.count_query(event)["statusCode"], 400)
+
+
 if __name__ == '__main__':
     unittest.main()
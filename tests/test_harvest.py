@@ -0,0 +1,100 @@
+import threading
+import time
+import unittest
+
+from functions import harvest
+from wrapper.deadline import Deadline
+
+
+class TestPipeline(unittest.TestCase):
+    def test_all_pages_are_persisted(self):
+        persisted = []
+        tasks = [lambda page=page: [(page, [page])] for page in range(20)]
+
+        finished = harvest.run_pipeline(tasks, lambda key, results: persisted.append(key),
+                                        max_workers=4)
+
+        self.assertTrue(finished)
+        self.assertEqual(sorted(persisted), list(range(20)))
+
+    def test_fetching_is_concurrent(self):
+        running = []
+        max_running = []
+        lock = threading.Lock()
+
+        def fetch(page):
+            with lock:
+                running.append(page)
+                max_running.append(len(running))
+            time.sleep(0.05)
+            with lock:
+                running.remove(page)
+            return [(page, [])]
+
+        tasks = [lambda page=page: fetch(page) for page in range(8)]
+        harvest.run_pipeline(tasks, lambda key, results: None, max_workers=4)
+
+        self.assertEqual(max(max_running), 4)
+
+    def test_stop(self):
+        persisted = []
+        tasks = [lambda page=page: [(page, [])] for page in range(50)]
+
+        finished = harvest.run_pipeline(
+            tasks, lambda key, results: persisted.append(key), max_workers=2,
+            should_stop=lambda: len(persisted) >= 3)
+
+        self.assertFalse(finished)
+        self.assertEqual(len(persisted), 3)
+
+    def test_failing_persist_does_not_block(self):
+        def persist(key, results):
+            raise RuntimeError("db down")
+
+        tasks = [lambda page=page: [(page, [])] for page in range(50)]
+
+        with self.assertRaises(RuntimeError):
+            harvest.run_pipeline(tasks, persist, max_workers=2)
+
+
+class TestRunConcurrently(unittest.TestCase):
+    def test_results_after_deadline_are_dropped(self):
+        calls = {
+            "fast": lambda: "fast result",
+            "slow": lambda: time.sleep(0.5) or "slow result",
+        }
+
+        started = time.monotonic()
+        finished = harvest.run_concurrently(calls, Deadline(0.1))
+
+        self.assertLess(time.monotonic() - started, 0.4)
+        self.assertEqual(finished, {"fast": "fast result"})
+
+    def test_cancelled_deadline_stops_waiting(self):
+        deadline = Deadline(10)
+        threading.Timer(0.1, deadline.cancel).start()
+
+        started = time.monotonic()
+        finished = harvest.run_concurrently({"slow": lambda: time.sleep(1)}, deadline)
+
+        self.assertLess(time.monotonic() - started, 0.5)
+        self.assertEqual(finished, {})
+
+    def test_without_deadline_all_results_are_awaited(self):
+        calls = {i: lambda i=i: time.sleep(0.01) or i for i in range(5)}
+
+        self.assertEqual(harvest.run_concurrently(calls), {i: i for i in range(5)})
+
+    def test_validate_pages(self):
+        self.assertEqual(harvest.validate_pages([3, 1, 3], 25), ([3, 1], 25))
+
+        for pages, page_length in [([1], 0), ([1], "25"), ([1], harvest.MAX_PAGE_LENGTH + 1),
+                                   ([], 25), (None, 25), ([0], 25), (["1"], 25), ([1.5], 25),
+                                   (list(range(1, harvest.MAX_PAGES + 2)), 25)]:
+            with self.subTest(pages=pages, page_length=page_length):
+                with self.assertRaises(ValueError):
+                    harvest.validate_pages(pages, page_length)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,37 @@
+import unittest
+
+from functions import negotiation
+
+
+class TestNegotiation(unittest.TestCase):
+    def test_header_case(self):
+        event = {"headers": {"accept-encoding": "gzip"}}
+
+        self.assertEqual(negotiation.get_header(event, "Accept-Encoding"), "gzip")
+        self.assertIsNone(negotiation.get_header({"headers": None}, "Accept-Encoding"))
+
+    def test_quality_values(self):
+        self.assertEqual(
+            negotiation.quality_values("application/msgpack, application/json; q=0.5, text/*;q=x"),
+            {"application/msgpack": 1.0, "application/json": 0.5, "text/*": 0.0}
+        )
+
+    def test_choose(self):
+        offers = ["application/json", "application/msgpack"]
+
+        self.assertIsNone(negotiation.choose(None, offers))
+        self.assertIsNone(negotiation.choose("text/html", offers))
+        self.assertEqual(negotiation.choose("application/msgpack", offers), "application/msgpack")
+        self.assertEqual(negotiation.choose("*/*", offers), "application/json")
+        self.assertEqual(
+            negotiation.choose("application/*;q=0.5, application/msgpack", offers),
+            "application/msgpack"
+        )
+        self.assertEqual(
+            negotiation.choose("application/msgpack;q=0, */*", offers), "application/json"
+        )
+        self.assertEqual(negotiation.choose("deflate, *;q=0.1", ["gzip"]), "gzip")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,68 @@
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+from functions.paging import PageAllocator
+
+
+class TestPageAllocator(unittest.TestCase):
+    def setUp(self):
+        self.allocator = PageAllocator(["ElsevierWrapper", "SpringerWrapper"])
+
+    def test_even_split_with_remainder(self):
+        allocation = self.allocator.allocate(1, 25)
+
+        self.assertEqual(allocation["ElsevierWrapper"], (1, 13))
+        self.assertEqual(allocation["SpringerWrapper"], (1, 12))
+
+    def test_deep_page_offsets(self):
+        allocation = self.allocator.allocate(3, 20)
+
+        self.assertEqual(allocation["ElsevierWrapper"], (21, 10))
+        self.assertEqual(allocation["SpringerWrapper"], (21, 10))
+
+    def test_exhausted_provider_is_skipped(self):
+        self.allocator.set_total("ElsevierWrapper", 15)
+
+        # page 1: 10 + 10, page 2: 5 + 15, page 3: 0 + 20
+        self.assertEqual(self.allocator.allocate(2, 20),
+                         {"ElsevierWrapper": (11, 5), "SpringerWrapper": (11, 15)})
+        self.assertEqual(self.allocator.allocate(3, 20),
+                         {"SpringerWrapper": (26, 20)})
+
+    def test_pages_are_full_until_all_are_exhausted(self):
+        self.allocator.set_total("ElsevierWrapper", 7)
+        self.allocator.set_total("SpringerWrapper", 30)
+
+        sizes = [sum(num for _, num in self.allocator.allocate(page, 10).values())
+                 for page in range(1, 6)]
+
+        self.assertEqual(sizes, [10, 10, 10, 7, 0])
+
+    def test_update_learns_total_from_short_page(self):
+        result = {"result": {"total": "5000"}, "records": [{}] * 3}
+        self.allocator.update("ElsevierWrapper", 101, 10, result)
+
+        self.assertEqual(self.allocator.totals["ElsevierWrapper"], 103)
+
+    def test_concurrent_updates(self):
+        unknown = self.allocator.allocate(3, 20)
+        self.allocator.set_total("ElsevierWrapper", 15)
+        exhausted = self.allocator.allocate(3, 20)
+        self.allocator.set_total("ElsevierWrapper", -1)
+
+        def allocate_or_update(i: int):
+            if i % 2:
+                self.allocator.set_total("ElsevierWrapper", 15 if i % 4 == 1 else -1)
+                return None
+            return self.allocator.allocate(3, 20)
+
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            allocations = [a for a in executor.map(allocate_or_update, range(400)) if a]
+
+        # every page is split with one set of totals
+        for allocation in allocations:
+            self.assertIn(allocation, [unknown, exhausted])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,65 @@
+import datetime
+import json
+import unittest
+
+from bson import ObjectId, json_util
+
+from functions import serializer
+from wrapper.record import Record
+
+body = {
+    "_id": ObjectId("5f1c2a3b4c5d6e7f80910111"),
+    "date_created": datetime.datetime(2020, 7, 25, 12, 30, 15, 123456),
+    "updated": datetime.datetime(2020, 7, 25, 14, 30, tzinfo=datetime.timezone(
+        datetime.timedelta(hours=2))),
+    "results": [{"doi": "10.1/1", "scores": [{"user": "alice", "score": 1}]}],
+    "facets": {"countries": {"DE": 2}},
+}
+
+
+class TestSerializer(unittest.TestCase):
+    def test_same_output_as_json_util(self):
+        expected = json.loads(json.dumps(body, default=json_util.default))
+
+        for name, dumps in serializer.SERIALIZERS.items():
+            with self.subTest(serializer=name):
+                self.assertEqual(json.loads(dumps(body)), expected)
+
+    def test_records(self):
+        records = {"records": [Record(doi="10.1/1", title="Title")]}
+
+        for name, dumps in serializer.SERIALIZERS.items():
+            with self.subTest(serializer=name):
+                self.assertEqual(json.loads(dumps(records)),
+                                 {"records": [{"doi": "10.1/1", "title": "Title"}]})
+
+    def test_unknown_type(self):
+        with self.assertRaises(TypeError):
+            serializer.dumps_json({"value": object()})
+
+    def test_negotiate(self):
+        self.assertEqual(serializer.negotiate(None), "application/json")
+        self.assertEqual(serializer.negotiate("text/html"), "application/json")
+        if serializer.msgpack is not None:
+            self.assertEqual(serializer.negotiate("application/msgpack"), "application/msgpack")
+
+    @unittest.skipIf(serializer.msgpack is None, "msgpack is not installed")
+    def test_msgpack(self):
+        records = dict(body, records=[Record(doi="10.1/1", title="Title")])
+
+        unpacked = serializer.msgpack.unpackb(
+            serializer.dumps_msgpack(records), timestamp=3,
+            ext_hook=lambda code, data: ObjectId(data) if code == serializer.OBJECT_ID_EXT_TYPE
+            else serializer.msgpack.ExtType(code, data)
+        )
+
+        self.assertEqual(unpacked["_id"], body["_id"])
+        self.assertEqual(unpacked["date_created"],
+                         body["date_created"].replace(tzinfo=datetime.timezone.utc))
+        self.assertEqual(unpacked["updated"], body["updated"])
+        self.assertEqual(unpacked["results"], body["results"])
+        self.assertEqual(unpacked["records"], [{"doi": "10.1/1", "title": "Title"}])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -22,7 +22,8 @@ sample_search = {
 
 class TestSLR(unittest.TestCase):
     def setUp(self):
-        self.review = connector.add_review("test_review")
+        self.user = connector.add_user("test_user", "Test", "User", "test@example.com", "test")
+        self.review = connector.add_review("test_review", "test description", self.user)
         self.sample_query = connector.new_query(self.review, sample_search)
 
         with open('test_results.json', 'r') as file:
@@ -46,9 +47,28 @@ class TestSLR(unittest.TestCase):
                     pass
                 self.assertTrue(record.get("persisted"))
 
+    def test_select_fields(self):
+        selected = slr.select_fields([self.results], ("doi", "title"))
+
+        for record in selected[0].get('records'):
+            self.assertLessEqual(set(record.keys()), {"doi", "title"})
+        self.assertEqual(len(selected[0]['records']), len(self.results['records']))
+        self.assertIn("abstract", self.results['records'][0])
+
+    def test_persisted_results_fields(self):
+        connector.save_results(
+            self.results['records'], self.review, self.sample_query)
+
+        page = connector.get_persisted_results(self.review, 1, 10, ("doi", "title"))
+
+        self.assertEqual(len(page['results']), 10)
+        for result in page['results']:
+            self.assertLessEqual(set(result.keys()), {"_id", "title"})
+
     def tearDown(self):
         connector.delete_results_for_review(self.review)
         self.review.delete()
+        connector.delete_user(self.user)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,106 @@
+import time
+import unittest
+import unittest.mock as mock
+
+import requests
+
+from wrapper import metrics, utils
+from wrapper.circuit_breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker
+from wrapper.retry import RetryPolicy
+
+
+def make_response(status_code):
+    response = requests.Response()
+    response.status_code = status_code
+    return response
+
+
+class TestCircuitBreaker(unittest.TestCase):
+    def setUp(self):
+        metrics.reset()
+        self.breaker = CircuitBreaker(failure_rate=0.5, slow_call_duration=1, window=4,
+                                      min_calls=4, open_duration=0.05)
+
+    def test_opens_on_failures_and_slow_calls(self):
+        self.breaker.record(False, 0.1)
+        self.breaker.record(True, 0.1)
+        self.breaker.record(False, 0.1)
+        self.assertEqual(self.breaker.state, CLOSED)
+
+        self.breaker.record(False, 2)
+        self.assertEqual(self.breaker.state, OPEN)
+        self.assertFalse(self.breaker.allow())
+
+    def test_record_returns_whether_it_opened(self):
+        self.assertFalse(self.breaker.record(True, 0.1))
+        self.assertFalse(self.breaker.record(True, 0.1))
+        self.assertFalse(self.breaker.record(False, 0.1))
+        self.assertTrue(self.breaker.record(True, 0.1))
+        # calls that were allowed before another one opened the breaker
+        self.assertFalse(self.breaker.record(True, 0.1))
+        self.assertEqual(self.breaker.state, OPEN)
+
+    def test_retries_count_toward_slow_calls(self):
+        breaker = CircuitBreaker(failure_rate=0.5, slow_call_duration=0.5, window=1, min_calls=1)
+        policy = RetryPolicy(backoff_base=0, backoff_max=0, total_budget=5)
+        responses = iter([make_response(503), make_response(503), make_response(200)])
+
+        def req_func(**kwargs):
+            time.sleep(0.2)
+            return next(responses)
+
+        invalid = utils.invalid_output({}, "", "key", "", 1, 10)
+        response = utils.request_error_handling(req_func, {"url": "http://example.com"}, 2,
+                                                invalid, policy=policy, name="Test",
+                                                breaker=breaker)
+        self.assertEqual(response.status_code, 200)
+        # every attempt was fast, but the call was slow
+        self.assertEqual(breaker.state, OPEN)
+
+    def test_half_open_probe(self):
+        for _ in range(4):
+            self.breaker.record(True, 0.1)
+        self.assertFalse(self.breaker.allow())
+
+        self.breaker._CircuitBreaker__opened_at -= 1
+        self.assertEqual(self.breaker.state, HALF_OPEN)
+        self.assertTrue(self.breaker.allow())
+        # only one probe at a time
+        self.assertFalse(self.breaker.allow())
+
+        self.breaker.record(True, 0.1)
+        self.assertEqual(self.breaker.state, OPEN)
+
+        self.breaker._CircuitBreaker__opened_at -= 1
+        self.assertTrue(self.breaker.allow())
+        self.breaker.record(False, 0.1)
+        self.assertEqual(self.breaker.state, CLOSED)
+
+    def test_request_error_handling_fails_fast(self):
+        policy = RetryPolicy(backoff_base=0, backoff_max=0, total_budget=5)
+        req_func = mock.Mock(return_value=make_response(503))
+
+        for _ in range(4):
+            invalid = utils.invalid_output({}, "", "key", "", 1, 10)
+            utils.request_error_handling(req_func, {"url": "http://example.com"}, 0, invalid,
+                                         policy=policy, name="Test", breaker=self.breaker)
+        self.assertEqual(req_func.call_count, 4)
+        self.assertEqual(metrics.get("Test.circuit_opened"), 1)
+
+        invalid = utils.invalid_output({}, "", "key", "", 1, 10)
+        response = utils.request_error_handling(req_func, {"url": "http://example.com"}, 0,
+                                                invalid, policy=policy, name="Test",
+                                                breaker=self.breaker)
+        self.assertIsNone(response)
+        self.assertEqual(req_func.call_count, 4)
+        self.assertTrue(invalid["error"].startswith("Circuit open: Test is unavailable."))
+        self.assertEqual(metrics.get("Test.short_circuited"), 1)
+
+    def test_client_errors_do_not_count(self):
+        req_func = mock.Mock(return_value=make_response(400))
+
+        for _ in range(8):
+            invalid = utils.invalid_output({}, "", "key", "", 1, 10)
+            utils.request_error_handling(req_func, {"url": "http://example.com"}, 0, invalid,
+                                         breaker=self.breaker)
+        self.assertEqual(self.breaker.state, CLOSED)
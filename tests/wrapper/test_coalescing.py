@@ -0,0 +1,135 @@
+import threading
+import time
+import unittest
+import unittest.mock as mock
+
+import requests
+
+from wrapper import coalescing, metrics
+from wrapper.deadline import TIMEOUT_ERROR, Deadline
+from wrapper.retry import RetryPolicy
+from wrapper.springer_wrapper import SpringerWrapper
+
+sample_search = {
+    "search_groups": [
+        {
+            "search_terms": ["blockchain"],
+            "match": "OR"
+        }
+    ],
+    "match": "AND"
+}
+
+
+def run_threads(func, num):
+    results = [None] * num
+
+    def run(i):
+        results[i] = func()
+
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(num)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+class TestCoalescing(unittest.TestCase):
+    def setUp(self):
+        metrics.reset()
+
+    def test_concurrent_calls_share_one_flight(self):
+        calls = []
+
+        def request():
+            calls.append(1)
+            time.sleep(0.1)
+            return {"records": []}
+
+        key = coalescing.request_key("http://example.com", None, None)
+        results = run_threads(lambda: coalescing.single_flight(key, request, "Test"), 5)
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(metrics.get("Test.coalesced"), 4)
+        self.assertTrue(all(result == {"records": []} for result in results))
+        # everybody gets their own copy
+        self.assertEqual(len(set(id(result) for result in results)), 5)
+
+    def test_errors_are_shared(self):
+        def request():
+            time.sleep(0.1)
+            raise ValueError("failed")
+
+        key = coalescing.request_key("http://example.com/error", None, None)
+
+        def call():
+            try:
+                coalescing.single_flight(key, request)
+            except ValueError as err:
+                return str(err)
+
+        self.assertEqual(run_threads(call, 3), ["failed"] * 3)
+
+    def test_waiting_keeps_own_deadline(self):
+        leader_started = threading.Event()
+
+        def request():
+            leader_started.set()
+            time.sleep(0.5)
+            return {"error": ""}
+
+        key = coalescing.request_key("http://example.com/slow", None, None)
+        leader = threading.Thread(target=coalescing.single_flight, args=(key, request))
+        leader.start()
+        leader_started.wait()
+
+        started = time.monotonic()
+        result = coalescing.single_flight(key, request, "Test", Deadline(0.1),
+                                          lambda: {"error": TIMEOUT_ERROR})
+        self.assertLess(time.monotonic() - started, 0.4)
+        self.assertEqual(result, {"error": TIMEOUT_ERROR})
+        self.assertEqual(metrics.get("Test.coalesced_timeouts"), 1)
+        leader.join()
+
+    def test_timeout_of_leader_is_not_shared(self):
+        calls = []
+
+        def request():
+            calls.append(1)
+            time.sleep(0.1)
+            # only the first call (the leader) runs out of time
+            return {"error": TIMEOUT_ERROR if len(calls) == 1 else ""}
+
+        key = coalescing.request_key("http://example.com/timeout", None, None)
+        results = run_threads(lambda: coalescing.single_flight(key, request), 2)
+
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(sorted(result["error"] for result in results), ["", TIMEOUT_ERROR])
+
+    def test_quota_policies_are_not_coalesced(self):
+        no_wait = RetryPolicy(limiter_wait=0)
+
+        self.assertNotEqual(coalescing.request_key("http://example.com", None, None, no_wait),
+                            coalescing.request_key("http://example.com", None, None,
+                                                   RetryPolicy()))
+
+    def test_wrapper_calls_api_once(self):
+        response = requests.Response()
+        response.status_code = 200
+        response._content = b'{"result": [{"total": "1"}], "records": [], "facets": []}'
+
+        def get(**kwargs):
+            time.sleep(0.1)
+            return response
+
+        wrapper = SpringerWrapper("test_key")
+        with mock.patch("requests.get", side_effect=get) as get_mock:
+            results = run_threads(lambda: wrapper.call_api(sample_search), 3)
+
+        self.assertEqual(get_mock.call_count, 1)
+        self.assertTrue(all(result["result"]["total"] == "1" for result in results))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,53 @@
+import time
+import unittest
+import unittest.mock as mock
+
+import requests
+
+from wrapper import utils
+from wrapper.circuit_breaker import CLOSED, CircuitBreaker
+from wrapper.deadline import TIMEOUT_ERROR, Deadline, earliest
+from wrapper.retry import RetryPolicy
+
+
+class TestDeadline(unittest.TestCase):
+    def test_from_context(self):
+        context = mock.Mock()
+        context.get_remaining_time_in_millis.return_value = 10000
+
+        deadline = Deadline.from_context(context, margin=2)
+        self.assertAlmostEqual(deadline.remaining(), 8, delta=0.1)
+        self.assertIsNone(Deadline.from_context(None))
+
+    def test_earliest(self):
+        early, late = Deadline(1), Deadline(10)
+
+        self.assertIs(earliest(late, None, early), early)
+        self.assertIsNone(earliest(None))
+
+    def test_deadline_shortens_the_budget(self):
+        policy = RetryPolicy(read_timeout=10, total_budget=20).with_deadline(Deadline(1))
+
+        connect_timeout, read_timeout = policy.timeout(time.monotonic())
+        self.assertLessEqual(read_timeout, 1)
+        self.assertIsNone(RetryPolicy().deadline)
+
+    def test_timeout_at_deadline_does_not_trip_breaker(self):
+        breaker = CircuitBreaker(window=1, min_calls=1)
+        policy = RetryPolicy(backoff_base=0, total_budget=20).with_deadline(Deadline(0.05))
+
+        def req_func(url, timeout):
+            time.sleep(timeout[1])
+            raise requests.exceptions.ReadTimeout()
+
+        invalid = utils.invalid_output({}, "", "key", "", 1, 10)
+        response = utils.request_error_handling(req_func, {"url": "http://example.com"}, 3,
+                                                invalid, policy=policy, breaker=breaker)
+
+        self.assertIsNone(response)
+        self.assertEqual(invalid["error"], TIMEOUT_ERROR)
+        self.assertEqual(breaker.state, CLOSED)
+
+
+if __name__ == '__main__':
+    unittest.main()
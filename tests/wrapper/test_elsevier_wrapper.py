@@ -0,0 +1,101 @@
+import unittest
+import unittest.mock as mock
+
+from wrapper.elsevier_wrapper import ElsevierWrapper
+
+sample_search = {
+    "search_groups": [
+        {
+            "search_terms": ["blockchain", "distributed ledger"],
+            "match": "OR"
+        }
+    ],
+    "match": "AND"
+}
+
+
+class TestElsevierWrapper(unittest.TestCase):
+    def setUp(self):
+        self.wrapper = ElsevierWrapper("test_key")
+
+    def test_offset_paging(self):
+        self.wrapper.start_at(26)
+        url, _, _ = self.wrapper.call_api(sample_search, dry=True)
+
+        self.assertIn("?start=25&count=25", url)
+
+    def test_only_formatted_fields_are_requested(self):
+        url, _, _ = self.wrapper.call_api(sample_search, dry=True)
+
+        fields = url.split("&field=")[1].split("&")[0].split(",")
+        self.assertIn("prism:doi", fields)
+        self.assertIn("affiliation-country", fields)
+
+    def test_cursor_paging(self):
+        self.wrapper.cursor = "*"
+        url, _, _ = self.wrapper.call_api(sample_search, dry=True)
+
+        self.assertIn("?cursor=%2A&count=25", url)
+        self.assertNotIn("start=", url)
+
+    def test_too_long_query_with_cursor(self):
+        long_search = {**sample_search, "search_groups": [{
+            "search_terms": ["term" + str(i) for i in range(500)],
+            "match": "OR"
+        }]}
+        self.wrapper.cursor = "*"
+
+        with mock.patch("requests.get") as get:
+            result = self.wrapper.call_api(long_search)
+
+        get.assert_not_called()
+        self.assertTrue(result["error"].startswith("Query too long"))
+        self.assertEqual(result["records"], [])
+
+    def test_filters(self):
+        search = {**sample_search, "fields": ["title"], "filters": {
+            "year_from": 2018, "year_to": 2020, "open_access": True,
+            "document_types": ["article", "conference_paper"]
+        }}
+        url, _, _ = self.wrapper.call_api(search, dry=True)
+
+        self.assertTrue(url.endswith(
+            "&query=(TITLE((%22distributed+ledger%22+OR+blockchain)))"
+            "+AND+PUBYEAR+%3E+2017+AND+PUBYEAR+%3C+2021+AND+OPENACCESS(1)+AND+DOCTYPE(ar+OR+cp)"
+        ))
+
+        self.wrapper.collection = "search/sciencedirect"
+        # not supported by the collection
+        with self.assertRaises(ValueError):
+            self.wrapper.translate_query(search)
+
+        del search["filters"]["document_types"]
+        _, _, body = self.wrapper.call_api(search, dry=True)
+        self.assertEqual(body["date"], "2018-2020")
+        self.assertEqual(body["openAccess"], "true")
+
+    def test_cursor_in_result(self):
+        def search_results(next_cursor):
+            return {"search-results": {
+                "opensearch:totalResults": "6000",
+                "opensearch:startIndex": "0",
+                "cursor": {"@current": "*", "@next": next_cursor},
+                "entry": [{"dc:title": "Title", "prism:doi": "10.1/1"}],
+            }}
+
+        self.wrapper.cursor = "*"
+        response = mock.Mock()
+        response.json.return_value = search_results("next_cursor")
+        result = self.wrapper.format_response(response, sample_search, "")
+
+        self.assertEqual(result["result"]["cursor"], "next_cursor")
+
+        # the last page returns the current cursor again
+        self.wrapper.cursor = "next_cursor"
+        response.json.return_value = search_results("next_cursor")
+        result = self.wrapper.format_response(response, sample_search, "")
+
+        self.assertIsNone(result["result"]["cursor"])
+
+if __name__ == '__main__':
+    unittest.main()
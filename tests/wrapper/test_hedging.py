@@ -0,0 +1,105 @@
+import threading
+import time
+import unittest
+import unittest.mock as mock
+
+from wrapper import metrics
+from wrapper.hedging import Hedger, LatencyTracker
+from wrapper.rate_limit import RateLimiter, TokenBucket
+
+
+class TestHedging(unittest.TestCase):
+    def setUp(self):
+        metrics.reset()
+
+    def warm_up(self, hedger, latency=0.01):
+        for _ in range(hedger.min_samples):
+            hedger.latencies.record(latency)
+        # allow hedging without tripping the extra rate cap
+        for _ in range(100):
+            hedger.call(lambda: None, {})
+
+    def test_percentile(self):
+        tracker = LatencyTracker(window=100)
+        self.assertIsNone(tracker.percentile(95))
+
+        for latency in range(100):
+            tracker.record(latency)
+        self.assertEqual(tracker.percentile(95), 95)
+        self.assertEqual(tracker.percentile(100), 99)
+
+    def test_slow_request_is_duplicated(self):
+        hedger = Hedger(percentile=50, max_extra_rate=0.5, min_samples=5)
+        self.warm_up(hedger)
+
+        calls = []
+        lock = threading.Lock()
+
+        def request(url):
+            with lock:
+                calls.append(url)
+                first = len(calls) == 1
+            time.sleep(1 if first else 0)
+            return "slow" if first else "fast"
+
+        started = time.monotonic()
+        self.assertEqual(hedger.call(request, {"url": "http://example.com"}, name="Test"), "fast")
+        self.assertLess(time.monotonic() - started, 0.5)
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(metrics.get("Test.hedged"), 1)
+
+    def test_losing_response_is_closed(self):
+        hedger = Hedger(percentile=50, max_extra_rate=0.5, min_samples=5)
+        self.warm_up(hedger)
+        responses = [mock.Mock(name="slow"), mock.Mock(name="fast")]
+        calls = []
+        lock = threading.Lock()
+
+        def request():
+            with lock:
+                calls.append(1)
+                first = len(calls) == 1
+            time.sleep(0.2 if first else 0)
+            return responses[0] if first else responses[1]
+
+        self.assertIs(hedger.call(request, {}), responses[1])
+        time.sleep(0.3)
+        responses[0].close.assert_called_once()
+        responses[1].close.assert_not_called()
+
+    def test_extra_rate_and_limiter_cap_duplicates(self):
+        hedger = Hedger(percentile=50, max_extra_rate=0.5, min_samples=5)
+        self.warm_up(hedger)
+        empty_limiter = RateLimiter([TokenBucket(rate=0.001, capacity=0)])
+
+        calls = []
+        hedger.call(lambda: calls.append(1) or time.sleep(0.1), {}, limiter=empty_limiter)
+        self.assertEqual(len(calls), 1)
+
+        hedger = Hedger(percentile=50, max_extra_rate=0, min_samples=5)
+        self.warm_up(hedger)
+        calls = []
+        hedger.call(lambda: calls.append(1) or time.sleep(0.1), {})
+        self.assertEqual(len(calls), 1)
+
+    def test_failed_request_falls_back_to_duplicate(self):
+        hedger = Hedger(percentile=50, max_extra_rate=0.5, min_samples=5)
+        self.warm_up(hedger)
+        calls = []
+        lock = threading.Lock()
+
+        def request():
+            with lock:
+                calls.append(1)
+                first = len(calls) == 1
+            if first:
+                time.sleep(0.1)
+                raise ConnectionError()
+            time.sleep(0.2)
+            return "ok"
+
+        self.assertEqual(hedger.call(request, {}), "ok")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,167 @@
+import threading
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+from wrapper import planner
+from wrapper.query import parse_query
+
+search = {
+    "search_groups": [
+        {
+            "search_terms": ["term" + str(i) for i in range(8)],
+            "match": "OR"
+        },
+        {
+            "search_terms": ["excluded"],
+            "match": "NOT"
+        }
+    ],
+    "match": "AND",
+    "fields": ["title"]
+}
+
+
+class FakeWrapper:
+    """Returns the same records for all terms but "term0" and the rest."""
+
+    api_key = "test_key"
+    max_records = 25
+
+    def __init__(self):
+        self.start = 1
+        self.show_num = 10
+
+    def start_at(self, value):
+        self.start = value
+
+    def call_api(self, query):
+        terms = query["search_groups"][0]["search_terms"]
+        # 30 results per sub-query, half of them are found by every sub-query
+        dois = ["shared/" + str(i) for i in range(15)] \
+            + [terms[0] + "/" + str(i) for i in range(15)]
+        records = [{"doi": doi} for doi in dois[self.start - 1:self.start - 1 + self.show_num]]
+        return {
+            "dbQuery": str(terms),
+            "error": "",
+            "result": {"total": "30"},
+            "records": records,
+            "facets": {"countries": {}, "keywords": {}},
+        }
+
+    def count(self, query):
+        return {**self.call_api(query), "records": []}
+
+
+class SlowWrapper(FakeWrapper):
+    """Takes a while to answer and counts the calls in flight."""
+
+    lock = threading.Lock()
+    in_flight = 0
+    max_in_flight = 0
+
+    def call_api(self, query):
+        with self.lock:
+            SlowWrapper.in_flight += 1
+            SlowWrapper.max_in_flight = max(SlowWrapper.max_in_flight, SlowWrapper.in_flight)
+        time.sleep(0.02)
+        with self.lock:
+            SlowWrapper.in_flight -= 1
+        return super().call_api(query)
+
+
+class TestPlanner(unittest.TestCase):
+    def setUp(self):
+        planner._states.clear()
+
+    def test_split_until_sub_queries_fit(self):
+        def fits(query):
+            return len(query.groups[0].terms) <= 2
+
+        sub_queries = planner.split_query(parse_query(search), fits)
+
+        self.assertEqual(len(sub_queries), 4)
+        terms = [term for sub_query in sub_queries for term in sub_query.groups[0].terms]
+        self.assertEqual(sorted(terms), sorted(search["search_groups"][0]["search_terms"]))
+        # the negated group stays in every sub-query
+        self.assertTrue(all(sub_query.groups[1].match == "NOT" for sub_query in sub_queries))
+
+    def test_unsplittable_query(self):
+        query = parse_query({**search, "search_groups": search["search_groups"][1:]
+                             + [{"search_terms": ["a", "b"], "match": "AND"}]})
+
+        with self.assertRaises(ValueError):
+            planner.split_query(query, lambda query: False)
+
+    def test_pages_neither_repeat_nor_skip_records(self):
+        sub_queries = planner.split_query(parse_query(search),
+                                          lambda query: len(query.groups[0].terms) <= 2)
+        # 4 sub-queries with 30 results each, 15 of them are shared by all
+        expected = {"shared/" + str(i) for i in range(15)} | {
+            sub_query.groups[0].terms[0] + "/" + str(i)
+            for sub_query in sub_queries for i in range(15)
+        }
+
+        pages = [planner.call_split(FakeWrapper(), search, sub_queries, start, 7)["records"]
+                 for start in range(1, 85, 7)]
+        dois = [record["doi"] for page in pages for record in page]
+
+        self.assertEqual(len(dois), len(set(dois)))
+        self.assertEqual(set(dois), expected)
+        self.assertEqual([len(page) for page in pages], [7] * 10 + [5, 0])
+
+        # pages requested out of order, e.g. by concurrent harvests, are the same
+        planner._states.clear()
+        page = planner.call_split(FakeWrapper(), search, sub_queries, 29, 7)["records"]
+        self.assertEqual(page, pages[4])
+        page = planner.call_split(FakeWrapper(), search, sub_queries, 8, 7)["records"]
+        self.assertEqual(page, pages[1])
+
+    def test_pages_requested_concurrently(self):
+        sub_queries = planner.split_query(parse_query(search),
+                                          lambda query: len(query.groups[0].terms) <= 2)
+        starts = range(1, 85, 7)
+        expected = [planner.call_split(FakeWrapper(), search, sub_queries, start, 7)["records"]
+                    for start in starts]
+
+        planner._states.clear()
+        with ThreadPoolExecutor(max_workers=len(starts)) as executor:
+            pages = list(executor.map(
+                lambda start: planner.call_split(SlowWrapper(), search, sub_queries, start, 7)
+                ["records"], starts
+            ))
+
+        self.assertEqual(pages, expected)
+        # the pages did not wait for each other's requests
+        self.assertGreater(SlowWrapper.max_in_flight, len(sub_queries))
+
+    def test_duplicates_are_removed_and_made_up_for(self):
+        sub_queries = planner.split_query(parse_query(search),
+                                          lambda query: len(query.groups[0].terms) <= 4)
+
+        result = planner.call_split(FakeWrapper(), search, sub_queries, 1, 20)
+
+        dois = [record["doi"] for record in result["records"]]
+        self.assertEqual(len(dois), 20)
+        self.assertEqual(len(set(dois)), 20)
+        self.assertEqual(result["result"]["recordsDisplayed"], "20")
+        total = int(result["result"]["total"])
+        self.assertTrue(30 <= total <= 60)
+
+    def test_totals_of_sub_queries_not_needed_for_the_page(self):
+        sub_queries = planner.split_query(parse_query(search),
+                                          lambda query: len(query.groups[0].terms) <= 4)
+
+        result = planner.call_split(FakeWrapper(), search, sub_queries, 1, 1)
+
+        self.assertEqual(len(result["records"]), 1)
+        self.assertEqual(result["result"]["total"], "60")
+
+    def test_estimate_total(self):
+        self.assertEqual(planner.estimate_total([100, 100], 20, 15), 150)
+        self.assertEqual(planner.estimate_total([100, 10], 20, 1), 100)
+        self.assertEqual(planner.estimate_total([100, -1], 20, 20), -1)
+
+
+if __name__ == '__main__':
+    unittest.main()
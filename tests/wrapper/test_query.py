@@ -0,0 +1,88 @@
+import unittest
+
+from wrapper.query import Filters, compile_get_query, normalize_term, parse_query
+
+search = {
+    "search_groups": [
+        {
+            "search_terms": ["blockchain", "distributed ledger"],
+            "match": "OR"
+        },
+        {
+            "search_terms": ["bitcoin"],
+            "match": "NOT"
+        }
+    ],
+    "match": "AND",
+    "fields": ["title"]
+}
+
+
+class TestQuery(unittest.TestCase):
+    def test_equivalent_queries_have_same_key(self):
+        reordered = {
+            "search_groups": [
+                {
+                    "search_terms": ["bitcoin"],
+                    "match": "NOT"
+                },
+                {
+                    "search_terms": ['"distributed  ledger"', "blockchain", "blockchain"],
+                    "match": "OR"
+                }
+            ],
+            "match": "AND",
+            "fields": ["title"]
+        }
+
+        self.assertEqual(parse_query(search), parse_query(reordered))
+        self.assertEqual(parse_query(search).key, parse_query(reordered).key)
+        self.assertNotEqual(parse_query(search).key,
+                            parse_query({**search, "fields": ["abstract"]}).key)
+
+    def test_normalize_term(self):
+        self.assertEqual(normalize_term(" distributed\tledger "), '"distributed ledger"')
+        self.assertEqual(normalize_term('"distributed ledger'), '"distributed ledger"')
+        self.assertEqual(normalize_term("blockchain"), "blockchain")
+        with self.assertRaises(ValueError):
+            normalize_term('""')
+
+    def test_validation(self):
+        with self.assertRaises(ValueError):
+            parse_query({**search, "match": "OR"})
+        with self.assertRaises(ValueError):
+            parse_query({**search, "search_groups": []})
+        with self.assertRaises(ValueError):
+            parse_query({**search, "fields": ["all", "title"]})
+
+    def test_filters(self):
+        filtered = {**search, "filters": {
+            "year_from": "2018", "open_access": True, "document_types": ["review", "article"]
+        }}
+        canonical = parse_query(filtered)
+
+        self.assertEqual(canonical.filters, Filters(2018, None, True, ("article", "review")))
+        self.assertNotEqual(canonical.key, parse_query(search).key)
+        self.assertEqual(parse_query(canonical.to_dict()), canonical)
+        self.assertNotIn("filters", parse_query(search).to_dict())
+
+        with self.assertRaises(ValueError):
+            parse_query({**search, "filters": {"year_from": 2020, "year_to": 2018}})
+        with self.assertRaises(ValueError):
+            parse_query({**search, "filters": {"document_types": ["poem"]}})
+
+    def test_translation_is_memoised(self):
+        canonical = parse_query(search)
+        compile_get_query.cache_clear()
+
+        for _ in range(3):
+            translated = compile_get_query(canonical, ("TITLE",), "+", "NOT", "+OR+")
+
+        self.assertEqual(
+            translated, "TITLE((%22distributed+ledger%22+OR+blockchain)+AND+NOT(bitcoin))"
+        )
+        self.assertEqual(compile_get_query.cache_info().hits, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,66 @@
+import threading
+import time
+import unittest
+
+from wrapper import rate_limit
+
+
+class TestRateLimit(unittest.TestCase):
+    def test_parse_limits(self):
+        self.assertEqual(rate_limit.parse_limits("9/1, 20000/604800"),
+                         [(9, 1.0), (20000, 604800.0)])
+
+    def test_harvest_time(self):
+        limits = [(9, 1), (20000, 604800)]
+
+        self.assertEqual(rate_limit.harvest_time(9, limits), 0)
+        self.assertAlmostEqual(rate_limit.harvest_time(90, limits), 9)
+        self.assertAlmostEqual(rate_limit.harvest_time(20001, limits[1:]), 604800 / 20000)
+        self.assertEqual(rate_limit.harvest_time(10, []), 0)
+
+    def test_burst_then_wait(self):
+        bucket = rate_limit.TokenBucket(rate=10, capacity=2)
+
+        self.assertEqual(bucket.try_acquire(), 0)
+        self.assertEqual(bucket.try_acquire(), 0)
+        self.assertGreater(bucket.try_acquire(), 0)
+
+        time.sleep(0.11)
+        self.assertEqual(bucket.try_acquire(), 0)
+
+    def test_limiter_releases_tokens_of_other_buckets(self):
+        per_second = rate_limit.TokenBucket(rate=100, capacity=100)
+        per_week = rate_limit.TokenBucket(rate=0.001, capacity=1)
+        limiter = rate_limit.RateLimiter([per_second, per_week])
+
+        self.assertTrue(limiter.acquire(max_wait=0))
+        self.assertFalse(limiter.acquire(max_wait=0.1))
+        # only the successful request took a token
+        self.assertAlmostEqual(per_second.try_acquire(99), 0)
+
+    def test_concurrent_requests_queue(self):
+        limiter = rate_limit.RateLimiter([rate_limit.TokenBucket(rate=50, capacity=1)])
+        acquired = []
+
+        def request():
+            acquired.append(limiter.acquire(max_wait=1))
+
+        started = time.monotonic()
+        threads = [threading.Thread(target=request) for _ in range(6)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(acquired, [True] * 6)
+        self.assertGreaterEqual(time.monotonic() - started, 0.09)
+
+    def test_same_limiter_for_same_key(self):
+        first = rate_limit.get_limiter("TestWrapper", "key", [(1, 1)])
+
+        self.assertIs(rate_limit.get_limiter("TestWrapper", "key", [(1, 1)]), first)
+        self.assertIsNot(rate_limit.get_limiter("TestWrapper", "other key", [(1, 1)]), first)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,56 @@
+import copy
+import json
+import unittest
+
+from wrapper.record import FIELDS, Record, parse_fields
+
+
+class TestRecord(unittest.TestCase):
+    def test_only_defined_fields_are_kept(self):
+        record = Record.from_dict({"title": "Title", "doi": "10.1/1", "prism:doi": "10.1/1"})
+
+        self.assertEqual(dict(record), {"title": "Title", "doi": "10.1/1"})
+        self.assertEqual(record, {"title": "Title", "doi": "10.1/1"})
+        self.assertNotIn("abstract", record)
+        self.assertIsNone(record.get("abstract"))
+        with self.assertRaises(KeyError):
+            record["prism:doi"] = "10.1/1"
+
+    def test_behaves_like_a_dict(self):
+        record = Record(title="Title", pages={"first": "1", "last": "2"})
+        record["persisted"] = True
+        del record["title"]
+
+        self.assertEqual(list(record.keys()), ["pages", "persisted"])
+        self.assertEqual(len(record), 2)
+        with self.assertRaises(KeyError):
+            del record["title"]
+
+        copied = copy.deepcopy(record)
+        copied["pages"]["first"] = "3"
+        self.assertEqual(record["pages"]["first"], "1")
+
+    def test_serialisation(self):
+        record = Record(doi="10.1/1", title="Title")
+
+        self.assertEqual(json.loads(json.dumps(record.to_dict())), {"doi": "10.1/1", "title": "Title"})
+        self.assertEqual(record.to_document()["_id"], "10.1/1")
+        self.assertFalse(hasattr(record, "__dict__"))
+        self.assertIn("persisted", FIELDS)
+
+    def test_sparse_fieldsets(self):
+        self.assertIsNone(parse_fields(None))
+        self.assertIsNone(parse_fields(""))
+        self.assertEqual(parse_fields("publicationDate, title,authors"),
+                         ("title", "authors", "doi", "publicationDate"))
+        self.assertEqual(parse_fields("scores", FIELDS + ("scores",)), ("doi", "scores"))
+        with self.assertRaises(ValueError):
+            parse_fields("title,scores")
+
+        fields = parse_fields("title")
+        record = Record.from_dict({"title": "Title", "doi": "10.1/1", "abstract": "Abstract"}, fields)
+        self.assertEqual(dict(record), {"title": "Title", "doi": "10.1/1"})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,100 @@
+import unittest
+import unittest.mock as mock
+from email.utils import format_datetime
+from datetime import datetime, timedelta, timezone
+
+import requests
+
+from wrapper import metrics, utils
+from wrapper.retry import RetryPolicy, parse_retry_after
+
+
+def make_response(status_code, headers=None):
+    response = requests.Response()
+    response.status_code = status_code
+    response.headers.update(headers or {})
+    return response
+
+
+class TestRetry(unittest.TestCase):
+    def setUp(self):
+        metrics.reset()
+        self.policy = RetryPolicy(backoff_base=0.01, backoff_max=0.01, total_budget=5)
+
+    def test_retry_after(self):
+        self.assertEqual(parse_retry_after(make_response(429, {"Retry-After": "3"})), 3)
+
+        date = datetime.now(timezone.utc) + timedelta(seconds=30)
+        delay = parse_retry_after(make_response(503, {"Retry-After": format_datetime(date)}))
+        self.assertAlmostEqual(delay, 30, delta=2)
+
+        self.assertIsNone(parse_retry_after(make_response(503)))
+
+    def test_retries_unavailable_and_counts_them(self):
+        req_func = mock.Mock(side_effect=[
+            make_response(503, {"Retry-After": "0"}),
+            make_response(429, {"Retry-After": "0"}),
+            make_response(200),
+        ])
+        invalid = utils.invalid_output({}, "", "key", "", 1, 10)
+
+        response = utils.request_error_handling(
+            req_func, {"url": "http://example.com"}, 3, invalid, policy=self.policy, name="Test"
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(metrics.get("Test.retries"), 2)
+        # every attempt gets a (connect, read) timeout
+        self.assertEqual(len(req_func.call_args.kwargs["timeout"]), 2)
+
+    def test_failed_responses_are_closed(self):
+        failed = [make_response(503, {"Retry-After": "0"}), make_response(404)]
+        for response in failed:
+            response.raw = mock.Mock()
+        req_func = mock.Mock(side_effect=failed)
+        invalid = utils.invalid_output({}, "", "key", "", 1, 10)
+
+        utils.request_error_handling(
+            req_func, {"url": "http://example.com", "stream": True}, 3, invalid,
+            policy=self.policy
+        )
+
+        for response in failed:
+            response.raw.release_conn.assert_called_once()
+
+    def test_client_errors_are_not_retried(self):
+        req_func = mock.Mock(return_value=make_response(404))
+        invalid = utils.invalid_output({}, "", "key", "", 1, 10)
+
+        response = utils.request_error_handling(
+            req_func, {"url": "http://example.com"}, 3, invalid, policy=self.policy
+        )
+
+        self.assertIsNone(response)
+        self.assertEqual(req_func.call_count, 1)
+        self.assertIn("HTTP error", invalid["error"])
+
+    def test_retry_after_beyond_budget_fails_fast(self):
+        req_func = mock.Mock(return_value=make_response(429, {"Retry-After": "60"}))
+        invalid = utils.invalid_output({}, "", "key", "", 1, 10)
+
+        response = utils.request_error_handling(
+            req_func, {"url": "http://example.com"}, 3, invalid, policy=self.policy
+        )
+
+        self.assertIsNone(response)
+        self.assertEqual(req_func.call_count, 1)
+
+    def test_timeouts_are_retried(self):
+        req_func = mock.Mock(side_effect=[requests.exceptions.ConnectTimeout(), make_response(200)])
+        invalid = utils.invalid_output({}, "", "key", "", 1, 10)
+
+        response = utils.request_error_handling(
+            req_func, {"url": "http://example.com"}, 3, invalid, policy=self.policy
+        )
+
+        self.assertEqual(response.status_code, 200)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,146 @@
+import io
+import json
+import unittest
+import unittest.mock as mock
+
+import requests
+from urllib3 import HTTPResponse
+
+from wrapper import streaming
+from wrapper.deadline import TIMEOUT_ERROR, Deadline
+from wrapper.springer_wrapper import SpringerWrapper
+
+document = {
+    "query": "title:blockchain",
+    "result": [{"total": "2", "start": "1", "pageLength": "2", "recordsDisplayed": "2"}],
+    "records": [
+        {"title": "First", "doi": "10.1/1", "creators": [{"creator": "A"}], "url": []},
+        {"title": "Second", "doi": "10.1/2", "creators": [], "url": [{"value": "https://x"}]},
+    ],
+    "facets": [],
+}
+
+sample_search = {
+    "search_groups": [{"search_terms": ["blockchain"], "match": "OR"}],
+    "match": "AND"
+}
+
+
+def streamed_response(body: dict) -> requests.Response:
+    response = requests.Response()
+    response.status_code = 200
+    response.raw = HTTPResponse(
+        body=io.BytesIO(json.dumps(body).encode()), preload_content=False, status=200
+    )
+    return response
+
+
+class CutOffBody(io.RawIOBase):
+    """A body whose connection is reset after the first bytes."""
+
+    def __init__(self, data: bytes):
+        self.data = data
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        if not self.data:
+            raise ConnectionResetError("Connection reset by peer")
+        size = min(len(buffer), len(self.data))
+        buffer[:size], self.data = self.data[:size], self.data[size:]
+        return size
+
+
+def cut_off_response() -> requests.Response:
+    response = requests.Response()
+    response.status_code = 200
+    response.raw = HTTPResponse(
+        body=CutOffBody(json.dumps(document).encode()[:120]), preload_content=False, status=200
+    )
+    return response
+
+
+class TestStreaming(unittest.TestCase):
+    @unittest.skipIf(streaming.ijson is None, "ijson is not installed")
+    def test_items_are_parsed_one_at_a_time(self):
+        response = streamed_response(document)
+        rest = {}
+        items = streaming.iter_items(response, "records", rest)
+
+        first = next(items)
+        self.assertEqual(first["doi"], "10.1/1")
+        self.assertEqual([item["doi"] for item in items], ["10.1/2"])
+        # the rest of the document is complete after the last item
+        self.assertEqual(rest["records"], [])
+        self.assertEqual(rest["facets"], [])
+        self.assertEqual(rest["result"][0]["total"], "2")
+
+    @unittest.skipIf(streaming.ijson is None, "ijson is not installed")
+    def test_nested_array_and_invalid_json(self):
+        response = streamed_response({"search-results": {"entry": [1, {"a": [2]}], "n": 3}})
+        rest = {}
+
+        self.assertEqual(list(streaming.iter_items(response, "search-results.entry", rest)),
+                         [1, {"a": [2]}])
+        self.assertEqual(rest, {"search-results": {"entry": [], "n": 3}})
+
+        response = requests.Response()
+        response.raw = HTTPResponse(body=io.BytesIO(b'{"records": [{"a"'), preload_content=False)
+        with self.assertRaises(ValueError):
+            list(streaming.iter_items(response, "records", {}))
+
+    def test_fallback_without_stream(self):
+        response = mock.Mock()
+        response.json.return_value = json.loads(json.dumps(document))
+        rest = {}
+
+        self.assertEqual(len(list(streaming.iter_items(response, "records", rest))), 2)
+        self.assertEqual(rest["records"], [])
+        self.assertEqual(list(streaming.iter_items(response, "missing.array", {})), [])
+
+    def test_same_output_with_and_without_stream(self):
+        wrapper = SpringerWrapper("test_key")
+        response = mock.Mock()
+        response.json.return_value = json.loads(json.dumps(document))
+
+        expected = wrapper.format_response(response, {})
+        self.assertEqual(expected["records"][1]["uri"], "https://x")
+        self.assertEqual(expected["result"]["total"], "2")
+        if streaming.ENABLED:
+            self.assertEqual(wrapper.format_response(streamed_response(document), {}), expected)
+
+    @unittest.skipIf(not streaming.ENABLED, "streaming is disabled")
+    def test_cut_off_body(self):
+        with self.assertRaises(streaming.ReadError):
+            list(streaming.iter_items(cut_off_response(), "records", {}))
+
+        wrapper = SpringerWrapper("test_key")
+        with mock.patch("requests.get", return_value=cut_off_response()):
+            result = wrapper.call_api(sample_search)
+        self.assertIn("cut off", result["error"])
+        self.assertEqual(result["records"], [])
+
+    @unittest.skipIf(not streaming.ENABLED, "streaming is disabled")
+    def test_small_bodies_are_parsed_at_once(self):
+        response = streamed_response(document)
+        self.assertTrue(streaming.is_streamed(response))
+
+        response.headers["Content-Length"] = str(streaming.MIN_SIZE - 1)
+        self.assertFalse(streaming.is_streamed(response))
+        self.assertEqual(len(list(streaming.iter_items(response, "records", {}))), 2)
+
+        response = cut_off_response()
+        response.headers["Content-Length"] = "1000"
+        with self.assertRaises(streaming.ReadError):
+            list(streaming.iter_items(response, "records", {}))
+
+    @unittest.skipIf(not streaming.ENABLED, "streaming is disabled")
+    def test_body_is_not_read_beyond_the_deadline(self):
+        with self.assertRaises(streaming.ReadError) as context:
+            list(streaming.iter_items(streamed_response(document), "records", {}, Deadline(0)))
+        self.assertEqual(str(context.exception), TIMEOUT_ERROR)
+
+
+if __name__ == '__main__':
+    unittest.main()
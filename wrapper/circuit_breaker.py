@@ -0,0 +1,147 @@
+"""Circuit breakers that stop calling APIs which are down or slow.
+
+A breaker is closed normally. It opens when too many of the recent calls failed or were slow.
+While it is open, calls fail immediately. After a while it is half-open and lets one call
+through to probe whether the API recovered, which closes or opens it again.
+"""
+
+import os
+import threading
+import time
+from collections import deque
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half-open"
+
+class CircuitBreaker:
+    """A circuit breaker for one API."""
+
+    def __init__(
+            self, failure_rate: float = float(os.getenv("BREAKER_FAILURE_RATE", 0.5)),
+            slow_call_duration: float = float(os.getenv("BREAKER_SLOW_CALL_DURATION", 5)),
+            window: int = int(os.getenv("BREAKER_WINDOW", 20)),
+            min_calls: int = int(os.getenv("BREAKER_MIN_CALLS", 5)),
+            open_duration: float = float(os.getenv("BREAKER_OPEN_DURATION", 30))):
+        """Initialize a closed circuit breaker. The defaults can be set with environment variables.
+
+        Args:
+            failure_rate: Share of failed or slow calls in the window that opens the breaker
+                (BREAKER_FAILURE_RATE).
+            slow_call_duration: Calls taking longer than this many seconds count as slow
+                (BREAKER_SLOW_CALL_DURATION).
+            window: Number of recent calls that are considered (BREAKER_WINDOW).
+            min_calls: Minimum number of calls in the window before the breaker can open
+                (BREAKER_MIN_CALLS).
+            open_duration: Seconds until an open breaker lets a probe through
+                (BREAKER_OPEN_DURATION).
+        """
+        self.failure_rate = failure_rate
+        self.slow_call_duration = slow_call_duration
+        self.min_calls = min_calls
+        self.open_duration = open_duration
+
+        self.__calls = deque(maxlen=window)
+        self.__state = CLOSED
+        self.__opened_at = 0.0
+        self.__probing = False
+        self.__lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        """Return the state: CLOSED, OPEN or HALF_OPEN."""
+        with self.__lock:
+            if self.__state == OPEN and self.retry_in() == 0:
+                return HALF_OPEN
+            return self.__state
+
+    def retry_in(self) -> float:
+        """Return the seconds until an open breaker lets a probe through."""
+        return max(0.0, self.__opened_at + self.open_duration - time.monotonic())
+
+    def allow(self) -> bool:
+        """Return whether a call may be made now.
+
+        If True is returned, `record` or `release` has to be called after the call.
+        """
+        with self.__lock:
+            if self.__state == CLOSED:
+                return True
+            if self.__probing or self.retry_in() > 0:
+                return False
+            # half-open: let one probe through
+            self.__state = HALF_OPEN
+            self.__probing = True
+            return True
+
+    def record(self, failed: bool, duration: float) -> bool:
+        """Record the outcome of a call.
+
+        Args:
+            failed: Did the call fail because of the API?
+            duration: Seconds the call took, including its retries.
+
+        Returns:
+            Whether this call opened the breaker.
+        """
+        unhealthy = failed or duration > self.slow_call_duration
+        with self.__lock:
+            if self.__state == HALF_OPEN:
+                self.__probing = False
+                self.__calls.clear()
+                if unhealthy:
+                    self.__open()
+                    return True
+                self.__state = CLOSED
+                return False
+
+            if self.__state == OPEN:
+                # another call opened the breaker while this one was made
+                return False
+
+            self.__calls.append(unhealthy)
+            if len(self.__calls) >= self.min_calls \
+                    and sum(self.__calls) / len(self.__calls) >= self.failure_rate:
+                self.__open()
+                return True
+            return False
+
+    def release(self):
+        """Release a call that was allowed but whose outcome says nothing about the API."""
+        with self.__lock:
+            if self.__state == HALF_OPEN:
+                self.__probing = False
+
+    def __open(self):
+        """Open the breaker. The lock has to be held."""
+        self.__state = OPEN
+        self.__opened_at = time.monotonic()
+        self.__calls.clear()
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+def get_breaker(name: str) -> CircuitBreaker:
+    """Return the circuit breaker of a wrapper.
+
+    Args:
+        name: Name of the wrapper.
+
+    Returns:
+        The same breaker for every call with the same name.
+    """
+    with _breakers_lock:
+        if name not in _breakers:
+            _breakers[name] = CircuitBreaker()
+        return _breakers[name]
+
+def is_failure(error: str) -> bool:
+    """Return whether the error of a failed request means that the API is unhealthy.
+
+    Invalid queries and the local rate limit are not the API's fault.
+
+    Args:
+        error: The "error" field of the output as defined in wrapper/output_format.py.
+    """
+    return error.startswith("Connection error") or error.startswith("HTTP error: 5") \
+        or error.startswith("HTTP error: 429")
@@ -0,0 +1,109 @@
+"""Coalescing of identical concurrent requests to the APIs.
+
+When a request is made while the same request is still running, it waits for the running one
+and gets a copy of its result instead of calling the API again ("single flight").
+"""
+
+import hashlib
+import json
+import threading
+from copy import deepcopy
+from typing import Callable, Optional
+
+from . import metrics
+from .deadline import TIMEOUT_ERROR
+
+class _Flight:
+    """A running request and the threads waiting for it."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.num_waiting = 0
+        self.result = None
+        self.error = None
+
+_flights = {}
+_flights_lock = threading.Lock()
+
+def request_key(url: str, headers, body, policy=None) -> str:
+    """Return the key of a request.
+
+    Requests with different quota policies are not coalesced: a request that must not wait for
+    the rate limiter (e.g. a prefetch) would hand its "Rate limit exceeded" to requests that may
+    wait.
+
+    Args:
+        url: The URL of the request.
+        headers: The headers of the request or None.
+        body: The body of the request or None.
+        policy: The `retry.RetryPolicy` of the request or None.
+
+    Returns:
+        A hash, so that the API key contained in the request is not kept in plain text.
+    """
+    limiter_wait = getattr(policy, "limiter_wait", None)
+    request = json.dumps([url, headers, body, limiter_wait], sort_keys=True, default=str)
+    return hashlib.sha256(request.encode()).hexdigest()
+
+def _timed_out(result) -> bool:
+    """Return whether a result is the output of a request that ran out of time."""
+    return isinstance(result, dict) and result.get("error") == TIMEOUT_ERROR
+
+def single_flight(key: str, func: Callable, name: str = "request", deadline=None,
+                  on_timeout: Optional[Callable] = None):
+    """Call a function unless it is called with the same key already.
+
+    Waiting threads keep their own deadline: they stop waiting when it passes, and they make
+    the request themselves if the running one ran out of its (earlier) deadline.
+
+    Args:
+        key: The key of the request, see `request_key`.
+        func: The function without arguments making the request.
+        name: Prefix of the metrics, e.g. the name of the wrapper.
+        deadline: The `deadline.Deadline` of this call or None.
+        on_timeout: Function without arguments returning the output of a call whose deadline
+            passed while waiting. Required if a deadline is given.
+
+    Returns:
+        The return of `func`. Waiting threads get a deep copy, so that everybody can modify
+        their result.
+
+    Raises:
+        The exception raised by `func`.
+    """
+    with _flights_lock:
+        flight = _flights.get(key)
+        leader = flight is None
+        if leader:
+            flight = _flights[key] = _Flight()
+        else:
+            flight.num_waiting += 1
+
+    if not leader:
+        metrics.increment(name + ".coalesced")
+        if not flight.done.wait(None if deadline is None else deadline.remaining()):
+            metrics.increment(name + ".coalesced_timeouts")
+            return on_timeout()
+        if flight.error is not None:
+            raise flight.error
+        result = deepcopy(flight.result)
+        if _timed_out(result) and (deadline is None or not deadline.expired):
+            return func()
+        return result
+
+    try:
+        result = func()
+    except BaseException as err:
+        flight.error = err
+        raise
+    else:
+        with _flights_lock:
+            del _flights[key]
+            # Nobody can join anymore. Keep an unmodified copy for the waiting threads.
+            if flight.num_waiting > 0:
+                flight.result = deepcopy(result)
+        return result
+    finally:
+        with _flights_lock:
+            _flights.pop(key, None)
+        flight.done.set()
@@ -0,0 +1,70 @@
+"""Latency budgets for requests that have to be answered in time.
+
+A Lambda function is killed when its timeout is reached and the results collected so far are
+lost. A Deadline is passed down to the wrappers, which shorten their timeouts and retries so that
+the function can still answer with the results of the APIs that responded in time.
+"""
+
+import os
+import time
+from typing import Optional
+
+# Seconds kept in reserve to build the response after the deadline.
+MARGIN = float(os.getenv("DEADLINE_MARGIN", 1.5))
+
+# The "error" of the output of an API that did not respond before the deadline.
+TIMEOUT_ERROR = "Timed out: The API did not respond before the deadline of the request."
+
+class Deadline:
+    """A point in time until which a request has to be answered."""
+
+    def __init__(self, seconds: float):
+        """Initialize a deadline.
+
+        Args:
+            seconds: Seconds from now until the deadline.
+        """
+        self.__end = time.monotonic() + seconds
+
+    @classmethod
+    def from_context(cls, context, margin: float = MARGIN) -> Optional["Deadline"]:
+        """Create a deadline from the context object of a Lambda function.
+
+        Args:
+            context: The context passed to the handler.
+            margin: Seconds before the function's timeout the deadline is set to.
+
+        Returns:
+            The deadline or None if the context does not know the remaining time.
+        """
+        get_remaining_time = getattr(context, "get_remaining_time_in_millis", None)
+        if get_remaining_time is None:
+            return None
+        return cls(get_remaining_time() / 1000 - margin)
+
+    def remaining(self) -> float:
+        """Return the seconds left until the deadline, 0 if it passed."""
+        return max(0.0, self.__end - time.monotonic())
+
+    @property
+    def expired(self) -> bool:
+        """Return whether the deadline passed."""
+        return self.remaining() == 0
+
+    def cancel(self):
+        """Let the deadline pass now, so that the work it limits stops as soon as possible."""
+        self.__end = time.monotonic()
+
+def earliest(*deadlines: Optional[Deadline]) -> Optional[Deadline]:
+    """Return the earliest of some deadlines.
+
+    Args:
+        *deadlines: Deadlines or None.
+
+    Returns:
+        The earliest deadline or None if none was given.
+    """
+    deadlines = [deadline for deadline in deadlines if deadline is not None]
+    if not deadlines:
+        return None
+    return min(deadlines, key=lambda deadline: deadline.remaining())
@@ -1,13 +1,17 @@
 """A wrapper for the Elsevier API."""
 
-from copy import deepcopy
+import datetime
+import os
 from typing import Optional, Union
+from urllib.parse import quote_plus
 
 import pycountry
 import requests
 
-from . import utils
-from .output_format import OUTPUT_FORMAT
+from . import circuit_breaker, coalescing, hedging, planner, rate_limit, retry, streaming, utils
+from .query import Filters, compile_get_query, compile_search, parse_query, translate_fields
+from .deadline import TIMEOUT_ERROR
+from .record import Record
 from .wrapper_interface import WrapperInterface
 
 class ElsevierWrapper(WrapperInterface):
@@ -29,10 +33,14 @@ class ElsevierWrapper(WrapperInterface):
 
         self.__num_records = 25
 
+        self.__cursor = None
+
         self.__parameters = {}
 
         self.__max_retries = 3
 
+        self.__retry_policy = retry.RetryPolicy()
+
     @property
     def endpoint(self) -> str:
         """Return the endpoint used for the query."""
@@ -125,6 +133,30 @@ class ElsevierWrapper(WrapperInterface):
         else:
             self.__num_records = value
 
+    @property
+    def supports_cursor(self) -> bool:
+        """Return whether the wrapper can page through results with a cursor."""
+        return self.collection == "search/scopus"
+
+    @property
+    def cursor(self) -> Optional[str]:
+        """Return the cursor used for the next request or None if start_at is used."""
+        return self.__cursor
+
+    @cursor.setter
+    def cursor(self, value: Optional[str]):
+        """Set the cursor used for the next request.
+
+        Scopus only allows offsets up to 5000. A cursor allows paging through all results.
+
+        Args:
+            value: The cursor returned in ["result"]["cursor"] of the previous response,
+                "*" to start from the first result or None to page with start_at.
+        """
+        if value is not None and not self.supports_cursor:
+            raise ValueError(f"Collection {self.collection} does not support cursors.")
+        self.__cursor = value
+
     @property
     def allowed_search_fields(self) -> {str: [str]}:
         """Return all allowed search parameter, value combinations.
@@ -195,18 +227,49 @@ class ElsevierWrapper(WrapperInterface):
 
     @property
     def max_retries(self) -> int:
-        """Return the maximum number of retries the wrapper will do on a timeout."""
+        """Return the maximum number of retries the wrapper will do on a failed request."""
         return self.__max_retries
 
     @max_retries.setter
     def max_retries(self, value: int):
-        """Set maximum number of retries on a timeout.
+        """Set maximum number of retries on a failed request.
 
         Args:
             value: Number of retries that will be set.
         """
         self.__max_retries = value
 
+    @property
+    def retry_policy(self) -> retry.RetryPolicy:
+        """Return the `retry.RetryPolicy` used for the requests."""
+        return self.__retry_policy
+
+    @retry_policy.setter
+    def retry_policy(self, value: retry.RetryPolicy):
+        """Set the retry policy.
+
+        Args:
+            value: The policy for timeouts and backoff between retries.
+        """
+        self.__retry_policy = value
+
+    @property
+    def rate_limits(self) -> [(int, float)]:
+        """Return the quotas of the API as (number of requests, seconds) tuples.
+
+        Can be overridden with the environment variable ELSEVIER_RATE_LIMITS, see `rate_limit.parse_limits`.
+        """
+        # Scopus Search API: 9 requests per second and 20000 per week
+        return rate_limit.limits_from_env("ELSEVIER_RATE_LIMITS", [(9, 1), (20000, 604800)])
+
+    @property
+    def max_query_length(self) -> int:
+        """Return the maximum length of the request url and body.
+
+        Can be overridden with the environment variable ELSEVIER_MAX_QUERY_LENGTH.
+        """
+        return int(os.getenv("ELSEVIER_MAX_QUERY_LENGTH", 4000))
+
     @property
     def fields_translate_map(self) -> dict:
         """Return the translate map for the fields field of the input format."""
@@ -222,6 +285,34 @@ class ElsevierWrapper(WrapperInterface):
         else:
             return {}
 
+    @property
+    def response_fields(self) -> [str]:
+        """Return the fields of the records that the API returns, all fields if empty.
+
+        Only the fields that `format_response` needs are requested.
+        """
+        if self.collection == "search/scopus":
+            # See https://dev.elsevier.com/sc_search_views.html
+            return [
+                "dc:title", "dc:creator", "prism:publicationName", "prism:doi",
+                "prism:coverDate", "prism:aggregationType", "prism:issn", "prism:volume",
+                "prism:pageRange", "subtypeDescription", "openaccess", "link",
+                "affiliation-country",
+            ]
+        else:
+            return []
+
+    @property
+    def document_types_translate_map(self) -> dict:
+        """Return the translate map for the document types of the filters of the input format."""
+        if self.collection == "search/scopus":
+            return {
+                "article": "ar", "book": "bk", "chapter": "ch", "conference_paper": "cp",
+                "review": "re",
+            }
+        else:
+            return {}
+
     def search_field(self, key: str, value, parameters: Optional[dict] = None):
         """Set the value for a given search parameter in a manual search.
 
@@ -267,9 +358,14 @@ class ElsevierWrapper(WrapperInterface):
         """Build and return the API query url without the actual search terms."""
         url = self.endpoint
         url += "/" + str(self.collection)
-        if self.collection in ["metadata/article", "search/scopus"]:
+        if self.collection == "search/scopus" and self.cursor is not None:
+            url += "?cursor=" + quote_plus(self.cursor)
+            url += "&count=" + str(self.show_num)
+        elif self.collection in ["metadata/article", "search/scopus"]:
             url += "?start=" + str(self.__start_record)
             url += "&count=" + str(self.show_num)
+        if self.response_fields:
+            url += "&field=" + ",".join(self.response_fields)
         return url
 
     def query_headers(self) -> dict:
@@ -322,44 +418,78 @@ class ElsevierWrapper(WrapperInterface):
         url = self.query_url()
         headers = self.query_headers()
 
-        # Copy the query since we will modify it.
-        query = deepcopy(query)
-
-        # Check if fields were given.
-        if len(query.get("fields", [])) == 0:
-            query["fields"] = list(self.fields_translate_map.keys())[:1]
-            print(f"No search fields specified. Using default {query['fields'][0]}.")
-        # "Translate" the given field names to search in.
-        for i in range(len(query["fields"])):
-            field = query["fields"][i]
-            if field in self.fields_translate_map:
-                query["fields"][i] = self.fields_translate_map.get(field)
-            else:
-                raise ValueError(f"Searching against field {field} is not supported.")
+        # The translation is memoised, only the url prefix changes between pages.
+        canonical = parse_query(query)
+        fields = translate_fields(canonical.fields, self.fields_translate_map)
 
         if self.collection == "search/sciencedirect":
             params = {}
 
             # Build the group from the different search_terms and -groups.
-            groups = query.get("search_groups", [])
-            if not groups:
-                raise ValueError("No search groups specified.")
-            for i in range(len(groups)):
-                if not groups[i].get("search_terms"):
-                    raise ValueError("No search terms specified.")
-                groups[i] = utils.build_group(groups[i]["search_terms"], groups[i].get("match"))
-            groups = utils.build_group(groups, query.get("match"))
+            groups = compile_search(canonical)
 
             # Search in every specified field.
-            for field in query.get("fields"):
+            for field in fields:
                 self.search_field(field, groups, params)
+            self.translate_filters(canonical.filters, params)
         elif self.collection in ["metadata/article", "search/scopus"]:
             params = None
-            url += "&query="
-            url += utils.translate_get_query(query, "+", "NOT", "+OR+")
+            search = compile_get_query(canonical, fields, "+", "NOT", "+OR+")
+            constraints = self.translate_filters(canonical.filters)
+            if constraints:
+                # The constraints apply to the search in all fields.
+                search = "(" + search + ")+AND+" + "+AND+".join(constraints)
+            url += "&query=" + search
 
         return url, headers, params
 
+    def translate_filters(self, filters: Filters, params: Optional[dict] = None) -> [str]:
+        """Translate the filters of a query into constraints of the API.
+
+        Args:
+            filters: The filters of a canonical query, see wrapper/query.py.
+            params: The body of a search in the search/sciencedirect collection.
+                The filters are set as its parameters.
+
+        Returns:
+            The constraints for the url of the other collections, each one is required.
+
+        Raises:
+            ValueError: When the collection does not support a filter.
+        """
+        if filters == Filters():
+            return []
+
+        if self.collection == "search/sciencedirect":
+            if filters.document_types:
+                raise ValueError(f"Collection {self.collection} cannot filter document types.")
+            if filters.year_from is not None or filters.year_to is not None:
+                # The date parameter needs both years of a range.
+                year_from = filters.year_from if filters.year_from is not None else 1
+                year_to = filters.year_to if filters.year_to is not None \
+                    else datetime.date.today().year
+                self.search_field("date", f"{year_from}-{year_to}", params)
+            if filters.open_access:
+                self.search_field("openAccess", "true", params)
+            return []
+        elif self.collection != "search/scopus":
+            raise ValueError(f"Collection {self.collection} does not support filters.")
+
+        constraints = []
+        if filters.year_from is not None:
+            constraints.append("PUBYEAR+%3E+" + str(filters.year_from - 1))
+        if filters.year_to is not None:
+            constraints.append("PUBYEAR+%3C+" + str(filters.year_to + 1))
+        if filters.open_access:
+            constraints.append("OPENACCESS(1)")
+        if filters.document_types:
+            types = [
+                self.document_types_translate_map[document_type]
+                for document_type in filters.document_types
+            ]
+            constraints.append("DOCTYPE(" + "+OR+".join(types) + ")")
+        return constraints
+
     def start_at(self, value: int):
         """Set the index from which the returned results start.
 
@@ -380,10 +510,17 @@ class ElsevierWrapper(WrapperInterface):
             The formatted response.
         """
         if self.result_format == "application/json":
-            # Load into dict
-            response = response.json()
-
             if self.collection == "search/sciencedirect":
+                # The records are parsed and formatted one at a time.
+                response_dict = {}
+                records = [
+                    self.format_record(record)
+                    for record in streaming.iter_items(
+                        response, "results", response_dict, self.retry_policy.deadline
+                    )
+                ]
+                response = response_dict
+
                 # Modify response to fit the defined wrapper output format
                 response["query"] = query
                 response["dbQuery"] = db_query
@@ -392,25 +529,24 @@ class ElsevierWrapper(WrapperInterface):
                     "total": response.get("resultsFound", -1),
                     "start": self.__start_record + 1,
                     "pageLength": self.show_num,
-                    "recordsDisplayed": len(response.get("results", []))
+                    "recordsDisplayed": len(records)
                 }
-                response["records"] = response.pop("results") if "results" in response else []
-                for record in response.get("records") or []:
-                    authors = []
-                    for author in record.get("authors") or []:
-                        authors.append(author["name"])
-                    record["authors"] = authors
-                    if "sourceTitle" in record:
-                        record["publicationName"] = record.pop("sourceTitle")
-                    record["publisher"] = "ScienceDirect"
-
-                    # Delete all undefined fields
-                    utils.clean_output(record, OUTPUT_FORMAT["records"][0])
+                response["records"] = records
             elif self.collection == "metadata/article":
                 # TODO!
                 raise NotImplementedError("No formatter defined for the metadata collection yet.")
             elif self.collection == "search/scopus":
-                response = response.get("search-results")
+                response_dict = {}
+                # Elsevier returns an entry with an error field stating that the results are empty.
+                records = [
+                    self.format_record(record)
+                    for record in streaming.iter_items(
+                        response, "search-results.entry", response_dict,
+                        self.retry_policy.deadline
+                    )
+                    if "error" not in record
+                ]
+                response = response_dict.get("search-results")
                 if not response:
                     # We need to only fill the error message. The rest is filled like normal and the
                     # records loop will not be executed.
@@ -422,76 +558,93 @@ class ElsevierWrapper(WrapperInterface):
                     response, "opensearch:Query", "@searchTerms", default=db_query,
                 )
                 response["apiKey"] = self.api_key
-                response["records"] = response.pop("entry") if "entry" in response else []
-                # Elsevier returns an object with an error field stating that the results are empty.
-                if len(response["records"]) == 1 and "error" in response["records"][0]:
-                    response["records"] = []
+                response["records"] = records
                 response["result"] = {
                     "total": response.get("opensearch:totalResults", -1),
                     "start": self.__start_record + 1,
                     "pageLength": self.show_num,
-                    "recordsDisplayed": len(response.get("records", [])),
+                    "recordsDisplayed": len(records),
                 }
+                if self.cursor is not None:
+                    # Scopus keeps returning the last cursor when the results are exhausted
+                    next_cursor = utils.get(response, "cursor", "@next")
+                    if not records or next_cursor == self.cursor:
+                        next_cursor = None
+                    response["result"]["start"] = \
+                        int(response.get("opensearch:startIndex") or 0) + 1
+                    response["result"]["cursor"] = next_cursor
+
                 countries = {}
-                all_titles = ""
-                for record in response.get("records"):
-                    record["contentType"] = record.get("subtypeDescription")
-                    record["title"] = record.get("dc:title")
-                    all_titles += record["title"] + " " if record["title"] else ""
-                    record["authors"] = [record.get("dc:creator")]
-                    record["publicationName"] = record.get("prism:publicationName")
-                    record["openAccess"] = record.get("openaccess")
-                    record["doi"] = record.get("prism:doi")
-                    record["publisher"] = "Elsevier"
-                    record["publicationDate"] = record.get("prism:coverDate")
-                    record["publicationType"] = record.get("prism:aggregationType")
-                    record["issn"] = record.get("prism:issn")
-                    record["volume"] = record.get("prism:volume")
-
-                    page_range = record.get("prism:pageRange")
-                    page_range = page_range.split("-") if page_range else []
-                    record["pages"] = {
-                        "first": page_range[0] if len(page_range) > 0 else None,
-                        "last":  page_range[1] if len(page_range) > 1 else None,
-                    }
-
-                    for link_dict in record.get("link") or []:
-                        if link_dict.get("@ref") == "scopus":
-                            record["uri"] = link_dict.get("@href")
-                            break
-
-                    # Extract countries and their counter
-                    country = utils.get(record, "affiliation", 0, "affiliation-country")
-                    if country:
-                        # Convert to ISO 3166-1 alpha-2 codes
-                        try:
-                            iso = utils.get(pycountry.countries.search_fuzzy(country), 0)
-                        except LookupError:
-                            iso = None
-                        # If no match was found the full name is readd.
-                        country = iso.alpha_2 if iso else country
-                        if country in countries:
-                            countries[country] += 1
-                        else:
-                            countries[country] = 1
-
-                    # Delete all undefined fields
-                    utils.clean_output(record, OUTPUT_FORMAT["records"][0])
+                for record in records:
+                    for country in record.get("countries") or []:
+                        countries[country] = countries.get(country, 0) + 1
 
+                all_titles = " ".join(record["title"] for record in records if record.get("title"))
                 keywords = utils.titles_to_keywords(all_titles)
                 response["facets"] = {
                     "countries": countries,
                     "keywords": keywords,
                 }
 
-            # Delete all undefined fields
-            utils.clean_output(response)
-
-            return response
+            # Only keep the defined fields
+            return utils.project_output(response)
         else:
             print(f"No formatter defined for {self.result_format}. Returning response body.")
             return response.text
 
+    def format_record(self, record: dict) -> Record:
+        """Return a record of a response formatted as defined in wrapper/output_format.py.
+
+        Args:
+            record: A record of the response of the current collection. It is modified.
+        """
+        if self.collection == "search/sciencedirect":
+            authors = []
+            for author in record.get("authors") or []:
+                authors.append(author["name"])
+            record["authors"] = authors
+            if "sourceTitle" in record:
+                record["publicationName"] = record.pop("sourceTitle")
+            record["publisher"] = "ScienceDirect"
+        elif self.collection == "search/scopus":
+            record["contentType"] = record.get("subtypeDescription")
+            record["title"] = record.get("dc:title")
+            record["authors"] = [record.get("dc:creator")]
+            record["publicationName"] = record.get("prism:publicationName")
+            record["openAccess"] = record.get("openaccess")
+            record["doi"] = record.get("prism:doi")
+            record["publisher"] = "Elsevier"
+            record["publicationDate"] = record.get("prism:coverDate")
+            record["publicationType"] = record.get("prism:aggregationType")
+            record["issn"] = record.get("prism:issn")
+            record["volume"] = record.get("prism:volume")
+
+            page_range = record.get("prism:pageRange")
+            page_range = page_range.split("-") if page_range else []
+            record["pages"] = {
+                "first": page_range[0] if len(page_range) > 0 else None,
+                "last":  page_range[1] if len(page_range) > 1 else None,
+            }
+
+            for link_dict in record.get("link") or []:
+                if link_dict.get("@ref") == "scopus":
+                    record["uri"] = link_dict.get("@href")
+                    break
+
+            country = utils.get(record, "affiliation", 0, "affiliation-country")
+            if country:
+                # Convert to ISO 3166-1 alpha-2 codes
+                try:
+                    iso = utils.get(pycountry.countries.search_fuzzy(country), 0)
+                except LookupError:
+                    iso = None
+                # If no match was found the full name is readd.
+                country = iso.alpha_2 if iso else country
+                record["countries"] = [country]
+
+        # Only keep the defined fields
+        return Record.from_dict(record)
+
     def call_api(self, query: Optional[dict] = None, raw: bool = False, dry: bool = False):
         """Make the call to the API.
 
@@ -525,10 +678,54 @@ class ElsevierWrapper(WrapperInterface):
 
         if dry:
             return url, headers, body
+        # Too long queries are split, this is not possible when paging with a cursor.
+        if query and not raw and planner.request_length(url, body) > self.max_query_length:
+            if self.cursor is not None:
+                return utils.invalid_output(
+                    query, url.split("&query=")[-1], self.api_key,
+                    f"Query too long: The request has {planner.request_length(url, body)} "
+                    f"characters, {self.collection} allows {self.max_query_length}. Long "
+                    "queries can only be split when paging with start indexes, not with a "
+                    "cursor.",
+                    self.__start_record + 1, self.show_num
+                )
+
+            def fits(sub_query: dict) -> bool:
+                sub_url, _, sub_body = self.translate_query(sub_query)
+                return planner.request_length(sub_url, sub_body) <= self.max_query_length
+
+            return planner.call_split(
+                self, query, planner.plan(query, fits), self.__start_record + 1, self.show_num
+            )
+        if raw:
+            return self.__request(url, headers, body, query, raw)
+
+        # Identical requests that are running concurrently share one call to the API.
+        return coalescing.single_flight(
+            coalescing.request_key(url, headers, body, self.retry_policy),
+            lambda: self.__request(url, headers, body, query),
+            type(self).__name__,
+            self.retry_policy.deadline,
+            lambda: utils.invalid_output(query, None, self.api_key, TIMEOUT_ERROR,
+                                         self.__start_record + 1, self.show_num)
+        )
 
-        # Make the request and handle errors
+    def __request(self, url: str, headers: Optional[dict], body: Optional[dict],
+                  query: Optional[dict], raw: bool = False):
+        """Make the request built by `call_api` and handle errors.
+
+        Args:
+            url: The URL of the request.
+            headers: The headers of the request.
+            body: The body of the request.
+            query: The query the request was built from.
+            raw: Should the raw request.Response of the query be returned?
+
+        Returns:
+            If raw is False the formatted response is returned else the raw request.Response.
+        """
         response = None
-        req_kwargs = {"url": url, "headers": headers}
+        req_kwargs = {"url": url, "headers": headers, "stream": streaming.ENABLED}
 
         # db_query will be set later because it depends on which collection is used.
         invalid = utils.invalid_output(
@@ -538,19 +735,32 @@ class ElsevierWrapper(WrapperInterface):
             self.max_retries,
             invalid,
         )
+        req_options = {
+            "limiter": rate_limit.get_limiter(type(self).__name__, self.api_key, self.rate_limits),
+            "policy": self.retry_policy,
+            "name": type(self).__name__,
+            "breaker": circuit_breaker.get_breaker(type(self).__name__),
+            "hedger": hedging.get_hedger(type(self).__name__),
+        }
         if self.collection == "search/sciencedirect":
             req_kwargs["json"] = body
             invalid["dbQuery"] = body
-            response = utils.request_error_handling(requests.put, req_kwargs, *req_args)
+            response = utils.request_error_handling(
+                requests.put, req_kwargs, *req_args, **req_options
+            )
         elif self.collection == "metadata/article":
             # TODO!
             raise NotImplementedError("The metadata/article collection is not yet fully tested.")
 
             invalid["dbQuery"] = url.split("&query=")[-1]
-            response = utils.request_error_handling(requests.get, req_kwargs, *req_args)
+            response = utils.request_error_handling(
+                requests.get, req_kwargs, *req_args, **req_options
+            )
         elif self.collection == "search/scopus":
             invalid["dbQuery"] = url.split("&query=")[-1]
-            response = utils.request_error_handling(requests.get, req_kwargs, *req_args)
+            response = utils.request_error_handling(
+                requests.get, req_kwargs, *req_args, **req_options
+            )
         elif self.collection in self.allowed_result_formats:
             invalid["error"] = f"A request to current collection {self.collection} is not yet" \
                                " implemented."
@@ -564,4 +774,9 @@ class ElsevierWrapper(WrapperInterface):
         # Return raw requests.Response
         if raw:
             return response
-        return self.format_response(response, query, invalid.get("dbQuery"))
+        try:
+            return self.format_response(response, query, invalid.get("dbQuery"))
+        except streaming.ReadError as err:
+            invalid["error"] = str(err)
+            print(invalid["error"])
+            return invalid
@@ -0,0 +1,177 @@
+"""Hedged requests to cut the tail latency of the APIs.
+
+If a request takes longer than most of the recent requests to the same API, a duplicate is
+sent and the response that arrives first is used. Hedging is enabled with the environment
+variable HEDGING_ENABLED.
+"""
+
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Callable, Optional
+
+from . import metrics
+
+ENABLED = os.getenv("HEDGING_ENABLED", "").lower() in ("1", "true", "yes")
+
+# The duplicates keep running after the first response, so they get their own threads.
+_executor = ThreadPoolExecutor(max_workers=int(os.getenv("HEDGE_MAX_WORKERS", 16)))
+
+class LatencyTracker:
+    """The latencies of the most recent requests to an API."""
+
+    def __init__(self, window: int = 200):
+        """Initialize an empty tracker.
+
+        Args:
+            window: Number of latencies that are kept.
+        """
+        self.__latencies = deque(maxlen=window)
+        self.__lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.__latencies)
+
+    def record(self, latency: float):
+        """Add the latency of a request in seconds."""
+        with self.__lock:
+            self.__latencies.append(latency)
+
+    def percentile(self, percent: float) -> Optional[float]:
+        """Return a percentile of the latencies.
+
+        Args:
+            percent: The percentile, e.g. 95.
+
+        Returns:
+            The latency in seconds or None if no latency was recorded.
+        """
+        with self.__lock:
+            latencies = sorted(self.__latencies)
+        if not latencies:
+            return None
+        index = min(len(latencies) - 1, int(len(latencies) * percent / 100))
+        return latencies[index]
+
+class Hedger:
+    """Sends a duplicate of slow requests to one API."""
+
+    def __init__(
+            self, percentile: float = float(os.getenv("HEDGE_PERCENTILE", 95)),
+            max_extra_rate: float = float(os.getenv("HEDGE_MAX_EXTRA_RATE", 0.05)),
+            min_samples: int = int(os.getenv("HEDGE_MIN_SAMPLES", 20)),
+            window: int = int(os.getenv("HEDGE_WINDOW", 200))):
+        """Initialize a hedger. The defaults can be set with environment variables.
+
+        Args:
+            percentile: A duplicate is sent when a request takes longer than this percentile of
+                the recent latencies (HEDGE_PERCENTILE).
+            max_extra_rate: Maximum share of requests that are duplicated (HEDGE_MAX_EXTRA_RATE).
+            min_samples: Number of latencies needed before requests are hedged
+                (HEDGE_MIN_SAMPLES).
+            window: Number of recent latencies the percentile is taken of (HEDGE_WINDOW).
+        """
+        self.percentile = percentile
+        self.max_extra_rate = max_extra_rate
+        self.min_samples = min_samples
+        self.latencies = LatencyTracker(window)
+
+        self.__num_requests = 0
+        self.__num_hedged = 0
+        self.__lock = threading.Lock()
+
+    def delay(self) -> Optional[float]:
+        """Return the seconds after which a request is duplicated or None if it is not."""
+        if len(self.latencies) < self.min_samples:
+            return None
+        return self.latencies.percentile(self.percentile)
+
+    def __may_hedge(self, limiter) -> bool:
+        """Count a duplicate if the extra rate and the rate limiter allow it."""
+        with self.__lock:
+            if self.__num_hedged + 1 > self.max_extra_rate * self.__num_requests:
+                return False
+            # Never wait for a token, that would only add latency.
+            if limiter is not None and limiter.try_acquire() > 0:
+                return False
+            self.__num_hedged += 1
+            return True
+
+    def call(self, req_func: Callable, req_kwargs: dict, limiter=None, name: str = "request"):
+        """Make a request and duplicate it if it is slow.
+
+        Args:
+            req_func: The function that makes the HTTP request, e.g. `requests.get`.
+            req_kwargs: The arguments passed to `req_func`.
+            limiter: The `rate_limit.RateLimiter` the duplicate takes a token from.
+            name: Prefix of the metrics, e.g. the name of the wrapper.
+
+        Returns:
+            The return of the request that finished first.
+
+        Raises:
+            The exception of the first request if all of them failed.
+        """
+        with self.__lock:
+            self.__num_requests += 1
+
+        def timed_request():
+            started = time.monotonic()
+            response = req_func(**req_kwargs)
+            self.latencies.record(time.monotonic() - started)
+            return response
+
+        delay = self.delay()
+        if delay is None:
+            return timed_request()
+
+        pending = {_executor.submit(timed_request)}
+        done, pending = wait(pending, timeout=delay)
+        if not done and self.__may_hedge(limiter):
+            metrics.increment(name + ".hedged")
+            pending.add(_executor.submit(timed_request))
+
+        first_error = None
+        while True:
+            for future in done:
+                if future.exception() is None:
+                    for other in (done | pending) - {future}:
+                        other.add_done_callback(close_response)
+                    return future.result()
+                if first_error is None:
+                    first_error = future.exception()
+            if not pending:
+                raise first_error
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+
+def close_response(future):
+    """Close the response of a request that lost against its duplicate.
+
+    The requests are streamed, so a response keeps its pooled connection until it is closed.
+    """
+    if future.cancelled() or future.exception() is not None:
+        return
+    close = getattr(future.result(), "close", None)
+    if close is not None:
+        close()
+
+_hedgers = {}
+_hedgers_lock = threading.Lock()
+
+def get_hedger(name: str) -> Optional[Hedger]:
+    """Return the hedger of a wrapper.
+
+    Args:
+        name: Name of the wrapper.
+
+    Returns:
+        The same hedger for every call with the same name or None if hedging is disabled.
+    """
+    if not ENABLED:
+        return None
+    with _hedgers_lock:
+        if name not in _hedgers:
+            _hedgers[name] = Hedger()
+        return _hedgers[name]
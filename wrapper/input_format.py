@@ -5,6 +5,8 @@ When using NOT as match for one of the search_groups, the match on the first
 layer has to be AND.
 When setting the fields, "all" cannot be combined with the rest but has to be
 used alone.
+The filters are optional and are applied by the APIs. Records of any of the
+document_types are returned. The years are inclusive.
 """
 
 INPUT_FORMAT = {
@@ -14,4 +16,10 @@ INPUT_FORMAT = {
     }],
     "match": "AND|OR",
     "fields": ["all", "abstract", "keywords", "title"],
+    "filters": {
+        "year_from": "int",
+        "year_to": "int",
+        "open_access": "bool",
+        "document_types": ["article", "book", "chapter", "conference_paper", "review"],
+    },
 }
@@ -0,0 +1,32 @@
+"""In-process counters, e.g. of retries, for monitoring the wrappers."""
+
+import threading
+from collections import Counter
+
+_counters = Counter()
+_lock = threading.Lock()
+
+def increment(name: str, amount: int = 1):
+    """Increment a counter.
+
+    Args:
+        name: Name of the counter, e.g. "ElsevierWrapper.retries".
+        amount: The value that is added.
+    """
+    with _lock:
+        _counters[name] += amount
+
+def get(name: str) -> int:
+    """Return the value of a counter. Unknown counters are 0."""
+    with _lock:
+        return _counters[name]
+
+def snapshot() -> dict:
+    """Return a copy of all counters."""
+    with _lock:
+        return dict(_counters)
+
+def reset():
+    """Reset all counters."""
+    with _lock:
+        _counters.clear()
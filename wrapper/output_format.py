@@ -13,6 +13,7 @@ OUTPUT_FORMAT = {
         "start": "Index at which the returned results start",
         "pageLength": "Number of results per page requested",
         "recordsDisplayed": "Number of records this exact query returned",
+        "cursor": "Cursor of the next page if a cursor was used, None on the last page",
     },
     "records": [{
         "contentType": "Type of the content (e.g. Article)",
@@ -36,6 +37,7 @@ OUTPUT_FORMAT = {
         "copyright": "Copyright notice",
         "abstract": "Abstract (Summary)",
         "uri": "Link to the record",
+        "countries": ["ISO 3166-1 alpha-2 code of an affiliation"],
     }],
     "facets": {
         "countries": {
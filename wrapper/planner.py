@@ -0,0 +1,323 @@
+"""Splitting of queries that are too long for an API.
+
+Systematic reviews often search for dozens of synonyms, which can exceed the maximum URL or
+query length of an API. Such a query is split into sub-queries by partitioning a group of OR-ed
+search terms. The union of the results of the sub-queries is the result of the query.
+
+The combined results are a merge of the sub-queries: records are taken from the sub-queries in
+turn, and records whose DOI was taken before are skipped. Sub-queries without more results are
+skipped as well. The merge of a split query is remembered (see SplitState), so that the next
+page continues where the previous one stopped and no record is repeated or skipped.
+"""
+
+import copy
+import json
+import math
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, NamedTuple, Optional
+
+from . import utils
+from .query import Group, Query, parse_query
+
+def request_length(url: str, body: Optional[dict] = None) -> int:
+    """Return the length of a request that is limited by the APIs.
+
+    Args:
+        url: The URL of the request.
+        body: The body of the request.
+    """
+    return len(url) + (len(json.dumps(body)) if body else 0)
+
+def halve(query: Query) -> Optional[list]:
+    """Split a query into two whose union is equivalent to it.
+
+    Args:
+        query: The canonical query.
+
+    Returns:
+        The two queries or None if the query cannot be split.
+    """
+    if query.match == "OR" and len(query.groups) > 1:
+        middle = len(query.groups) // 2
+        return [query._replace(groups=query.groups[:middle]),
+                query._replace(groups=query.groups[middle:])]
+
+    # NOT (a OR b) and (a AND b) cannot be split into a union.
+    splittable = [i for i, group in enumerate(query.groups)
+                  if group.match == "OR" and len(group.terms) > 1]
+    if not splittable:
+        return None
+
+    i = max(splittable, key=lambda i: len(query.groups[i].terms))
+    terms = query.groups[i].terms
+    middle = len(terms) // 2
+    return [
+        query._replace(groups=query.groups[:i] + (Group("OR", part),) + query.groups[i + 1:])
+        for part in (terms[:middle], terms[middle:])
+    ]
+
+def split_query(query: Query, fits: Callable[[Query], bool]) -> [Query]:
+    """Split a query until all sub-queries fit.
+
+    Args:
+        query: The canonical query.
+        fits: Function returning whether a query is short enough for the API.
+
+    Returns:
+        The sub-queries, only the query itself if it fits.
+
+    Raises:
+        ValueError: When the query cannot be split any further.
+    """
+    if fits(query):
+        return [query]
+
+    halves = halve(query)
+    if halves is None:
+        raise ValueError("The query is too long and cannot be split into shorter queries.")
+    return [sub_query for half in halves for sub_query in split_query(half, fits)]
+
+def result_total(result: dict) -> int:
+    """Return the total of an output as defined in wrapper/output_format.py, -1 if unknown."""
+    try:
+        return int(utils.get(result, "result", "total", default=-1))
+    except (TypeError, ValueError):
+        return -1
+
+def estimate_total(totals: [int], num_fetched: int, num_unique: int) -> int:
+    """Estimate the total of a split query from the totals of its sub-queries.
+
+    The share of duplicates among the fetched records is assumed for all results.
+
+    Args:
+        totals: The totals of the sub-queries.
+        num_fetched: Number of records fetched from all sub-queries.
+        num_unique: Number of these records without duplicates.
+
+    Returns:
+        The estimate, at least the largest total and at most the sum of the totals.
+        -1 if a total is unknown.
+    """
+    if not totals or min(totals) < 0:
+        return -1
+
+    estimate = sum(totals)
+    if num_fetched > 0:
+        estimate = round(estimate * num_unique / num_fetched)
+    return min(sum(totals), max(max(totals), estimate))
+
+class Checkpoint(NamedTuple):
+    """The state of the merge of a split query after some combined records."""
+
+    # number of records taken from each sub-query
+    consumed: tuple
+    # the sub-query whose turn is next
+    turn: int
+    # whether each sub-query has no more records after the consumed ones
+    exhausted: tuple
+    # number of records taken from all sub-queries, including duplicates
+    num_consumed: int
+
+class SplitState:
+    """The merge of the sub-queries of a split query, shared by all requests of its pages.
+
+    The merge is deterministic, so a page can be continued from any checkpoint before it.
+    A checkpoint is kept at the start and at the end of every requested page. Pages are merged
+    concurrently: whether a record is new only depends on the records before it in the merge,
+    which were taken by the same page or before its checkpoint was saved.
+    """
+
+    def __init__(self, k: int):
+        """Initialize the state before the first record.
+
+        Args:
+            k: Number of sub-queries.
+        """
+        # guards the checkpoints and first_seen, not the requests
+        self.lock = threading.Lock()
+        self.checkpoints = {0: Checkpoint((0,) * k, 0, (False,) * k, 0)}
+        # lower case DOI -> number of records taken before it was taken the first time
+        self.first_seen = {}
+        self.totals = [None] * k
+
+    def checkpoint(self, index: int) -> (int, Checkpoint):
+        """Return the latest checkpoint at or before a number of combined records."""
+        with self.lock:
+            latest = max(i for i in self.checkpoints if i <= index)
+            return latest, self.checkpoints[latest]
+
+    def save(self, index: int, checkpoint: Checkpoint):
+        """Keep a checkpoint after a number of combined records.
+
+        Pages that reach the same index concurrently save equivalent checkpoints.
+        """
+        with self.lock:
+            self.checkpoints[index] = checkpoint
+
+    def take(self, doi: Optional[str], num_consumed: int) -> bool:
+        """Return whether a record is new, i.e. its DOI was not taken before.
+
+        Args:
+            doi: The DOI of the record. Records without a DOI are always new.
+            num_consumed: Number of records taken from all sub-queries before it.
+        """
+        if not doi:
+            return True
+        doi = doi.lower()
+        with self.lock:
+            first = self.first_seen.get(doi)
+            if first is None or first > num_consumed:
+                self.first_seen[doi] = num_consumed
+                return True
+            return first == num_consumed
+
+# the merges of the most recent split queries, see get_state
+_states = dict()
+_states_lock = threading.Lock()
+MAX_STATES = 128
+
+def get_state(db_wrapper, sub_queries: [Query]) -> SplitState:
+    """Return the merge state of a split query.
+
+    Args:
+        db_wrapper: The wrapper.
+        sub_queries: The sub-queries as returned by `split_query`.
+    """
+    key = json.dumps([type(db_wrapper).__name__, getattr(db_wrapper, "collection", None)]
+                     + [sub_query.key for sub_query in sub_queries])
+    with _states_lock:
+        if key not in _states:
+            if len(_states) >= MAX_STATES:
+                # dicts keep insertion order, so this is the oldest one
+                del _states[next(iter(_states))]
+            _states[key] = SplitState(len(sub_queries))
+        return _states[key]
+
+def call_split(db_wrapper, query: dict, sub_queries: [Query], start: int, num: int) -> dict:
+    """Request a range of the results of a split query.
+
+    The sub-queries are requested concurrently with copies of the wrapper. Pages of the same
+    split query can be requested concurrently, see SplitState.
+
+    Args:
+        db_wrapper: The wrapper, its start index and page length are not changed.
+        query: The query as defined in wrapper/input_format.py.
+        sub_queries: The sub-queries as returned by `split_query`.
+        start: Index of the first record. (1-based)
+        num: Number of records.
+
+    Returns:
+        The combined output as defined in wrapper/output_format.py. Records with the same DOI are
+        only contained once.
+    """
+    k = len(sub_queries)
+    state = get_state(db_wrapper, sub_queries)
+
+    def call(i: int, first: int, count: int) -> dict:
+        sub_wrapper = copy.copy(db_wrapper)
+        sub_wrapper.start_at(first)
+        sub_wrapper.show_num = count
+        return sub_wrapper.call_api(sub_queries[i].to_dict())
+
+    results = []
+    records = []
+    error = ""
+
+    with ThreadPoolExecutor(max_workers=k) as executor:
+        index, checkpoint = state.checkpoint(start - 1)
+        consumed = list(checkpoint.consumed)
+        exhausted = list(checkpoint.exhausted)
+        turn = checkpoint.turn
+        num_consumed = checkpoint.num_consumed
+        buffers = [deque() for _ in range(k)]
+        end = start - 1 + num
+
+        def save_checkpoint():
+            # buffered records are requested again when continuing from the checkpoint
+            state.save(index, Checkpoint(
+                tuple(consumed), turn,
+                tuple(exhausted[i] and not buffers[i] for i in range(k)), num_consumed
+            ))
+
+        while index < end:
+            if index == start - 1:
+                save_checkpoint()
+
+            if not buffers[turn] and not exhausted[turn]:
+                # refill all empty buffers at once
+                empty = [i for i in range(k) if not buffers[i] and not exhausted[i]]
+                count = max(1, min(db_wrapper.max_records, math.ceil((end - index) / len(empty))))
+                calls = {
+                    i: executor.submit(call, i, consumed[i] + 1, count) for i in empty
+                }
+                for i, future in calls.items():
+                    result = future.result()
+                    results.append(result)
+                    if result.get("error"):
+                        error = result["error"]
+                        continue
+                    state.totals[i] = result_total(result)
+                    fetched = result.get("records") or []
+                    buffers[i].extend(fetched)
+                    if len(fetched) < count:
+                        exhausted[i] = True
+                if error:
+                    break
+
+            if not buffers[turn]:
+                if all(exhausted[i] and not buffers[i] for i in range(k)):
+                    break
+                turn = (turn + 1) % k
+                continue
+
+            record = buffers[turn].popleft()
+            consumed[turn] += 1
+            turn = (turn + 1) % k
+            num_consumed += 1
+            if not state.take(record.get("doi"), num_consumed - 1):
+                continue
+
+            index += 1
+            if index >= start:
+                records.append(record)
+
+        if not error:
+            save_checkpoint()
+
+        # Small pages don't need all sub-queries, their totals are still needed for the estimate.
+        counts = {
+            i: executor.submit(db_wrapper.count, sub_queries[i].to_dict())
+            for i in range(k) if state.totals[i] is None and not exhausted[i]
+        }
+        for i, future in counts.items():
+            result = future.result()
+            results.append(result)
+            if result.get("error"):
+                error = result["error"]
+                continue
+            state.totals[i] = result_total(result)
+        totals = [total for total in state.totals if total is not None]
+
+    out = utils.invalid_output(
+        query, [result.get("dbQuery") for result in results], db_wrapper.api_key, error, start,
+        num
+    )
+    out["result"]["total"] = str(estimate_total(totals, num_consumed, index))
+    out["result"]["recordsDisplayed"] = str(len(records))
+    out["records"] = records
+    out["facets"] = utils.combine_facets([result.get("facets") for result in results])
+    return out
+
+def plan(query: dict, fits: Callable[[dict], bool]) -> [Query]:
+    """Split a query as defined in wrapper/input_format.py if it is too long.
+
+    Args:
+        query: The query.
+        fits: Function returning whether a query is short enough for the API.
+
+    Returns:
+        The canonical sub-queries.
+    """
+    return split_query(parse_query(query), lambda sub_query: fits(sub_query.to_dict()))
@@ -0,0 +1,242 @@
+"""Canonical queries.
+
+A query in the format of wrapper/input_format.py is parsed into a hashable tuple. Equivalent
+queries (e.g. with the search terms in another order) are parsed into the same tuple, so its
+`key` can be used as cache key and its translations into the languages of the APIs can be
+memoised. Between the pages of a search only the start index and page length change, which the
+wrappers add to the memoised translation.
+"""
+
+import functools
+import hashlib
+import json
+import os
+import re
+from typing import NamedTuple, Optional, Tuple
+from urllib.parse import quote_plus
+
+from .utils import build_group
+
+# Number of memoised translations of each kind.
+CACHE_SIZE = int(os.getenv("QUERY_CACHE_SIZE", 256))
+
+WHITESPACE_PATTERN = re.compile(r"\s+")
+
+# Document types that can be filtered for, see wrapper/input_format.py.
+DOCUMENT_TYPES = ("article", "book", "chapter", "conference_paper", "review")
+
+class Group(NamedTuple):
+    """A search group: search terms connected by a match."""
+    match: str
+    terms: Tuple[str, ...]
+
+class Filters(NamedTuple):
+    """Restrictions of the results that the APIs apply."""
+    year_from: Optional[int] = None
+    year_to: Optional[int] = None
+    open_access: bool = False
+    document_types: Tuple[str, ...] = ()
+
+    def to_dict(self) -> dict:
+        """Return the filters that are set in the format of wrapper/input_format.py."""
+        filters = {}
+        if self.year_from is not None:
+            filters["year_from"] = self.year_from
+        if self.year_to is not None:
+            filters["year_to"] = self.year_to
+        if self.open_access:
+            filters["open_access"] = True
+        if self.document_types:
+            filters["document_types"] = list(self.document_types)
+        return filters
+
+class Query(NamedTuple):
+    """A query in canonical form."""
+    match: str
+    groups: Tuple[Group, ...]
+    fields: Tuple[str, ...]
+    filters: Filters = Filters()
+
+    @property
+    def key(self) -> str:
+        """Return a hash that is the same for all equivalent queries."""
+        return hashlib.sha256(json.dumps(self).encode()).hexdigest()
+
+    def to_dict(self) -> dict:
+        """Return the query in the format of wrapper/input_format.py."""
+        query = {
+            "search_groups": [
+                {"search_terms": list(group.terms), "match": group.match}
+                for group in self.groups
+            ],
+            "match": self.match,
+            "fields": list(self.fields),
+        }
+        if self.filters != Filters():
+            query["filters"] = self.filters.to_dict()
+        return query
+
+def normalize_term(term: str) -> str:
+    """Normalize the whitespace and quotes of a search term.
+
+    Terms that contain a space are quoted to prevent splitting them.
+
+    Args:
+        term: The search term.
+
+    Returns:
+        The normalized term.
+
+    Raises:
+        ValueError: When the term is empty.
+
+    Examples:
+        >>> normalize_term('  distributed   ledger"')
+        '"distributed ledger"'
+    """
+    term = WHITESPACE_PATTERN.sub(" ", str(term)).strip()
+    quoted = term.startswith('"') or term.endswith('"')
+    term = term.strip('"').strip()
+    if not term:
+        raise ValueError("Empty search term.")
+
+    if quoted or " " in term:
+        term = '"' + term + '"'
+    return term
+
+def parse_filters(filters: Optional[dict]) -> Filters:
+    """Parse and validate the filters of a query.
+
+    Args:
+        filters: The filters as defined in wrapper/input_format.py or None.
+
+    Returns:
+        The canonical filters. The document types are sorted and duplicates are removed.
+
+    Raises:
+        ValueError: When a filter is invalid.
+    """
+    filters = filters or {}
+    years = []
+    for name in ["year_from", "year_to"]:
+        year = filters.get(name)
+        if year is not None:
+            try:
+                year = int(year)
+            except (TypeError, ValueError):
+                raise ValueError(f"Illegal year {year} for filter {name}.")
+        years.append(year)
+    if None not in years and years[0] > years[1]:
+        raise ValueError("year_from has to be before year_to.")
+
+    document_types = set(filters.get("document_types") or [])
+    for document_type in document_types:
+        if document_type not in DOCUMENT_TYPES:
+            raise ValueError(f"Unknown document type {document_type}.")
+
+    return Filters(
+        years[0], years[1], bool(filters.get("open_access")), tuple(sorted(document_types))
+    )
+
+def parse_query(query: dict) -> Query:
+    """Parse and validate a query.
+
+    Args:
+        query: A query as defined in wrapper/input_format.py.
+
+    Returns:
+        The canonical query. The terms of a group, the groups and the fields are sorted and
+        duplicates are removed. Negated groups come last.
+
+    Raises:
+        ValueError: When the query is invalid.
+    """
+    match = query.get("match")
+    if match not in ["AND", "OR"]:
+        raise ValueError("Unknown match.")
+
+    groups = set()
+    for group in query.get("search_groups") or []:
+        group_match = group.get("match")
+        if group_match not in ["AND", "OR", "NOT"]:
+            raise ValueError("Unknown match.")
+        if group_match == "NOT" and match == "OR":
+            raise ValueError("Only AND NOT supported.")
+
+        terms = {normalize_term(term) for term in group.get("search_terms") or []}
+        if not terms:
+            raise ValueError("No search terms specified.")
+        groups.add(Group(group_match, tuple(sorted(terms))))
+    if not groups:
+        raise ValueError("No search groups specified.")
+
+    fields = set(query.get("fields") or [])
+    if "all" in fields and len(fields) > 1:
+        raise ValueError('The field "all" cannot be combined with other fields.')
+
+    return Query(
+        match,
+        tuple(sorted(groups, key=lambda group: (group.match == "NOT", group))),
+        tuple(sorted(fields)),
+        parse_filters(query.get("filters")),
+    )
+
+def translate_fields(fields: Tuple[str, ...], translate_map: dict) -> Tuple[str, ...]:
+    """Translate the fields of a query into the field names of an API.
+
+    Args:
+        fields: The fields of a canonical query.
+        translate_map: The `fields_translate_map` of a wrapper.
+
+    Returns:
+        The translated fields. If no fields are given, the first field of the map is used.
+
+    Raises:
+        ValueError: When a field is not supported.
+    """
+    if not fields:
+        fields = tuple(translate_map.keys())[:1]
+        print(f"No search fields specified. Using default {fields[0]}.")
+
+    for field in fields:
+        if field not in translate_map:
+            raise ValueError(f"Searching against field {field} is not supported.")
+    return tuple(translate_map[field] for field in fields)
+
+@functools.lru_cache(maxsize=CACHE_SIZE)
+def compile_search(query: Query, match_pad: str = " ", negater: str = "NOT ",
+                   encode: bool = False) -> str:
+    """Connect the search terms and groups of a query.
+
+    Args:
+        query: The canonical query.
+        match_pad: The padding around the match values.
+        negater: The negater used for negating a search group.
+        encode: Should the search terms be URL encoded?
+
+    Returns:
+        The search, e.g. `((blockchain OR "distributed ledger") AND NOT(bitcoin))`.
+    """
+    groups = []
+    for group in query.groups:
+        terms = [quote_plus(term) for term in group.terms] if encode else group.terms
+        groups.append(build_group(terms, group.match, match_pad, negater))
+    return build_group(groups, query.match, match_pad, negater)
+
+@functools.lru_cache(maxsize=CACHE_SIZE)
+def compile_get_query(query: Query, fields: Tuple[str, ...], match_pad: str, negater: str,
+                      connector: str) -> str:
+    """Translate a query into a string for the query part of the url of GET requests.
+
+    Args:
+        query: The canonical query.
+        fields: The translated fields, each is put in front of the search.
+        match_pad: The padding around the match values.
+        negater: The negater used for negating a search group.
+        connector: The connector between the fields.
+
+    Returns:
+        The translated query.
+    """
+    search = compile_search(query, match_pad, negater, encode=True)
+    return connector.join(field + search for field in fields)
@@ -0,0 +1,272 @@
+"""Token bucket rate limiting of the requests to the APIs.
+
+Every combination of wrapper and API key gets one RateLimiter with one bucket for each quota of
+the API (e.g. requests per second and requests per week). The buckets live in this process by
+default. Call `use_mongo` to share them between processes.
+"""
+
+import hashlib
+import os
+import threading
+import time
+
+# Seconds a request waits for a token before it fails.
+MAX_WAIT = float(os.getenv("RATE_LIMIT_MAX_WAIT", 5))
+
+def parse_limits(spec: str) -> [(int, float)]:
+    """Parse quotas in the format "<requests>/<seconds>,...".
+
+    Args:
+        spec: The quotas, e.g. "9/1,20000/604800".
+
+    Returns:
+        A list of (number of requests, seconds) tuples.
+
+    Raises:
+        ValueError: When the format is invalid.
+
+    Examples:
+        >>> parse_limits("9/1,20000/604800")
+        [(9, 1.0), (20000, 604800.0)]
+    """
+    limits = []
+    for limit in spec.split(","):
+        if not limit.strip():
+            continue
+        count, seconds = limit.split("/")
+        limits.append((int(count), float(seconds)))
+    return limits
+
+def limits_from_env(var_name: str, default: [(int, float)]) -> [(int, float)]:
+    """Return the quotas set in an environment variable or the default.
+
+    Args:
+        var_name: Name of the environment variable, its format is described in `parse_limits`.
+        default: The quotas used if the variable is not set.
+    """
+    spec = os.getenv(var_name)
+    if spec is None:
+        return default
+    return parse_limits(spec)
+
+def harvest_time(num_requests: int, limits: [(int, float)]) -> float:
+    """Estimate the seconds the quotas of an API allow for a number of requests.
+
+    Every quota allows a burst of its number of requests and then one request per share of its
+    period. The time of the requests themselves is not included.
+
+    Args:
+        num_requests: Number of requests.
+        limits: The quotas of the API as returned by `parse_limits`.
+
+    Examples:
+        >>> harvest_time(300, [(100, 60), (5000, 86400)])
+        120.0
+    """
+    return max(
+        [max(0, num_requests - count) * seconds / count for count, seconds in limits],
+        default=0.0
+    )
+
+class TokenBucket:
+    """A token bucket that is shared by the threads of this process."""
+
+    def __init__(self, rate: float, capacity: float):
+        """Initialize a full bucket.
+
+        Args:
+            rate: Tokens added per second.
+            capacity: Maximum number of tokens, i.e. the allowed burst.
+        """
+        self.rate = rate
+        self.capacity = capacity
+        self.__tokens = capacity
+        self.__updated = time.monotonic()
+        self.__lock = threading.Lock()
+
+    def try_acquire(self, tokens: float = 1) -> float:
+        """Take tokens if they are available.
+
+        Args:
+            tokens: Number of tokens to take.
+
+        Returns:
+            0 if the tokens were taken, otherwise the seconds until they are available.
+        """
+        with self.__lock:
+            now = time.monotonic()
+            self.__tokens = min(self.capacity, self.__tokens + (now - self.__updated) * self.rate)
+            self.__updated = now
+
+            if self.__tokens >= tokens:
+                self.__tokens -= tokens
+                return 0
+            return (tokens - self.__tokens) / self.rate
+
+    def release(self, tokens: float = 1):
+        """Return tokens that were taken but not used.
+
+        Args:
+            tokens: Number of tokens to return.
+        """
+        with self.__lock:
+            self.__tokens = min(self.capacity, self.__tokens + tokens)
+
+class MongoTokenBucket:
+    """A token bucket that is stored in a MongoDB collection and shared between processes.
+
+    Requires MongoDB 4.2 or later for the update pipeline of `release`.
+    """
+
+    def __init__(self, collection, key: str, rate: float, capacity: float):
+        """Initialize a bucket. The document is created full on first use.
+
+        Args:
+            collection: A pymongo collection.
+            key: The _id of the bucket's document.
+            rate: Tokens added per second.
+            capacity: Maximum number of tokens, i.e. the allowed burst.
+        """
+        self.collection = collection
+        self.key = key
+        self.rate = rate
+        self.capacity = capacity
+
+    def try_acquire(self, tokens: float = 1) -> float:
+        """Take tokens if they are available.
+
+        The document is only updated if nobody else changed it since it was read.
+
+        Args:
+            tokens: Number of tokens to take.
+
+        Returns:
+            0 if the tokens were taken, otherwise the seconds until they should be available.
+        """
+        from pymongo.errors import DuplicateKeyError
+
+        for _ in range(10):
+            now = time.time()
+            doc = self.collection.find_one({"_id": self.key})
+            if doc is None:
+                try:
+                    self.collection.insert_one(
+                        {"_id": self.key, "tokens": self.capacity, "updated": now}
+                    )
+                except DuplicateKeyError:
+                    pass
+                continue
+
+            available = min(self.capacity, doc["tokens"] + (now - doc["updated"]) * self.rate)
+            if available < tokens:
+                return (tokens - available) / self.rate
+
+            result = self.collection.update_one(
+                {"_id": self.key, "tokens": doc["tokens"], "updated": doc["updated"]},
+                {"$set": {"tokens": available - tokens, "updated": now}},
+            )
+            if result.modified_count == 1:
+                return 0
+
+        # Too many concurrent updates, try again a bit later.
+        return 1 / self.rate
+
+    def release(self, tokens: float = 1):
+        """Return tokens that were taken but not used.
+
+        Args:
+            tokens: Number of tokens to return.
+        """
+        # an update pipeline caps the tokens at the capacity like TokenBucket.release
+        self.collection.update_one(
+            {"_id": self.key},
+            [{"$set": {"tokens": {"$min": [self.capacity, {"$add": ["$tokens", tokens]}]}}}],
+        )
+
+class RateLimiter:
+    """Limits the requests made with one API key to all quotas of an API."""
+
+    def __init__(self, buckets: list):
+        """Initialize a rate limiter.
+
+        Args:
+            buckets: One bucket for each quota.
+        """
+        self.buckets = buckets
+
+    def try_acquire(self) -> float:
+        """Take a token from every bucket if all of them have one.
+
+        Returns:
+            0 if the tokens were taken, otherwise the seconds until they should be available.
+        """
+        taken = []
+        for bucket in self.buckets:
+            wait = bucket.try_acquire()
+            if wait > 0:
+                for taken_bucket in taken:
+                    taken_bucket.release()
+                return wait
+            taken.append(bucket)
+        return 0
+
+    def acquire(self, max_wait: float = MAX_WAIT) -> bool:
+        """Wait until a request is allowed.
+
+        Args:
+            max_wait: Maximum number of seconds to wait.
+
+        Returns:
+            True if the request may be made, False if it would have to wait longer than max_wait.
+        """
+        deadline = time.monotonic() + max_wait
+        while True:
+            wait = self.try_acquire()
+            if wait == 0:
+                return True
+            if time.monotonic() + wait > deadline:
+                return False
+            time.sleep(wait)
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+_collection = None
+
+def use_mongo(collection):
+    """Store the buckets of limiters created from now on in a MongoDB collection.
+
+    Args:
+        collection: A pymongo collection or None to use in-process buckets.
+    """
+    global _collection
+    with _limiters_lock:
+        _collection = collection
+        _limiters.clear()
+
+def get_limiter(name: str, api_key: str, limits: [(int, float)]) -> RateLimiter:
+    """Return the rate limiter of a wrapper and API key.
+
+    Args:
+        name: Name of the wrapper.
+        api_key: The API key used for the requests.
+        limits: The quotas of the API as returned by `parse_limits`.
+            Only used when the limiter is created.
+
+    Returns:
+        The same limiter for every call with the same name and key.
+    """
+    # Don't keep API keys in plain text in the keys and documents.
+    key = name + ":" + hashlib.sha256(str(api_key).encode()).hexdigest()[:16]
+
+    with _limiters_lock:
+        if key not in _limiters:
+            buckets = []
+            for count, seconds in limits:
+                if _collection is None:
+                    buckets.append(TokenBucket(count / seconds, count))
+                else:
+                    buckets.append(MongoTokenBucket(
+                        _collection, f"{key}:{count}/{seconds:g}", count / seconds, count
+                    ))
+            _limiters[key] = RateLimiter(buckets)
+        return _limiters[key]
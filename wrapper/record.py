@@ -0,0 +1,115 @@
+"""Compact representation of the records of wrapper/output_format.py.
+
+A page of a harvest holds thousands of records. Their fields are stored in slots instead of a
+dict per record, and the fields of the output format are picked from the responses instead of
+deleting all other keys.
+"""
+
+from collections.abc import MutableMapping
+from typing import Optional
+
+from .output_format import OUTPUT_FORMAT
+
+# The fields of a record. "persisted" is set by functions/slr.py.
+FIELDS = tuple(OUTPUT_FORMAT["records"][0].keys()) + ("persisted",)
+
+_FIELD_SET = frozenset(FIELDS)
+
+def parse_fields(fields: Optional[str], allowed: tuple = FIELDS) -> Optional[tuple]:
+    """Parse a sparse fieldset, e.g. the query string parameter "fields=title,authors".
+
+    Args:
+        fields: Comma separated names of fields or None.
+        allowed: The fields that may be requested.
+
+    Returns:
+        The requested fields in the order of `allowed`, always including "doi", which
+        identifies the records. None if no fields are given, i.e. all fields are wanted.
+
+    Raises:
+        ValueError: When a field is not allowed.
+    """
+    if not fields:
+        return None
+
+    requested = {field.strip() for field in fields.split(",") if field.strip()}
+    unknown = requested.difference(allowed)
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(sorted(unknown))}.")
+    requested.add("doi")
+    return tuple(field for field in allowed if field in requested)
+
+class Record(MutableMapping):
+    """A record as defined in wrapper/output_format.py.
+
+    Records behave like dicts whose keys are restricted to FIELDS. Fields that are not set are
+    missing, like the keys of a dict.
+    """
+
+    __slots__ = FIELDS
+
+    def __init__(self, **fields):
+        """Initialize a record.
+
+        Args:
+            **fields: Values of the fields.
+
+        Raises:
+            KeyError: When a field is not defined in the output format.
+        """
+        for key, value in fields.items():
+            self[key] = value
+
+    @classmethod
+    def from_dict(cls, record: dict, fields: tuple = FIELDS) -> "Record":
+        """Create a record from a dict, keys that are not a field are ignored.
+
+        Args:
+            record: A record of a response, e.g. after renaming its keys.
+            fields: The fields to copy, e.g. as returned by `parse_fields`.
+        """
+        new = cls()
+        for key in fields:
+            if key in record:
+                setattr(new, key, record[key])
+        return new
+
+    def __getitem__(self, key: str):
+        if key not in _FIELD_SET:
+            raise KeyError(key)
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key) from None
+
+    def __setitem__(self, key: str, value):
+        if key not in _FIELD_SET:
+            raise KeyError(f"{key} is not a field of a record.")
+        setattr(self, key, value)
+
+    def __delitem__(self, key: str):
+        if key not in _FIELD_SET:
+            raise KeyError(key)
+        try:
+            delattr(self, key)
+        except AttributeError:
+            raise KeyError(key) from None
+
+    def __iter__(self):
+        return (key for key in FIELDS if hasattr(self, key))
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+    def __repr__(self) -> str:
+        return f"Record({self.to_dict()!r})"
+
+    def to_dict(self) -> dict:
+        """Return the record as it is serialised to JSON."""
+        return {key: getattr(self, key) for key in FIELDS if hasattr(self, key)}
+
+    def to_document(self) -> dict:
+        """Return the record as a document of the results collection, see functions/db/models.py."""
+        document = self.to_dict()
+        document["_id"] = document.get("doi")
+        return document
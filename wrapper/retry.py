@@ -0,0 +1,133 @@
+"""Retry policy for the HTTP requests of the wrappers."""
+
+import copy
+import os
+import random
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Optional
+
+from requests import Response
+
+class RetryPolicy:
+    """Timeouts and exponential backoff with jitter for retrying failed requests.
+
+    The number of attempts is set by the `max_retries` of the wrappers.
+    """
+
+    def __init__(
+            self, backoff_base: float = float(os.getenv("RETRY_BACKOFF_BASE", 0.5)),
+            backoff_max: float = float(os.getenv("RETRY_BACKOFF_MAX", 8)),
+            connect_timeout: float = float(os.getenv("RETRY_CONNECT_TIMEOUT", 3.05)),
+            read_timeout: float = float(os.getenv("RETRY_READ_TIMEOUT", 10)),
+            total_budget: float = float(os.getenv("RETRY_TOTAL_BUDGET", 20)),
+            retry_statuses: tuple = (429, 500, 502, 503, 504), deadline=None,
+            limiter_wait: Optional[float] = None):
+        """Initialize a retry policy. The defaults can be set with environment variables.
+
+        Args:
+            backoff_base: Maximum delay before the first retry in seconds (RETRY_BACKOFF_BASE).
+                It doubles with every retry.
+            backoff_max: Maximum delay before any retry in seconds (RETRY_BACKOFF_MAX).
+            connect_timeout: Timeout for establishing a connection in seconds
+                (RETRY_CONNECT_TIMEOUT).
+            read_timeout: Timeout for receiving data in seconds (RETRY_READ_TIMEOUT).
+            total_budget: Seconds all attempts of a request may take together
+                (RETRY_TOTAL_BUDGET).
+            retry_statuses: HTTP status codes that are retried.
+            deadline: A `deadline.Deadline` that shortens the budget.
+            limiter_wait: Maximum seconds an attempt waits for the rate limiter.
+                Default: `rate_limit.MAX_WAIT`.
+        """
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.total_budget = total_budget
+        self.retry_statuses = retry_statuses
+        self.deadline = deadline
+        self.limiter_wait = limiter_wait
+
+    def with_deadline(self, deadline) -> "RetryPolicy":
+        """Return a copy of this policy whose budget ends at a deadline at the latest.
+
+        Args:
+            deadline: A `deadline.Deadline` or None.
+        """
+        policy = copy.copy(self)
+        policy.deadline = deadline
+        return policy
+
+    def remaining(self, started: float) -> float:
+        """Return the seconds left of the total budget.
+
+        Args:
+            started: `time.monotonic()` of the first attempt.
+        """
+        remaining = self.total_budget - (time.monotonic() - started)
+        if self.deadline is not None:
+            remaining = min(remaining, self.deadline.remaining())
+        return remaining
+
+    def timeout(self, started: float) -> Optional[tuple]:
+        """Return the timeout for the next attempt.
+
+        Args:
+            started: `time.monotonic()` of the first attempt.
+
+        Returns:
+            A (connect timeout, read timeout) tuple as accepted by requests, shortened to the
+            remaining budget. None if the budget is used up.
+        """
+        remaining = self.remaining(started)
+        if remaining <= 0:
+            return None
+        return min(self.connect_timeout, remaining), min(self.read_timeout, remaining)
+
+    def backoff(self, retry: int, response: Optional[Response] = None) -> float:
+        """Return the delay before a retry.
+
+        Args:
+            retry: Number of the retry, starting at 0.
+            response: The failed response. Its Retry-After header is honoured.
+
+        Returns:
+            The delay in seconds.
+        """
+        retry_after = parse_retry_after(response)
+        if retry_after is not None:
+            return retry_after
+
+        # "Full jitter" spreads the retries of concurrent requests.
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** retry))
+
+def parse_retry_after(response: Optional[Response]) -> Optional[float]:
+    """Return the delay requested by the Retry-After header of a response.
+
+    Args:
+        response: A response or None.
+
+    Returns:
+        The delay in seconds or None if there is no valid header.
+    """
+    if response is None:
+        return None
+    value = response.headers.get("Retry-After")
+    if not value:
+        return None
+
+    # Either delay-seconds or an HTTP-date
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        date = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if date.tzinfo is None:
+        date = date.replace(tzinfo=timezone.utc)
+    return max(0.0, (date - datetime.now(timezone.utc)).total_seconds())
+
+DEFAULT_POLICY = RetryPolicy()
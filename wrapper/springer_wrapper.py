@@ -1,15 +1,20 @@
 """A wrapper for the Springer Nature API."""
 
-from copy import deepcopy
+import os
 from typing import Optional
 
 import pycountry
 import requests
 
-from . import utils
-from .output_format import OUTPUT_FORMAT
+from . import circuit_breaker, coalescing, hedging, planner, rate_limit, retry, streaming, utils
+from .query import Filters, compile_get_query, parse_query, translate_fields
+from .deadline import TIMEOUT_ERROR
+from .record import Record
 from .wrapper_interface import WrapperInterface
 
+# Maximum number of years of a year filter that are requested as single years.
+MAX_FILTER_YEARS = 10
+
 class SpringerWrapper(WrapperInterface):
     """A wrapper class for the Springer Nature API."""
 
@@ -33,6 +38,8 @@ class SpringerWrapper(WrapperInterface):
 
         self.__max_retries = 3
 
+        self.__retry_policy = retry.RetryPolicy()
+
     @property
     def endpoint(self) -> str:
         """Return the endpoint used for the query."""
@@ -102,6 +109,11 @@ class SpringerWrapper(WrapperInterface):
 
         return 50
 
+    @property
+    def complete_facets(self) -> bool:
+        """Return whether the API counts the facets over all results."""
+        return True
+
     @property
     def show_num(self) -> int:
         """Return the number of results that the API will return."""
@@ -138,18 +150,49 @@ class SpringerWrapper(WrapperInterface):
 
     @property
     def max_retries(self) -> int:
-        """Return the maximum number of retries the wrapper will do on a timeout."""
+        """Return the maximum number of retries the wrapper will do on a failed request."""
         return self.__max_retries
 
     @max_retries.setter
     def max_retries(self, value: int):
-        """Set maximum number of retries on a timeout.
+        """Set maximum number of retries on a failed request.
 
         Args:
             value: Number of retries that will be set.
         """
         self.__max_retries = value
 
+    @property
+    def retry_policy(self) -> retry.RetryPolicy:
+        """Return the `retry.RetryPolicy` used for the requests."""
+        return self.__retry_policy
+
+    @retry_policy.setter
+    def retry_policy(self, value: retry.RetryPolicy):
+        """Set the retry policy.
+
+        Args:
+            value: The policy for timeouts and backoff between retries.
+        """
+        self.__retry_policy = value
+
+    @property
+    def rate_limits(self) -> [(int, float)]:
+        """Return the quotas of the API as (number of requests, seconds) tuples.
+
+        Can be overridden with the environment variable SPRINGER_RATE_LIMITS, see `rate_limit.parse_limits`.
+        """
+        # Basic plan: 100 requests per minute and 5000 per day
+        return rate_limit.limits_from_env("SPRINGER_RATE_LIMITS", [(100, 60), (5000, 86400)])
+
+    @property
+    def max_query_length(self) -> int:
+        """Return the maximum length of the request url.
+
+        Can be overridden with the environment variable SPRINGER_MAX_QUERY_LENGTH.
+        """
+        return int(os.getenv("SPRINGER_MAX_QUERY_LENGTH", 2000))
+
     @property
     def fields_translate_map(self) -> dict:
         """Return the translate map for the fields field of the input format."""
@@ -157,6 +200,17 @@ class SpringerWrapper(WrapperInterface):
             "all": "", "keywords": "keyword", "title": "title"
         }
 
+    @property
+    def document_types_translate_map(self) -> dict:
+        """Return the translate map for the document types of the filters of the input format.
+
+        The API only distinguishes journals and books.
+        """
+        return {
+            "article": "Journal", "book": "Book", "chapter": "Book",
+            "conference_paper": "Book", "review": "Journal",
+        }
+
     def search_field(self, key: str, value):
         """Set the value for a given search parameter in a manual search.
 
@@ -225,28 +279,54 @@ class SpringerWrapper(WrapperInterface):
         url = self.query_prefix()
         url += "&q="
 
+        # The translation is memoised, only the url prefix changes between pages.
+        canonical = parse_query(query)
+        fields = translate_fields(canonical.fields, self.fields_translate_map)
+        # Empty field name for "all"
+        fields = tuple(field + ":" if field else "" for field in fields)
+
+        search = compile_get_query(canonical, fields, "+", "-", "+OR+")
+        constraints = self.translate_filters(canonical.filters)
+        if constraints:
+            # The constraints apply to the search in all fields.
+            search = "(" + search + ")+" + "+".join(constraints)
+        url += search
+        return url
 
-        # Copy the query since we will modify it.
-        query = deepcopy(query)
+    def translate_filters(self, filters: Filters) -> [str]:
+        """Translate the filters of a query into constraints of the API.
 
+        Closed ranges of up to MAX_FILTER_YEARS years are matched against the publication year,
+        other ranges against the online date.
 
-        # Check if fields were given.
-        if len(query.get("fields", [])) == 0:
-            query["fields"] = list(self.fields_translate_map.keys())[:1]
-            print(f"No search fields specified. Using default {query['fields'][0]}.")
-        # "Translate" the given field names to search in.
-        for i in range(len(query["fields"])):
-            field = query["fields"][i]
-            if field in self.fields_translate_map:
-                query["fields"][i] = self.fields_translate_map.get(field) + ":"
-                # Empty key for "all"
-                if query["fields"][i] == ":":
-                    query["fields"][i] = ""
-            else:
-                raise ValueError(f"Searching against field {field} is not supported.")
+        Args:
+            filters: The filters of a canonical query, see wrapper/query.py.
 
-        url += utils.translate_get_query(query, "+", "-", "+OR+")
-        return url
+        Returns:
+            The constraints, each one is required.
+        """
+        constraints = []
+        if filters.year_from is not None and filters.year_to is not None \
+                and filters.year_to - filters.year_from < MAX_FILTER_YEARS:
+            years = range(filters.year_from, filters.year_to + 1)
+            constraints.append("(" + "+OR+".join(f"year:{year}" for year in years) + ")")
+        else:
+            if filters.year_from is not None:
+                constraints.append(f"onlinedatefrom:{filters.year_from}-01-01")
+            if filters.year_to is not None:
+                constraints.append(f"onlinedateto:{filters.year_to}-12-31")
+
+        if filters.open_access:
+            constraints.append("openaccess:true")
+
+        types = {
+            self.document_types_translate_map[document_type]
+            for document_type in filters.document_types
+        }
+        # Both types are the same as no restriction.
+        if len(types) == 1:
+            constraints.append("type:" + types.pop())
+        return constraints
 
     def start_at(self, value: int):
         """Set the index from which the returned results start.
@@ -267,12 +347,20 @@ class SpringerWrapper(WrapperInterface):
             The formatted response.
         """
         if self.result_format == "json" or self.result_format == "jsonld":
-            # Load into dict
-            response = response.json()
+            # The records are parsed and formatted one at a time.
+            rest = {}
+            records = [
+                self.format_record(record)
+                for record in streaming.iter_items(
+                    response, "records", rest, self.retry_policy.deadline
+                )
+            ]
+            response = rest
 
             # Modify response to fit the defined wrapper output format
             response["dbQuery"] = response.get("query", {})
             response["query"] = query
+            response["records"] = records
             if ("result" in response) and (len(response["result"]) > 0):
                 response["result"] = response.pop("result")[0]
             else:
@@ -280,26 +368,8 @@ class SpringerWrapper(WrapperInterface):
                     "total": -1,
                     "start": -1,
                     "pageLength": -1,
-                    "recordsDisplayed": len(response.get("records", [])),
-                }
-            for record in response.get("records") or []:
-                if ("url" in record) and (len(record["url"]) > 0) and ("value" in record["url"][0]):
-                    record["uri"] = record["url"][0]["value"]
-                authors = []
-                for author in record.get("creators") or []:
-                    authors.append(author["creator"])
-                record["authors"] = authors
-                record["pages"] = {
-                    "first": record.get("startingPage"),
-                    "last": record.get("endingPage"),
+                    "recordsDisplayed": len(records),
                 }
-                if self.collection == "openaccess":
-                    record["openAccess"] = True
-                elif "openaccess" in record:
-                    record["openAccess"] = (record.pop("openaccess") == "true")
-
-                # Delete all undefined fields
-                utils.clean_output(record, OUTPUT_FORMAT["records"][0])
 
             '''
             Convert from springers format to a more usable format.
@@ -350,15 +420,39 @@ class SpringerWrapper(WrapperInterface):
 
             response["facets"] = new_facets
 
-            # Delete all undefined fields
-            utils.clean_output(response)
-
-            return response
+            # Only keep the defined fields
+            return utils.project_output(response)
 
         else:
             print(f"No formatter defined for {self.result_format}. Returning raw response.")
             return response.text
 
+    def format_record(self, record: dict) -> Record:
+        """Return a record of a response formatted as defined in wrapper/output_format.py.
+
+        Args:
+            record: A record of the response. It is modified.
+        """
+        if ("url" in record) and (len(record["url"]) > 0) and ("value" in record["url"][0]):
+            record["uri"] = record["url"][0]["value"]
+        authors = []
+        for author in record.get("creators") or []:
+            authors.append(author["creator"])
+        record["authors"] = authors
+        # The creators have no affiliations, so "countries" is not set. The countries are only
+        # known for a whole response, see the facets.
+        record["pages"] = {
+            "first": record.get("startingPage"),
+            "last": record.get("endingPage"),
+        }
+        if self.collection == "openaccess":
+            record["openAccess"] = True
+        elif "openaccess" in record:
+            record["openAccess"] = (record.pop("openaccess") == "true")
+
+        # Only keep the defined fields
+        return Record.from_dict(record)
+
     def call_api(self, query: Optional[dict] = None, raw: bool = False, dry: bool = False):
         """Make the call to the API.
 
@@ -383,17 +477,57 @@ class SpringerWrapper(WrapperInterface):
 
         if dry:
             return url, None, None
+        if query and not raw and planner.request_length(url) > self.max_query_length:
+            def fits(sub_query: dict) -> bool:
+                return planner.request_length(self.translate_query(sub_query)) \
+                    <= self.max_query_length
+
+            return planner.call_split(
+                self, query, planner.plan(query, fits), self.__start_record, self.show_num
+            )
+        if raw:
+            return self.__request(url, query, raw)
+
+        # Identical requests that are running concurrently share one call to the API.
+        return coalescing.single_flight(
+            coalescing.request_key(url, None, None, self.retry_policy),
+            lambda: self.__request(url, query),
+            type(self).__name__,
+            self.retry_policy.deadline,
+            lambda: utils.invalid_output(query, url.split("&q=")[-1], self.api_key,
+                                         TIMEOUT_ERROR, self.__start_record, self.show_num)
+        )
+
+    def __request(self, url: str, query: Optional[dict], raw: bool = False):
+        """Make the request built by `call_api` and handle errors.
+
+        Args:
+            url: The URL of the request.
+            query: The query the request was built from.
+            raw: Should the raw request.Response of the query be returned?
 
-        # Make the request and handle errors
+        Returns:
+            If raw is False the formatted response is returned else the raw request.Response.
+        """
         invalid = utils.invalid_output(
             query, url.split("&q=")[-1], self.api_key, "", self.__start_record, self.show_num
         )
+        limiter = rate_limit.get_limiter(type(self).__name__, self.api_key, self.rate_limits)
         response = utils.request_error_handling(
-            requests.get, {"url": url}, self.max_retries, invalid
+            requests.get, {"url": url, "stream": streaming.ENABLED}, self.max_retries, invalid,
+            limiter=limiter,
+            policy=self.retry_policy, name=type(self).__name__,
+            breaker=circuit_breaker.get_breaker(type(self).__name__),
+            hedger=hedging.get_hedger(type(self).__name__)
         )
         if response is None:
             print(invalid["error"])
             return invalid
         if raw:
             return response
-        return self.format_response(response, query)
+        try:
+            return self.format_response(response, query)
+        except streaming.ReadError as err:
+            invalid["error"] = str(err)
+            print(invalid["error"])
+            return invalid
@@ -0,0 +1,132 @@
+"""Incremental parsing of the JSON responses of the APIs.
+
+The records of a page are parsed one at a time while the HTTP body is read, so that the raw
+records of a page are never held in memory together with their formatted copies. The parser
+ijson is optional: without it (or with the environment variable STREAM_RESPONSES=0) the body is
+parsed at once and the records are still handed out one at a time.
+
+Streaming costs CPU: every parser event is handled in Python, which takes several times as long
+as parsing the body at once (see benchmarks/bench_response_fields.py). So only bodies of at
+least STREAM_MIN_SIZE bytes, or of unknown length, are streamed.
+"""
+
+import io
+import os
+from typing import Iterator
+
+from requests.exceptions import RequestException
+from urllib3.exceptions import HTTPError
+
+from .deadline import TIMEOUT_ERROR
+
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
+ENABLED = ijson is not None \
+    and os.getenv("STREAM_RESPONSES", "1").lower() not in ("0", "false", "no")
+
+# bodies with a smaller Content-Length are parsed at once
+MIN_SIZE = int(os.getenv("STREAM_MIN_SIZE", 1024 * 1024))
+
+class ReadError(Exception):
+    """The body of a response could not be read to the end."""
+
+def is_streamed(response) -> bool:
+    """Return whether the body of a response can be parsed incrementally.
+
+    Args:
+        response: A requests response. Its body is only read incrementally if the request was
+            made with `stream=ENABLED`, it is not read yet and it has at least MIN_SIZE bytes.
+    """
+    if not ENABLED or not isinstance(getattr(response, "raw", None), io.IOBase) \
+            or getattr(response, "_content", False) is not False:
+        return False
+    try:
+        return int(response.headers["Content-Length"]) >= MIN_SIZE
+    except (KeyError, TypeError, ValueError):
+        # the length is unknown, e.g. for a chunked body
+        return True
+
+def iter_items(response, path: str, rest: dict, deadline=None) -> Iterator:
+    """Yield the items of an array in the JSON body of a response one at a time.
+
+    Args:
+        response: The requests response.
+        path: The keys leading to the array separated by dots, e.g. "search-results.entry".
+        rest: Is filled with the rest of the document, which contains an empty array instead.
+            It is complete when the last item was yielded.
+        deadline: A `deadline.Deadline`. A body that is streamed is not read beyond it.
+
+    Yields:
+        The items of the array. Nothing if the array does not exist.
+
+    Raises:
+        ValueError: When the body is not valid JSON.
+        ReadError: When the connection failed or the deadline passed while the body was
+            streamed. Its message is the error of the output format.
+    """
+    if not is_streamed(response):
+        try:
+            document = response.json()
+        except ValueError:
+            raise
+        # requests raises e.g. ChunkedEncodingError if the body of a stream is cut off.
+        except RequestException as err:
+            if deadline is not None and deadline.expired:
+                raise ReadError(TIMEOUT_ERROR) from err
+            raise ReadError(f"Connection error: The response was cut off: {err}") from err
+        *keys, name = path.split(".")
+        parent = document
+        for key in keys:
+            parent = parent.get(key) if isinstance(parent, dict) else None
+        items = []
+        if isinstance(parent, dict) and isinstance(parent.get(name), list):
+            items, parent[name] = parent[name], []
+        rest.update(document)
+
+        # Drop the reference to every item once it was handed out.
+        items.reverse()
+        while items:
+            yield items.pop()
+        return
+
+    response.raw.decode_content = True
+    item_prefix = path + ".item"
+    builder = ijson.ObjectBuilder()
+    item = None
+    depth = 0
+    try:
+        for prefix, event, value in ijson.parse(response.raw, use_float=True):
+            # The timeouts of the request only limit each read, not the whole body.
+            if depth == 0 and deadline is not None and deadline.expired:
+                raise ReadError(TIMEOUT_ERROR)
+            if depth == 0 and prefix != item_prefix:
+                builder.event(event, value)
+            elif depth == 0 and event not in ("start_map", "start_array"):
+                # an item that is not a container
+                yield value
+            else:
+                if depth == 0:
+                    item = ijson.ObjectBuilder()
+                item.event(event, value)
+                if event in ("start_map", "start_array"):
+                    depth += 1
+                elif event in ("end_map", "end_array"):
+                    depth -= 1
+                if depth == 0:
+                    yield item.value
+                    item = None
+    except ijson.JSONError as err:
+        raise ValueError(f"Invalid JSON in the response: {err}") from err
+    # urllib3 raises e.g. ReadTimeoutError and ProtocolError while the body is read.
+    except (HTTPError, OSError) as err:
+        if deadline is not None and deadline.expired:
+            raise ReadError(TIMEOUT_ERROR) from err
+        raise ReadError(f"Connection error: The response was cut off: {err}") from err
+    finally:
+        response.close()
+
+    if isinstance(getattr(builder, "value", None), dict):
+        rest.update(builder.value)
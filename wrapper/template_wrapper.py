@@ -58,6 +58,11 @@ class TemplateWrapper(WrapperInterface):
         """Return the maximum number of results that the API can return."""
         pass
 
+    @property
+    def min_records(self) -> int:
+        """Return the smallest number of results that the API can return."""
+        return 1
+
     @property
     def show_num(self) -> int:
         """Return the number of results that the API will return."""
@@ -72,6 +77,34 @@ class TemplateWrapper(WrapperInterface):
         """
         pass
 
+    @property
+    def supports_cursor(self) -> bool:
+        """Return whether the wrapper can page through results with a cursor."""
+        return False
+
+    @property
+    def complete_facets(self) -> bool:
+        """Return whether the API counts the facets over all results.
+
+        Otherwise the facets are only counted over the returned records.
+        """
+        return False
+
+    @property
+    def cursor(self) -> Optional[str]:
+        """Return the cursor used for the next request or None if start_at is used."""
+        pass
+
+    @cursor.setter
+    def cursor(self, value: Optional[str]):
+        """Set the cursor used for the next request.
+
+        Args:
+            value: The cursor returned in ["result"]["cursor"] of the previous response,
+                "*" to start from the first result or None to page with start_at.
+        """
+        pass
+
     @property
     def allowed_search_fields(self) -> {str: [str]}:
         """Return all allowed search parameter, value combination.
@@ -82,18 +115,45 @@ class TemplateWrapper(WrapperInterface):
 
     @property
     def max_retries(self) -> int:
-        """Return the maximum number of retries the wrapper will do on a timeout."""
+        """Return the maximum number of retries the wrapper will do on a failed request."""
         pass
 
     @max_retries.setter
     def max_retries(self, value: int):
-        """Set maximum number of retries on a timeout.
+        """Set maximum number of retries on a failed request.
 
         Args:
             value: Number of retries that will be set.
         """
         pass
 
+    @property
+    def retry_policy(self):
+        """Return the `retry.RetryPolicy` used for the requests."""
+        pass
+
+    @retry_policy.setter
+    def retry_policy(self, value):
+        """Set the retry policy.
+
+        Args:
+            value: A `retry.RetryPolicy`.
+        """
+        pass
+
+    @property
+    def rate_limits(self) -> [(int, float)]:
+        """Return the quotas of the API as (number of requests, seconds) tuples."""
+        pass
+
+    @property
+    def max_query_length(self) -> Optional[int]:
+        """Return the maximum length of a request or None if there is no limit.
+
+        Longer queries are split into several requests, see wrapper/planner.py.
+        """
+        return None
+
     @property
     def property_translate_map(self) -> dict:
         """Return the translate map for the fields field of the input format."""
@@ -1,12 +1,17 @@
 """Helper functions useful for all wrapper classes."""
 
 import re
+import time
 from typing import Callable, Optional, Union
 from urllib.parse import quote_plus
 
 from requests import exceptions, Response
 
+from . import circuit_breaker, metrics
+from .deadline import TIMEOUT_ERROR
+from .rate_limit import MAX_WAIT
 from .output_format import OUTPUT_FORMAT
+from .retry import DEFAULT_POLICY, RetryPolicy
 
 def get(nest: Union[dict, list, str], *args, default=None):
     """Get a value in a nested mapping/iterable.
@@ -82,18 +87,29 @@ def build_group(items: [str], match: str, match_pad: str = " ", negater: str = "
     group += ")"
     return group
 
-def clean_output(out: dict, format_dict: dict = OUTPUT_FORMAT):
-    """Delete undefined fields in the return JSON.
+def compile_projection(format_dict: dict) -> Callable[[dict], dict]:
+    """Compile a function that keeps only the fields of a format.
 
     Args:
-        out: The returned JSON.
-        format_dict: Override the output format
+        format_dict: The format, e.g. wrapper/output_format.py.
+
+    Returns:
+        A function that builds a new dict from the defined fields of a dict. The dict passed to
+        it is not modified.
+
+    Examples:
+        >>> compile_projection({"title": "", "doi": ""})({"doi": "10.1/1", "link": []})
+        {'doi': '10.1/1'}
     """
-    # NOTE: list() has to be used to avoid a:
-    # "RuntimeError: dictionary changed size during iteration"
-    for key in list(out.keys()):
-        if key not in format_dict.keys():
-            del out[key]
+    keys = tuple(format_dict)
+
+    def project(out: dict) -> dict:
+        return {key: out[key] for key in keys if key in out}
+
+    return project
+
+# Keeps the fields of wrapper/output_format.py in the output of the wrappers.
+project_output = compile_projection(OUTPUT_FORMAT)
 
 def invalid_output(
         query: dict, db_query: Union[str, dict], api_key: str, error: str, start_record: int,
@@ -128,89 +144,141 @@ def invalid_output(
     return out
 
 def request_error_handling(req_func: Callable[..., Response], req_kwargs: dict, max_retries: int,
-                           invalid: dict) -> Optional[Response]:
+                           invalid: dict, limiter=None, policy: Optional[RetryPolicy] = None,
+                           name: str = "request", breaker=None,
+                           hedger=None) -> Optional[Response]:
     """Make an HTTP request and handle error that possibly occur.
 
+    Timeouts, connection errors and the HTTP status codes of `policy.retry_statuses` are retried
+    with a backoff as long as the time budget of the policy allows it.
+
     Args:
         req_func: The function that makes the HTTP request.
             For example `requests.put`.
         req_kwargs: The arguments that will be unpacked and passed to `req_func`.
+            The timeout is set by the policy.
+        max_retries: Maximum number of retries.
         invalid: A dictionary conforming to wrapper/output_format.py. It will be modified if an
             error occurs ("error" field will be set).
+        limiter: A `rate_limit.RateLimiter`. Every attempt waits for it.
+        policy: The `retry.RetryPolicy`. Default: `retry.DEFAULT_POLICY`.
+            If it has a deadline, no attempt lasts longer.
+        name: Prefix of the metrics, e.g. the name of the wrapper.
+        breaker: A `circuit_breaker.CircuitBreaker`. No request is made while it is open.
+        hedger: A `hedging.Hedger` that duplicates slow attempts.
 
     Returns:
         If no errors occur, the return of `req_func` will be returned. Otherwise `None` will be
         returned and `invalid` modified.
     """
+    if breaker is None:
+        return _request_with_retries(req_func, req_kwargs, max_retries, invalid, limiter, policy,
+                                     name, hedger)[0]
+
+    if not breaker.allow():
+        metrics.increment(name + ".short_circuited")
+        invalid["error"] = f"Circuit open: {name} is unavailable. " \
+            f"Trying again in {breaker.retry_in():.0f} s."
+        return None
+
+    try:
+        response, duration = _request_with_retries(req_func, req_kwargs, max_retries, invalid,
+                                                   limiter, policy, name, hedger)
+    except BaseException:
+        breaker.release()
+        raise
+
+    if response is None and not circuit_breaker.is_failure(invalid["error"]):
+        breaker.release()
+    else:
+        if breaker.record(response is None, duration):
+            metrics.increment(name + ".circuit_opened")
+    return response
+
+def _request_with_retries(req_func: Callable[..., Response], req_kwargs: dict, max_retries: int,
+                          invalid: dict, limiter, policy: Optional[RetryPolicy],
+                          name: str, hedger=None) -> (Optional[Response], float):
+    """Make an HTTP request with retries as described in `request_error_handling`.
+
+    Returns:
+        The response or `None` and the seconds spent on all attempts and the backoff between
+        them. Waiting for the rate limiter is not included, it says nothing about the API.
+    """
+    if policy is None:
+        policy = DEFAULT_POLICY
+    started = time.monotonic()
+    duration = 0.0
+
     for i in range(max_retries + 1):
+        if i > 0:
+            metrics.increment(name + ".retries")
+
+        # don't take a token if the budget is used up already
+        limiter_wait = MAX_WAIT if policy.limiter_wait is None else policy.limiter_wait
+        if limiter is not None and policy.remaining(started) > 0 \
+                and not limiter.acquire(min(limiter_wait, policy.remaining(started))):
+            invalid["error"] = "Rate limit exceeded: Too many requests with this API key."
+            return None, duration
+
+        timeout = policy.timeout(started)
+        if timeout is None:
+            invalid["error"] = _timeout_error(policy)
+            return None, duration
+
+        failed_response = None
+        attempt_started = time.monotonic()
         try:
-            response = req_func(**req_kwargs)
+            if hedger is None:
+                response = req_func(**req_kwargs, timeout=timeout)
+            else:
+                response = hedger.call(req_func, {**req_kwargs, "timeout": timeout}, limiter, name)
+            duration += time.monotonic() - attempt_started
             # Raise an HTTP error if there were any
             response.raise_for_status()
         except exceptions.HTTPError as err:
+            failed_response = err.response
             invalid["error"] = "HTTP error: " + str(err)
-            return None
+            # A streamed response keeps its connection until it is closed. The headers, e.g.
+            # Retry-After, stay readable.
+            if failed_response is not None and failed_response.raw is not None:
+                failed_response.close()
+            if failed_response is None or \
+                    failed_response.status_code not in policy.retry_statuses:
+                return None, duration
+        # Timeout before ConnectionError since ConnectTimeout is both
+        except exceptions.Timeout as err:
+            duration += time.monotonic() - attempt_started
+            invalid["error"] = _timeout_error(policy)
         except exceptions.ConnectionError as err:
+            duration += time.monotonic() - attempt_started
             invalid["error"] = "Connection error: Failed to establish a connection: " \
                 "Name or service not known."
-            return None
-        except exceptions.Timeout as err:
-            if i < max_retries:
-                # Try again
-                continue
-            # Too many failed attempts
-            invalid["error"] = "Connection error: Failed to establish a connection: Timeout."
-            return None
         except exceptions.RequestException as err:
+            duration += time.monotonic() - attempt_started
             invalid["error"] = "Request error: " + str(err)
-            return None
-
-        # request successful
-        break
-    return response
+            return None, duration
+        else:
+            # request successful
+            invalid["error"] = ""
+            return response, duration
 
-def translate_get_query(query: dict, match_pad: str, negater: str, connector: str) -> str:
-    """Translate a GET query.
+        # Wait before trying again if that is possible within the time budget
+        delay = policy.backoff(i, failed_response)
+        if i == max_retries or delay >= policy.remaining(started):
+            return None, duration
+        time.sleep(delay)
+        duration += delay
 
-    Translate a query in format `wrapper/input_format.py` into a string that can
-    be used in the query part of the url of GET requests.
+    return None, duration
 
-    Args:
-        query: The query complying to `wrapper/input_format.py`. This is modified.
-        match_pad: The padding around the match values.
-        negater: The negater used for negating a search group.
-        conn: The connector between the different parameters.
+def _timeout_error(policy: RetryPolicy) -> str:
+    """Return the error of a request that timed out.
 
-    Returns:
-        The translated query.
+    A timeout that was cut short by the deadline does not mean that the API is unhealthy.
     """
-    # Deep copy is necessary here since we url encode the search terms
-    groups = query.get("search_groups", [])
-    for i in range(len(groups)):
-        if groups[i].get("match") == "NOT" and query["match"] == "OR":
-            raise ValueError("Only AND NOT supported.")
-        for j in range(len(groups[i].get("search_terms", []))):
-            term = groups[i].get("search_terms")[j]
-
-            # Enclose search term in quotes if it contains a space and is not
-            # quoted already to prevent splitting.
-            if " " in term:
-                if term[0] != '"':
-                    term = '"' + term
-                if term[-1] != '"':
-                    term += '"'
-
-            # Urlencode search term
-            groups[i].get("search_terms")[j] = quote_plus(term)
-
-        groups[i] = build_group(
-            groups[i].get("search_terms", []), groups[i].get("match"), match_pad, negater
-        )
-    search_terms = build_group(groups, query.get("match"), match_pad, negater)
-    query_str = ""
-    for field in query.get("fields") or []:
-        query_str += field + search_terms + connector
-    return query_str[:-len(connector)]
+    if policy.deadline is not None and policy.deadline.expired:
+        return TIMEOUT_ERROR
+    return "Connection error: Failed to establish a connection: Timeout."
 
 def build_get_query(params: dict, delim: str, connector: str) -> str:
     """Build a manual GET query from set parameters.
@@ -287,6 +355,8 @@ STOP_WORDS = [
     'your', 'yours', 'yourself', 'yourselves',
 ]
 
+NON_WORD_PATTERN = re.compile("[^a-zA-Z0-9 ]+")
+
 def into_keywords_format(keywords: dict) -> list:
     """Convert a dictionary of keyword, counter pairs into a list of dicts.
 
@@ -319,26 +389,23 @@ def from_keywords_format(keywords: list) -> dict:
         keywords_dict[keyword.get("text", "Unknown")] = keyword.get("value", 0)
     return keywords_dict
 
-def titles_to_keywords(titles: str) -> list:
-    """Count words and format that data.
+def count_title_words(titles: str) -> dict:
+    """Count the words in titles that are not stop words.
 
     Args:
-        titles: A string containing all titles concatinated.
+        titles: A string containing one or more titles.
 
     Returns:
-        A list in the format specified in ["facets"]["keywords"] in
-        wrapper.output_format.py
+        A dictionary with the word as key and its counter as value.
     """
-
     # Delete everything except alphanumeric characters, digits and spaces,
     # convert to lowercase and then split on spaces
-    pat = re.compile("[^a-zA-Z0-9 ]+")
-    words = pat.sub("", titles).lower().split(" ")
+    words = NON_WORD_PATTERN.sub("", titles).lower().split(" ")
 
     freqs = {}
     for word in words:
-        # Kick out stop words
-        if word in STOP_WORDS:
+        # Kick out stop words and empty strings from repeated spaces
+        if not word or word in STOP_WORDS:
             continue
         # Add to counter/init if new word
         elif word not in freqs:
@@ -346,8 +413,20 @@ def titles_to_keywords(titles: str) -> list:
         else:
             freqs[word] += 1
 
+    return freqs
+
+def titles_to_keywords(titles: str) -> list:
+    """Count words and format that data.
+
+    Args:
+        titles: A string containing all titles concatinated.
+
+    Returns:
+        A list in the format specified in ["facets"]["keywords"] in
+        wrapper.output_format.py
+    """
     # Convert into right format
-    return into_keywords_format(freqs)
+    return into_keywords_format(count_title_words(titles))
 
 def combine_facets(facets: [dict]):
     """Combine facets.
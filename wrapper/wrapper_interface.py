@@ -1,6 +1,7 @@
 """The interface that every wrapper has to implement."""
 
 import abc
+import copy
 from typing import Optional
 
 def error(name):
@@ -76,6 +77,11 @@ class WrapperInterface(metaclass=abc.ABCMeta):
         """Return the maximum number of results that the API can return."""
         error("max_records")
 
+    @property
+    def min_records(self) -> int:
+        """Return the smallest number of results that the API can return."""
+        return 1
+
     @property
     def show_num(self) -> int:
         """Return the number of results that the API will return."""
@@ -90,6 +96,34 @@ class WrapperInterface(metaclass=abc.ABCMeta):
         """
         error("show_num (setter)")
 
+    @property
+    def supports_cursor(self) -> bool:
+        """Return whether the wrapper can page through results with a cursor."""
+        return False
+
+    @property
+    def complete_facets(self) -> bool:
+        """Return whether the API counts the facets over all results.
+
+        Otherwise the facets are only counted over the returned records.
+        """
+        return False
+
+    @property
+    def cursor(self) -> Optional[str]:
+        """Return the cursor used for the next request or None if start_at is used."""
+        error("cursor")
+
+    @cursor.setter
+    def cursor(self, value: Optional[str]):
+        """Set the cursor used for the next request.
+
+        Args:
+            value: The cursor returned in ["result"]["cursor"] of the previous response,
+                "*" to start from the first result or None to page with start_at.
+        """
+        error("cursor (setter)")
+
     @property
     @abc.abstractmethod
     def allowed_search_fields(self) -> {str: [str]}:
@@ -101,18 +135,45 @@ class WrapperInterface(metaclass=abc.ABCMeta):
 
     @property
     def max_retries(self) -> int:
-        """Return the maximum number of retries the wrapper will do on a timeout."""
+        """Return the maximum number of retries the wrapper will do on a failed request."""
         error("max_retries")
 
     @max_retries.setter
     def max_retries(self, value: int):
-        """Set maximum number of retries on a timeout.
+        """Set maximum number of retries on a failed request.
 
         Args:
             value: Number of retries that will be set.
         """
         error("max_retries (setter)")
 
+    @property
+    def retry_policy(self):
+        """Return the `retry.RetryPolicy` used for the requests."""
+        error("retry_policy")
+
+    @retry_policy.setter
+    def retry_policy(self, value):
+        """Set the retry policy.
+
+        Args:
+            value: A `retry.RetryPolicy`.
+        """
+        error("retry_policy (setter)")
+
+    @property
+    def rate_limits(self) -> [(int, float)]:
+        """Return the quotas of the API as (number of requests, seconds) tuples."""
+        error("rate_limits")
+
+    @property
+    def max_query_length(self) -> Optional[int]:
+        """Return the maximum length of a request or None if there is no limit.
+
+        Longer queries are split into several requests, see wrapper/planner.py.
+        """
+        return None
+
     @property
     def property_translate_map(self) -> dict:
         """Return the translate map for the fields field of the input format."""
@@ -173,3 +234,27 @@ class WrapperInterface(metaclass=abc.ABCMeta):
             If raw is False the formatted response is returned else the raw request.Response.
         """
         error("call_api")
+
+    def count(self, query: dict) -> dict:
+        """Request only the number of results of a query.
+
+        The smallest page is requested and its records are dropped. The start index and page
+        length of the wrapper are not changed.
+
+        Args:
+            query: A dictionary as defined in wrapper/input_format.py.
+
+        Returns:
+            The formatted response without records. The facets are only kept if they are
+            counted over all results, see `complete_facets`.
+        """
+        count_wrapper = copy.copy(self)
+        count_wrapper.start_at(1)
+        count_wrapper.show_num = self.min_records
+        response = count_wrapper.call_api(query)
+
+        response["records"] = []
+        response.setdefault("result", {})["recordsDisplayed"] = "0"
+        if not self.complete_facets:
+            response["facets"] = {"countries": {}, "keywords": []}
+        return response